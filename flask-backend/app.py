@@ -1,20 +1,45 @@
-from flask import Flask, request, jsonify
-from flask_socketio import SocketIO, emit
+import time
+_startup_t0 = time.perf_counter()
+from flask import Flask, Response, request, jsonify
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from socketio import packet as socketio_packet
 from flask_cors import CORS
-import math
+_t_web = time.perf_counter()
 import numpy as np
+_t_numpy = time.perf_counter()
 import os
 import logging
 import threading
-import time
 import random
+import hmac
+import importlib
 from datetime import datetime
 from serial_manager import SerialManager
+import dataset_cache
+from sensor_reading import SensorReading, feature_buffer
+from online_learning import LabeledSampleBuffer, OnlineTrainer, DriftDetector
+from streaming_scaler import StreamingScaler, state_path_for
+from inference_pool import InferencePool
+from sensor_store import SessionDataWriter, backend_from_url, is_session_id
+import export
+from rollups import RollupStore
+from recent_history import RecentHistory
+from numpy_model import NumpyModel
+from model_loader import model_runtime, load_model_file
+from rate_controller import RateController
+from train_pipeline import build_model
+from profiler import SamplingProfiler
+from tracing import Tracer
+from episode_detector import EpisodeDetector
+from client_delivery import ClientDelivery
+_t_modules = time.perf_counter()
 import eventlet
-import tensorflow as tf
+from eventlet import tpool
+# TensorFlow and APScheduler are imported where they are first needed, so
+# the server can bind its port before they are loaded
 
 eventlet.monkey_patch()
-from apscheduler.schedulers.background import BackgroundScheduler
+_t_eventlet = time.perf_counter()
 
 
 
@@ -22,15 +47,43 @@ from apscheduler.schedulers.background import BackgroundScheduler
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Startup: the server is live as soon as it binds; it is ready once the model
+# is loaded and has served a warm-up prediction. 'background' loads the model
+# after the server starts, 'blocking' loads it first (the old behaviour).
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'background')
+model_state = 'pending'  # pending -> loading -> warming -> ready, or unavailable/failed
+# Seconds, measured from the start of this module's imports
+startup_timings = {
+    'imports': {
+        'flask': round(_t_web - _startup_t0, 3),
+        'numpy': round(_t_numpy - _t_web, 3),
+        'app_modules': round(_t_modules - _t_numpy, 3),
+        'eventlet': round(_t_eventlet - _t_modules, 3),
+    },
+    'tensorflow_import': None,
+    'model_load': None,
+    'warmup': None,
+    'server_start': None,
+    'ready': None,
+    'first_prediction': None,
+}
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 CORS(app, origins="*")
+# Verbose Socket.IO/Engine.IO logging (the production launcher turns it off)
+SOCKETIO_DEBUG_LOGS = os.environ.get('SOCKETIO_DEBUG_LOGS', '1') == '1'
+# e.g. redis://localhost:6379/0; lets several worker processes emit to every client
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+# Set by launcher.py in each worker process
+WORKER_INDEX = None
 socketio = SocketIO(
     app, 
     cors_allowed_origins="*", 
     async_mode='eventlet',  # Use eventlet instead of threading
-    logger=True, 
-    engineio_logger=True,
+    message_queue=SOCKETIO_MESSAGE_QUEUE,
+    logger=SOCKETIO_DEBUG_LOGS, 
+    engineio_logger=SOCKETIO_DEBUG_LOGS,
     ping_timeout=60,
     ping_interval=25
 )
@@ -40,156 +93,376 @@ socketio = SocketIO(
 # Global model state and diagnostics
 ml_model = None
 last_model_load_error = None
-# Hardcoded scaler parameters (order: EDA, TEMP, ACC_Mag, BVP)
+model_file_version = None
+# Default scaler parameters until statistics are published with a model (order: EDA, TEMP, ACC_Mag, BVP)
 SCALER_MEAN = np.array([0.0, 0.0, 0.0, 0.0], dtype=np.float32)
 SCALER_STD = np.array([1.0, 1.0, 1.0, 1.0], dtype=np.float32)
 
+# A Keras .h5 model, or a .npz exported by model_export.py (NumpyModel) or
+# converted with tree_model.py (TreeEnsemble)
+MODEL_PATH = os.environ.get('MODEL_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stress_model.h5')
+# 'keras' serves the model with TensorFlow; 'numpy' runs the same weights with
+# NumpyModel, without importing TensorFlow (retraining still uses it).
+# .npz models are always served with NumPy.
+MODEL_RUNTIME = os.environ.get('MODEL_RUNTIME', 'keras')
+# Scaler statistics are versioned together with the model they were trained with
+SCALER_STATE_PATH = state_path_for(MODEL_PATH)
+# 'global' scales every reading with the same statistics, 'device' uses each
+# device's own statistics once enough samples have been seen
+SCALER_SCOPE = os.environ.get('SCALER_SCOPE', 'global')
+scaler = StreamingScaler(SCALER_MEAN, SCALER_STD, scope=SCALER_SCOPE)
+# Held while swapping the served model and its scaler snapshots, and while
+# predict_stress_level picks them up, so a reading never gets one without the other
+model_lock = threading.Lock()
+
+# Preprocessed training data (built by dataset_cache.py)
+DATASET_CACHE_DIR = os.environ.get(
+    'DATASET_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset_cache')
+)
+WESAD_ROOT = os.environ.get('WESAD_ROOT')
+
+# Retraining: 'online' fine-tunes the served model on newly labeled samples,
+# 'full' rebuilds it from scratch on every run
+RETRAIN_MODE = os.environ.get('RETRAIN_MODE', 'online')
+RETRAIN_INTERVAL_MINUTES = int(os.environ.get('RETRAIN_INTERVAL_MINUTES', 30))
+FULL_REBUILD_EVERY = int(os.environ.get('FULL_REBUILD_EVERY', 48))  # online updates between rebuilds
+# Model evaluation in worker processes: 0 runs it in-process, 'auto' uses every core
+INFERENCE_WORKERS = os.environ.get('INFERENCE_WORKERS', '0')
+inference_pool = None
+
+# Created by setup_serial_manager()
+serial_manager = None
+
+# Persistence into session_sensor_data ('postgresql://...' or 'sqlite:///path.db')
+SENSOR_DB_URL = os.environ.get('SENSOR_DB_URL')
+SENSOR_SPOOL_PATH = os.environ.get(
+    'SENSOR_SPOOL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensor_spool.ndjson')
+)
+session_writer = None
+# device_id -> session_id for readings that don't carry their own session_id
+session_bindings = {}
+
+# Multi-resolution history served by /api/history
+rollup_store = RollupStore()
+
+# Last RECENT_HISTORY_SECONDS of payloads per device, sent to clients on connect
+RECENT_HISTORY_SECONDS = int(os.environ.get('RECENT_HISTORY_SECONDS', 60))
+recent_history = RecentHistory(window_seconds=RECENT_HISTORY_SECONDS)
+# Budget (devices x seconds) of the all-device snapshots sent on connect and subscribe
+SNAPSHOT_MAX_DEVICE_SECONDS = float(os.environ.get('SNAPSHOT_MAX_DEVICE_SECONDS', 60))
+
+# Adaptive sampling rates; devices must understand RATE_COMMAND (e.g. 'SET_RATE 10')
+RATE_CONTROL = os.environ.get('RATE_CONTROL', '0') == '1'
+RATE_MIN_HZ = int(os.environ.get('RATE_MIN_HZ', 5))
+RATE_MAX_HZ = int(os.environ.get('RATE_MAX_HZ', 50))
+RATE_DEFAULT_HZ = int(os.environ.get('RATE_DEFAULT_HZ', 25))
+RATE_COMMAND = os.environ.get('RATE_COMMAND', 'SET_RATE {hz}')
+rate_controller = None
+
+# Admin-only endpoints (the profiler) are disabled unless a token is set;
+# requests must send it in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+MAX_PROFILE_SECONDS = 60
+active_profiler = None
+
+# Per-reading latency tracing and per-device loss detection (see tracing.py)
+TRACING = os.environ.get('TRACING', '1') == '1'
+tracer = Tracer() if TRACING else None
+
+# Socket.IO rooms: every client joins 'stream' (per-reading payloads) on
+# connect; 'subscribe' with channels=['episodes'] for episode events only
+STREAM_ROOM = 'stream'
+EPISODES_ROOM = 'episodes'
+CHANNELS = (STREAM_ROOM, EPISODES_ROOM)
+
+# Stream payloads go through a bounded, flow-controlled queue per client
+# (see client_delivery.py); clients may change their settings on 'subscribe'
+DELIVERY_POLICY = os.environ.get('DELIVERY_POLICY', 'drop_oldest')
+DELIVERY_WINDOW = int(os.environ.get('DELIVERY_WINDOW', 32))  # messages in flight per client
+DELIVERY_QUEUE_SIZE = int(os.environ.get('DELIVERY_QUEUE_SIZE', 256))
+DELIVERY_EVICT_SECONDS = float(os.environ.get('DELIVERY_EVICT_SECONDS', 10))
+DELIVERY_MAX_BACKLOG = int(os.environ.get('DELIVERY_MAX_BACKLOG', 2048))  # Engine.IO packets
+DELIVERY_FLUSH_INTERVAL = 0.1
+delivery = None
+
+# Debounced stress episodes per device (see episode_detector.py)
+EPISODE_DETECTION = os.environ.get('EPISODE_DETECTION', '1') == '1'
+EPISODE_TAU = float(os.environ.get('EPISODE_TAU', 5.0))  # smoothing time constant, seconds
+EPISODE_ENTER = float(os.environ.get('EPISODE_ENTER', 0.7))
+EPISODE_EXIT = float(os.environ.get('EPISODE_EXIT', 0.3))
+episode_detector = EpisodeDetector(EPISODE_TAU, EPISODE_ENTER, EPISODE_EXIT) if EPISODE_DETECTION else None
+EPISODE_SWEEP_INTERVAL = 5.0  # seconds between checks for devices that went silent
+
+# device_id -> command for HTTP devices, returned with their next upload
+pending_device_commands = {}
+
+# The state above lives in each process. Under launcher.py these paths (the
+# readings that feed it, the endpoints that read it, and the profiler, which
+# should sample the worker doing the processing) all go to worker 0
+PRIMARY_PATHS = (
+    '/api/sensor-data', '/api/test-data', '/api/sessions/', '/api/history', '/api/devices/',
+    '/api/rate-control', '/api/trace/', '/api/episodes', '/api/storage/', '/api/training/',
+    '/api/serial/', '/api/esp32/', '/api/model/scaler', '/api/delivery/', '/api/admin/profile',
+)
+
+labeled_buffer = LabeledSampleBuffer()
+online_trainer = OnlineTrainer(full_rebuild_every=FULL_REBUILD_EVERY or None)
+drift_detector = DriftDetector()
+
 def scale_features(features):
-	"""Scale features using baked-in StandardScaler parameters.
+	"""Scale features using the scaler published with the served model.
 
 	Expected order: [EDA, TEMP, ACC_Mag, BVP]
 	"""
-	features_arr = np.array(features, dtype=np.float32)
-	return (features_arr - SCALER_MEAN) / SCALER_STD
+	return scaler.published.scale(features)
+
+def _model_file_version():
+    """Version of the saved model; the scaler state is written last when a model is saved"""
+    try:
+        return os.stat(SCALER_STATE_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+def _load_model_file(model_path):
+    """Load a saved model with the configured runtime"""
+    return load_model_file(model_path, MODEL_RUNTIME)
 
-def load_ml_model():
-    """Load the TensorFlow Keras model if available"""
-    global ml_model, last_model_load_error
+def load_ml_model(offload=False):
+    """Load the TensorFlow Keras model if available.
+
+    With ``offload`` the CPU-bound steps (importing TensorFlow, reading the
+    file) run in a real OS thread so the hub keeps serving; everything that
+    logs or takes a lock stays on the hub.
+    """
+    global ml_model, last_model_load_error, model_state, model_file_version
     ml_model = None
     last_model_load_error = None
+    model_state = 'loading'
     try:
-        logger.info(f"TensorFlow version: {tf.__version__}")
+        runtime = model_runtime(MODEL_PATH, MODEL_RUNTIME)
+        if runtime == 'keras':
+            started = time.perf_counter()
+            if offload:
+                tpool.execute(importlib.import_module, 'tensorflow')
+            import tensorflow as tf
+            startup_timings['tensorflow_import'] = round(time.perf_counter() - started, 3)
+            logger.info(f"TensorFlow version: {tf.__version__}")
 
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(current_dir, 'stress_model.h5')
+        model_path = MODEL_PATH
         if os.path.exists(model_path):
             try:
                 size_bytes = os.path.getsize(model_path)
                 logger.info(f"Found model at {model_path} ({size_bytes} bytes), attempting to load...")
             except Exception:
                 logger.info(f"Found model at {model_path}, attempting to load...")
-            ml_model = tf.keras.models.load_model(model_path)
-            ml_model.summary(print_fn=logger.info)  # Log model structure
-            logger.info("✅ TensorFlow model loaded successfully")
+            started = time.perf_counter()
+            model_file_version = _model_file_version()
+            ml_model = tpool.execute(_load_model_file, model_path) if offload else _load_model_file(model_path)
+            if logger.isEnabledFor(logging.DEBUG):
+                ml_model.summary(print_fn=logger.debug)  # Log model structure
+            logger.info(f"✅ Model loaded successfully ({runtime} runtime)")
+            if scaler.load(SCALER_STATE_PATH):
+                logger.info(f"Loaded scaler statistics for model version {scaler.model_version}")
+            else:
+                logger.warning("No scaler statistics found for model, using default scaler parameters")
+            startup_timings['model_load'] = round(time.perf_counter() - started, 3)
             last_model_load_error = None
+            model_state = 'warming'
         else:
             logger.warning(f"⚠️ TensorFlow model not found at {model_path}")
+            model_state = 'unavailable'
     except Exception as e:
         logger.exception(f"❌ Error loading TensorFlow model: {e}")
         ml_model = None
+        model_state = 'failed'
         try:
             last_model_load_error = str(e)
         except Exception:
             last_model_load_error = "Unknown error"
+
+def warm_up_model(offload=True):
+    """Run one prediction so the first real reading doesn't pay for graph building"""
+    global model_state, last_model_load_error
+    if ml_model is None:
+        return
+    try:
+        started = time.perf_counter()
+        input_data = np.zeros((1, 4), dtype=np.float32)
+        if inference_pool is not None:
+            # Workers load in the background; wait for the first one
+            if not inference_pool.wait_ready():
+                raise RuntimeError("no inference worker finished loading the model")
+            inference_pool.predict(input_data)
+        elif offload:
+            tpool.execute(ml_model.predict, input_data, verbose=0)
+        else:
+            ml_model.predict(input_data, verbose=0)
+        startup_timings['warmup'] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {e}")
+        model_state = 'failed'
+        last_model_load_error = f"Warm-up failed: {e}"
+        return
+    last_model_load_error = None
+    model_state = 'ready'
+    startup_timings['ready'] = round(time.perf_counter() - _startup_t0, 3)
+    logger.info(f"Model ready {startup_timings['ready']}s after startup")
+
+def load_model_in_background():
+    """Load and warm up the model without blocking the event loop"""
+    load_ml_model(offload=True)
+    warm_up_model()
+
+def watch_model_file(interval=30):
+    """Reload the model when another process saves a new one.
+
+    Used by launcher workers that don't retrain themselves; only the
+    published scaler statistics are taken over, running ones stay local.
+    """
+    global ml_model, model_file_version
+    while True:
+        version = _model_file_version()
+        if version != model_file_version and os.path.exists(MODEL_PATH):
+            try:
+                model = tpool.execute(_load_model_file, MODEL_PATH)
+                previous = scaler.current()
+                with model_lock:
+                    scaler.load(SCALER_STATE_PATH, running=False)
+                    ml_model = model
+                if inference_pool is not None:
+                    inference_pool.reload(scaler.current(), previous)
+                model_file_version = version
+                logger.info(f"Reloaded model version {scaler.model_version}")
+                if model_state != 'ready':
+                    # A model that failed to load or warm up can recover with the next file
+                    warm_up_model()
+            except Exception as e:
+                # Possibly caught mid-save; retried on the next check
+                logger.warning(f"Model reload failed: {e}")
+        socketio.sleep(interval)
      
 
-def calculate_acceleration_magnitude(acceleration):
-    """Calculate acceleration magnitude from x, y, z components"""
-    x = acceleration.get('x', 0)
-    y = acceleration.get('y', 0)
-    z = acceleration.get('z', 0)
-    magnitude = math.sqrt(x**2 + y**2 + z**2)
-    return magnitude
+def _scaled_input(reading, snapshot):
+    # Scale in place in the reusable buffer (already in model input order)
+    return reading.write_scaled_features(feature_buffer(), snapshot.mean_f, snapshot.inv_std_f)
 
-def predict_stress_level(features):
-    """Predict stress level using the TensorFlow model"""
+def predict_stress_level(reading):
+    """Predict stress level for a SensorReading using the TensorFlow model"""
     global ml_model
 
-    # Incoming order: [bvp, temperature, eda, acc_mag]
-    arranged = [
-        float(features[2]),  # EDA
-        float(features[1]),  # TEMP
-        float(features[3]),  # ACC_Mag
-        float(features[0])   # BVP
-    ]
-    eda, temp, acc_mag, bvp = arranged
+    eda = reading.eda
+    temp = reading.temperature
+    acc_mag = reading.acc_mag
+    bvp = reading.bvp
 
     # ✅ Hard-coded "calm" physiological range
     if 0.5 <= eda <= 5.0 and 32.0 <= temp <= 36.0 and 9.0 <= acc_mag <= 11.5 and 0.2 <= bvp <= 2.5:
         return "Calm"
 
-    if ml_model is None:
+    with model_lock:
+        model = ml_model
+        snapshot = scaler.snapshot_for(reading.device_id)
+
+    if model is None:
         if last_model_load_error:
             logger.warning(f"Prediction requested but model not available. Last load error: {last_model_load_error}")
         return "Model Not Available"
 
     try:
-        # Scale and predict using ML model
-        input_data = scale_features(arranged).reshape(1, -1)
-        prediction = ml_model.predict(input_data, verbose=0)
-        score = float(prediction[0][0]) if hasattr(prediction, '__getitem__') else float(prediction)
+        if inference_pool is not None:
+            # Scaled with the snapshots of the model the picked worker serves
+            score = float(inference_pool.predict(prepare=lambda published: _scaled_input(
+                reading, scaler.snapshot_for(reading.device_id, published)))[0])
+        else:
+            input_data = _scaled_input(reading, snapshot)
+            prediction = model.predict(input_data, verbose=0)
+            score = float(prediction[0][0]) if hasattr(prediction, '__getitem__') else float(prediction)
+        if startup_timings['first_prediction'] is None:
+            startup_timings['first_prediction'] = round(time.perf_counter() - _startup_t0, 3)
         return "Stressed" if score > 0.5 else "Calm"
     except Exception as e:
         logger.error(f"Error making prediction: {e}")
         return "Prediction Error"
 
 
-def process_and_broadcast_data(data, source='http'):
-    """Process sensor data and broadcast via SocketIO"""
+def process_and_broadcast_data(data, source='http', received=None):
+    """Process sensor data and broadcast via SocketIO.
+
+    ``received`` is the perf_counter() time the reading reached the server,
+    if it arrived earlier than this call (e.g. as part of a batch).
+    """
+    started = time.perf_counter()
     try:
-        # Handle different data formats from ESP32 vs HTTP
-        if source == 'serial':
-            # Parse ESP32 serial data (assuming comma-separated values)
-            # Expected format: "bvp,temperature,acc_x,acc_y,acc_z"
-            if isinstance(data, str):
-                values = data.strip().split(',')
-                logger.info(f"Parsed ESP32 data: {values} (count: {len(values)})")
-                
-                # Map values to sensor readings (adjust based on your ESP32 output)
-                if len(values) >= 5:  # We need 5 values: bvp, temp, acc_x, acc_y, acc_z
-                    parsed_data = {
-                        'bvp': float(values[0]) if values[0] != 'No prediction' else 0.0,
-                        'temperature': float(values[1]) if len(values) > 1 else 0.0,
-                        'eda': float(values[2]) if len(values) > 2 else 0.0,  
-                        'acceleration': {
-                            'x': float(values[2]) if len(values) > 2 else 0.0,
-                            'y': float(values[3]) if len(values) > 3 else 0.0,
-                            'z': float(values[4]) if len(values) > 4 else 0.0
-                        }
-                    }
-                else:
-                    logger.warning(f"Insufficient data from ESP32: {values}")
-                    return None
-            else:
-                parsed_data = data
+        # ESP32 serial data may arrive as a CSV line; everything else is a dict
+        if isinstance(data, str):
+            reading = SensorReading.from_csv(data)
+            if reading is None:
+                logger.warning(f"Insufficient data from ESP32: {data!r}")
+                return None
         else:
-            # HTTP data should already be in dict format
-            parsed_data = data
+            reading = SensorReading.from_dict(data)
+        if reading.device_id is None:
+            reading.device_id = source
+        trace = tracer.begin(reading.device_id, data, received or started, started) if tracer else None
 
-        # Handle acceleration magnitude
-        if 'acceleration' in parsed_data and isinstance(parsed_data['acceleration'], dict):
-            acceleration_magnitude = calculate_acceleration_magnitude(parsed_data['acceleration'])
-        else:
-            acceleration_magnitude = parsed_data.get('acceleration_magnitude', 0)
-        
-        # Prepare features for prediction and compute prediction
-        features = [
-            float(parsed_data.get('bvp', 0)),
-            float(parsed_data.get('temperature', 0)),
-            float(parsed_data.get('eda', 0)),
-            float(acceleration_magnitude)
-        ]
-        prediction_label = predict_stress_level(features)
+        scaler.update(reading.device_id, reading.features())
+
+        prediction_label = predict_stress_level(reading)
+        if trace is not None:
+            trace.mark_predicted()
+
+        if rate_controller is not None:
+            rate_controller.observe(reading.device_id, prediction_label)
+        episode_event = None
+        if episode_detector is not None:
+            episode_event = episode_detector.observe(
+                reading.device_id, prediction_label,
+                (reading.temperature, reading.eda, reading.bvp, reading.acc_mag)
+            )
         
-        # Prepare payload for WebSocket emission
-        payload = {
-            'bvp': parsed_data.get('bvp', 0),
-            'temperature': parsed_data.get('temperature', 0),
-            'eda': parsed_data.get('eda', 0),
-            'acceleration_magnitude': round(acceleration_magnitude, 4),
-            'prediction': prediction_label,
-            'timestamp': datetime.now().isoformat(),
-            'source': source  # Track data source (http/serial)
-        }
+        # Prepare payload for WebSocket emission (source tracks http/serial)
+        payload = reading.to_payload(prediction_label, datetime.now().isoformat(), source)
+        if trace is not None:
+            payload['trace'] = trace.to_payload()
         
-        # Emit to all connected clients via WebSocket
-        socketio.emit('stream', payload)
+        session_id = data.get('session_id') if isinstance(data, dict) else None
+        session_id = session_id or session_bindings.get(reading.device_id)
+
+        # Persist to the bound session (batched, never blocks ingestion)
+        if session_writer is not None and session_id:
+            session_writer.submit(session_id, payload['timestamp'], reading.temperature,
+                                  reading.eda, prediction_label, reading.device_id)
+
+        # Update history rollups for the device and its session
+        rollup_keys = [('device', reading.device_id)]
+        if session_id:
+            rollup_keys.append(('session', session_id))
+        now = time.time()
+        rollup_store.add(
+            rollup_keys, now,
+            (reading.temperature, reading.eda, reading.bvp, reading.acc_mag),
+            prediction_label == 'Stressed'
+        )
+
+        # Keep the device's recent history for clients that join later
+        recent_history.add(reading.device_id, now, reading.bvp, reading.temperature,
+                           reading.eda, reading.acc_mag, prediction_label)
+
+        # Emit to the clients subscribed to the full-rate stream
+        _publish_stream(payload)
+        if trace is not None:
+            tracer.finish(trace)
+        if episode_event is not None:
+            socketio.emit(*episode_event, to=EPISODES_ROOM)
         
         # Also emit ESP32 connection status
         if source == 'serial':
             socketio.emit('esp32_status', {'connected': True})
         
-        logger.info(f"Processed and broadcasted sensor data from {source}: {payload}")
+        # Lazy %-formatting: the payload is only rendered when debug logging is on
+        logger.debug("Processed and broadcasted sensor data from %s: %s", source, payload)
         
         return payload
         
@@ -205,12 +478,25 @@ def process_and_broadcast_data(data, source='http'):
             'source': source,
             'error': str(e)
         }
-        socketio.emit('stream', error_payload)
+        _publish_stream(error_payload)
         return None
 
+def _publish_stream(payload):
+    """Queue a stream payload for every subscribed client.
+
+    With a message queue the readings must reach the clients of every
+    worker, so the payload is published through it, and every worker hands
+    it to its own per-client queues (see _deliver_from_queue).
+    """
+    if delivery is not None and not SOCKETIO_MESSAGE_QUEUE:
+        delivery.publish('stream', payload)
+    else:
+        socketio.emit('stream', payload, to=STREAM_ROOM)
+
 @app.route('/api/sensor-data', methods=['POST'])
 def receive_sensor_data():
     """Receive sensor data from ESP32 and process it"""
+    received = time.perf_counter()
     try:
         data = request.get_json()
         if not data:
@@ -223,14 +509,18 @@ def receive_sensor_data():
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
         # Process and broadcast data
-        payload = process_and_broadcast_data(data, source='http')
+        payload = process_and_broadcast_data(data, source='http', received=received)
         
         if payload:
-            return jsonify({
+            response = {
                 'status': 'success',
                 'message': 'Data processed and broadcasted',
                 'data': payload
-            }), 200
+            }
+            command = pending_device_commands.pop(payload['device_id'], None)
+            if command:
+                response['command'] = command
+            return jsonify(response), 200
         else:
             return jsonify({'error': 'Failed to process data'}), 500
             
@@ -238,16 +528,257 @@ def receive_sensor_data():
         logger.error(f"Error processing sensor data: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+# Upper bound on readings per /api/sensor-data/batch request
+MAX_BATCH_READINGS = 5000
+
+@app.route('/api/sensor-data/batch', methods=['POST'])
+def receive_sensor_data_batch():
+    """Receive a batch of readings (e.g. from serial_listener.py) and process them in order"""
+    received = time.perf_counter()
+    try:
+        data = request.get_json(silent=True)
+        readings = data.get('readings') if isinstance(data, dict) else None
+        if not isinstance(readings, list) or not readings:
+            return jsonify({'error': 'Expected a non-empty "readings" list'}), 400
+        if len(readings) > MAX_BATCH_READINGS:
+            return jsonify({'error': f'At most {MAX_BATCH_READINGS} readings per batch'}), 413
+
+        processed = rejected = 0
+        devices = set()
+        required_fields = ['bvp', 'temperature', 'eda']
+        for reading in readings:
+            # Skip malformed readings instead of failing the batch, so the
+            # sender never retries data that can't be processed
+            if not isinstance(reading, dict) or any(field not in reading for field in required_fields):
+                rejected += 1
+                continue
+            payload = process_and_broadcast_data(reading, source='http', received=received)
+            if payload:
+                processed += 1
+                devices.add(payload['device_id'])
+            else:
+                rejected += 1
+
+        response = {
+            'status': 'success',
+            'received': len(readings),
+            'processed': processed,
+            'rejected': rejected
+        }
+        commands = {d: pending_device_commands.pop(d) for d in devices if d in pending_device_commands}
+        if commands:
+            response['commands'] = commands
+        return jsonify(response), 200
+
+    except Exception as e:
+        logger.error(f"Error processing sensor data batch: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (liveness, plus model readiness and startup timings)"""
     return jsonify({
         'status': 'healthy',
+        'live': True,
+        'ready': model_state == 'ready',
+        'model_state': model_state,
         'model_loaded': ml_model is not None,
+        'model_error': last_model_load_error,
         'serial_connected': serial_manager.is_connected() if serial_manager else False,
+        'inference_pool': inference_pool.get_status() if inference_pool else None,
+        'startup': startup_timings,
         'timestamp': datetime.now().isoformat()
     }), 200
 
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until the model is loaded and warmed up"""
+    ready = model_state == 'ready'
+    return jsonify({'ready': ready, 'model_state': model_state, 'model_error': last_model_load_error}), 200 if ready else 503
+
+@app.route('/api/model/scaler', methods=['GET'])
+def scaler_status():
+    """Get published and running scaler statistics"""
+    return jsonify(scaler.get_status()), 200
+
+@app.route('/api/sessions/<session_id>/devices', methods=['POST'])
+def bind_session_device(session_id):
+    """Record a device's readings into a test session"""
+    data = request.get_json() or {}
+    device_id = data.get('device_id')
+    if not device_id:
+        return jsonify({'error': 'device_id required'}), 400
+    if not is_session_id(session_id):
+        return jsonify({'error': 'session_id must be a UUID'}), 400
+
+    session_bindings[device_id] = session_id
+    return jsonify({'status': 'success', 'device_id': device_id, 'session_id': session_id}), 200
+
+@app.route('/api/sessions/<session_id>/devices/<device_id>', methods=['DELETE'])
+def unbind_session_device(session_id, device_id):
+    """Stop recording a device's readings into a test session"""
+    if session_bindings.get(device_id) != session_id:
+        return jsonify({'error': 'Device is not bound to this session'}), 404
+
+    del session_bindings[device_id]
+    if session_id not in session_bindings.values():
+        # No device records into the session any more: keep only its coarse history
+        rollup_store.finish(('session', session_id))
+    return jsonify({'status': 'success'}), 200
+
+def _parse_time(value, default):
+    """Parse an epoch-seconds or ISO 8601 query parameter"""
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """Get a device's or session's history at a resolution fitting the point budget"""
+    try:
+        if request.args.get('session_id'):
+            key = ('session', request.args['session_id'])
+        elif request.args.get('device_id'):
+            key = ('device', request.args['device_id'])
+        else:
+            return jsonify({'error': 'session_id or device_id required'}), 400
+
+        end = _parse_time(request.args.get('end'), time.time())
+        start = _parse_time(request.args.get('start'), end - 3600)
+        max_points = max(3, min(int(request.args.get('max_points', 500)), 5000))
+        if start >= end:
+            return jsonify({'error': 'start must be before end'}), 400
+
+        history = rollup_store.history(key, start, end, max_points)
+        if history is None:
+            return jsonify({'error': 'No data for this device or session'}), 404
+        return jsonify(dict(history, start=start, end=end)), 200
+
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error reading history: {e}")
+        return jsonify({'error': 'Failed to read history'}), 500
+
+@app.route('/api/devices/<device_id>/recent', methods=['GET'])
+def get_recent_history(device_id):
+    """Get a device's recent payloads as one columnar snapshot"""
+    seconds = request.args.get('seconds', type=float)
+    snapshot = recent_history.snapshot(device_id, seconds)
+    if snapshot is None:
+        return jsonify({'error': 'No recent data for this device'}), 404
+    return jsonify(snapshot), 200
+
+@app.route('/api/rate-control', methods=['GET'])
+def rate_control_status():
+    """Get per-device target rates and recent rate decisions"""
+    if not rate_controller:
+        return jsonify({'enabled': False}), 200
+    return jsonify(dict(rate_controller.get_status(), enabled=True)), 200
+
+def _admin_error():
+    """Error response unless the request carries the admin token"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled (set ADMIN_TOKEN)'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    return None
+
+@app.route('/api/admin/profile', methods=['GET'])
+def profile():
+    """Sample all threads and green threads for ``seconds`` and return collapsed stacks"""
+    global active_profiler
+
+    error = _admin_error()
+    if error:
+        return error
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = float(request.args.get('interval_ms', 5))
+    except ValueError:
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    if not 0 < seconds <= MAX_PROFILE_SECONDS or interval_ms < 1:
+        return jsonify({'error': f'Expected 0 < seconds <= {MAX_PROFILE_SECONDS} and interval_ms >= 1'}), 400
+    if active_profiler is not None:
+        return jsonify({'error': 'A profile is already running'}), 409
+
+    try:
+        profiler = SamplingProfiler(interval_ms / 1000.0, mode=request.args.get('mode', 'cpu'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    active_profiler = profiler
+    try:
+        profiler.start(seconds)
+        # Only this request waits; the hub keeps serving while samples are taken
+        socketio.sleep(seconds)
+    finally:
+        profiler.stop()
+        active_profiler = None
+
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    return jsonify(profiler.report()), 200
+
+@app.route('/api/trace/stats', methods=['GET'])
+def trace_stats():
+    """Get stage latency percentiles and per-device sequence gaps/loss"""
+    if tracer is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(dict(tracer.get_stats(), enabled=True)), 200
+
+@app.route('/api/episodes', methods=['GET'])
+def episodes_status():
+    """Get open stress episodes, recently ended ones and each device's stress level"""
+    if episode_detector is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(dict(episode_detector.get_status(), enabled=True)), 200
+
+@app.route('/api/delivery/stats', methods=['GET'])
+def delivery_stats():
+    """Get each client's queue depth, lag, credit and dropped messages"""
+    if delivery is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(dict(delivery.get_status(), enabled=True, worker=WORKER_INDEX)), 200
+
+@app.route('/api/storage/status', methods=['GET'])
+def storage_status():
+    """Get session data writer status"""
+    if not session_writer:
+        return jsonify({'enabled': False}), 200
+    return jsonify(dict(session_writer.get_status(), enabled=True, bindings=session_bindings)), 200
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """Stream a session's or device's recorded readings as NDJSON, Arrow or Parquet"""
+    if not SENSOR_DB_URL:
+        return jsonify({'error': 'Session data persistence is not configured'}), 503
+    session_id = request.args.get('session_id')
+    device_id = request.args.get('device_id')
+    if not session_id and not device_id:
+        return jsonify({'error': 'session_id or device_id is required'}), 400
+
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        export.check_format(fmt)
+        start = export.parse_time(request.args.get('start'))
+        end = export.parse_time(request.args.get('end'))
+        chunk_size = max(100, min(int(request.args.get('chunk_size', export.DEFAULT_CHUNK_SIZE)), 100000))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 501
+
+    filename = f"{session_id or device_id}.{export.EXTENSIONS[fmt]}"
+    chunks = export.iter_export(backend_from_url(SENSOR_DB_URL), fmt, session_id, device_id, start, end, chunk_size)
+    return Response(
+        chunks,
+        mimetype=export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 # Serial configuration endpoints
 @app.route('/api/serial/status', methods=['GET'])
 def serial_status():
@@ -319,6 +850,23 @@ def send_test_data():
         'data': payload
     }), 200
 
+@app.route('/api/training/samples', methods=['POST'])
+def add_training_samples():
+    """Queue newly labeled samples for the next online model update"""
+    try:
+        data = request.get_json()
+        if not data or 'samples' not in data or 'labels' not in data:
+            return jsonify({'error': 'samples and labels required'}), 400
+
+        added = labeled_buffer.add(data['samples'], data['labels'])
+        return jsonify({'status': 'success', 'added': added, 'pending': len(labeled_buffer)}), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error queueing training samples: {e}")
+        return jsonify({'error': 'Failed to queue training samples'}), 500
+
 # Add endpoint to check ESP32 connection status
 @app.route('/api/esp32/status', methods=['GET'])
 def esp32_status():
@@ -339,22 +887,178 @@ def esp32_status():
     return jsonify(status), 200
 
 # SocketIO event handlers
+def _join_channel(channel):
+    join_room(channel)
+    if channel == STREAM_ROOM and delivery is not None:
+        delivery.add(request.sid)
+
+def _leave_channel(channel):
+    leave_room(channel)
+    if channel == STREAM_ROOM and delivery is not None:
+        delivery.remove(request.sid)
+
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
     logger.info('Client connected')
+    _join_channel(STREAM_ROOM)
     emit('status', {'message': 'Connected to Flask backend'})
+    # Give late joiners recent context in one message instead of waiting for readings
+    emit('snapshot', {'devices': recent_history.snapshot_all(max_device_seconds=SNAPSHOT_MAX_DEVICE_SECONDS)})
+
+@socketio.on('subscribe')
+def handle_subscribe(data=None):
+    """Pick the channels to receive and send the recent-history snapshot.
+
+    ``channels`` (e.g. ['episodes']) replaces the current subscriptions;
+    without it the client keeps receiving the stream. ``flow`` changes how
+    the stream is delivered to this client (policy, window, queue_size,
+    acks). The snapshot is for one device (or all devices), and only sent
+    to stream subscribers.
+    """
+    data = data or {}
+    if not isinstance(data, dict):
+        emit('error', {'message': 'subscribe expects an object'})
+        return
+    channels = data.get('channels')
+    if channels is not None:
+        if not isinstance(channels, list) or not all(isinstance(channel, str) for channel in channels):
+            emit('error', {'message': 'channels must be a list of channel names'})
+            return
+        unknown = set(channels) - set(CHANNELS)
+        if unknown:
+            emit('error', {'message': f"Unknown channels: {', '.join(sorted(unknown))}"})
+            return
+        for channel in CHANNELS:
+            (_join_channel if channel in channels else _leave_channel)(channel)
+    flow = data.get('flow')
+    if flow and delivery is not None:
+        if not isinstance(flow, dict):
+            emit('error', {'message': 'flow must be an object'})
+            return
+        settings = {key: flow[key] for key in ('policy', 'window', 'queue_size', 'acks') if key in flow}
+        try:
+            delivery.configure(request.sid, **settings)
+        except ValueError as e:
+            emit('error', {'message': str(e)})
+            return
+        except KeyError:
+            emit('error', {'message': 'Subscribe to the stream channel before setting flow control'})
+            return
+    if channels is not None:
+        if EPISODES_ROOM in channels and episode_detector is not None:
+            emit('episodes', {'active': episode_detector.get_status()['active']})
+        if STREAM_ROOM not in channels:
+            return
+    device_id = data.get('device_id')
+    if device_id:
+        snapshot = recent_history.snapshot(device_id, data.get('seconds'))
+        devices = {device_id: snapshot} if snapshot else {}
+    else:
+        devices = recent_history.snapshot_all(data.get('seconds'), SNAPSHOT_MAX_DEVICE_SECONDS)
+    emit('snapshot', {'devices': devices})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
     logger.info('Client disconnected')
+    if delivery is not None:
+        delivery.remove(request.sid)
+
+@socketio.on('ack')
+def handle_ack(data=None):
+    """Client has processed every stream message up to ``seq`` (flow control with acks)"""
+    seq = data.get('seq') if isinstance(data, dict) else data
+    if delivery is not None and isinstance(seq, int):
+        delivery.ack(request.sid, seq)
 
 @socketio.on('ping')
 def handle_ping():
     """Handle ping from client for connection testing"""
     emit('pong', {'message': 'Connection is alive'})
 
+def _encode_event(event, payload):
+    """Socket.IO packet text for an event, so the payload is JSON-encoded once for all clients"""
+    return socketio.server.packet_class(socketio_packet.EVENT, data=[event, payload]).encode()
+
+def _send_to_client(sid, encoded, seq=None):
+    # Local clients only: the packet goes straight to the client's Engine.IO socket
+    if seq is not None:
+        # seq is a second event argument: '2["stream",{...}]' -> '2["stream",{...},7]'
+        encoded = f"{encoded[:-1]},{seq}]"
+    eio_sid = socketio.server.manager.eio_sid_from_sid(sid, '/')
+    if eio_sid is None:
+        raise KeyError(sid)
+    socketio.server.eio.send(eio_sid, encoded)
+
+def _transport_backlog(sid):
+    """Packets waiting in a client's Engine.IO send queue (0 if unknown)"""
+    try:
+        eio_sid = socketio.server.manager.eio_sid_from_sid(sid, '/')
+        return socketio.server.eio.sockets[eio_sid].queue.qsize()
+    except (KeyError, AttributeError):
+        return 0
+
+def _disconnect_client(sid):
+    socketio.server.disconnect(sid, namespace='/', ignore_queue=True)
+
+def delivery_flush_loop(interval=DELIVERY_FLUSH_INTERVAL):
+    """Send what slow clients' transports have room for and evict stuck clients"""
+    while True:
+        socketio.sleep(interval)
+        try:
+            delivery.flush()
+        except Exception as e:
+            logger.error(f"Client delivery flush failed: {e}")
+
+def episode_sweep_loop(interval=EPISODE_SWEEP_INTERVAL):
+    """End the episodes of devices that stopped sending readings"""
+    while True:
+        socketio.sleep(interval)
+        try:
+            for event in episode_detector.sweep():
+                socketio.emit(*event, to=EPISODES_ROOM)
+        except Exception as e:
+            logger.error(f"Episode sweep failed: {e}")
+
+def _deliver_from_queue(handle_emit):
+    """Wrap the message queue manager's emit handler so queued stream messages go through delivery.
+
+    Every worker, the publishing one included, receives each message from
+    the queue; stream broadcasts are handed to the local ClientDelivery
+    instead of being written to every local client at once.
+    """
+    def handle(message):
+        if message.get('event') == 'stream' and message.get('room') == STREAM_ROOM:
+            delivery.publish('stream', message['data'])
+        else:
+            handle_emit(message)
+    return handle
+
+def setup_client_delivery():
+    """Deliver the stream through per-client flow-controlled queues"""
+    global delivery
+
+    try:
+        delivery = ClientDelivery(
+            _send_to_client,
+            encode=_encode_event,
+            backlog=_transport_backlog,
+            disconnect=_disconnect_client,
+            policy=DELIVERY_POLICY,
+            window=DELIVERY_WINDOW,
+            queue_size=DELIVERY_QUEUE_SIZE,
+            evict_after=DELIVERY_EVICT_SECONDS,
+            max_backlog=DELIVERY_MAX_BACKLOG
+        )
+        socketio.start_background_task(delivery_flush_loop)
+        logger.info(f"Client delivery: {DELIVERY_POLICY}, window {DELIVERY_WINDOW}, queue {DELIVERY_QUEUE_SIZE}")
+        manager = socketio.server.manager
+        if SOCKETIO_MESSAGE_QUEUE and hasattr(manager, '_handle_emit'):
+            manager._handle_emit = _deliver_from_queue(manager._handle_emit)
+    except Exception as e:
+        logger.error(f"Failed to setup client delivery, broadcasting to all clients: {e}")
+
 def setup_serial_manager():
     """Initialize and setup serial manager"""
     global serial_manager
@@ -374,72 +1078,243 @@ def setup_serial_manager():
     except Exception as e:
         logger.error(f"Failed to setup serial manager: {e}")
 
+def setup_inference_pool():
+    """Start the inference worker pool if INFERENCE_WORKERS is configured"""
+    global inference_pool
+
+    if INFERENCE_WORKERS in ('', '0'):
+        return
+    if not os.path.exists(MODEL_PATH):
+        logger.warning("Inference pool not started: no model file to serve")
+        return
+
+    try:
+        workers = None if INFERENCE_WORKERS == 'auto' else int(INFERENCE_WORKERS)
+        pool = InferencePool(MODEL_PATH, workers=workers, runtime=MODEL_RUNTIME)
+        pool.start()
+        inference_pool = pool
+    except Exception as e:
+        logger.error(f"Failed to start inference pool, predicting in-process: {e}")
+
+def _send_device_command(device_id, command):
+    """Send over serial if the device is on our port, otherwise with its next HTTP upload"""
+    if serial_manager is not None and serial_manager.is_connected() and device_id == serial_manager.port:
+        return serial_manager.send_command(command)
+    pending_device_commands[device_id] = command
+    return True
+
+def _pipeline_backlog():
+    """Fraction (0-1) of the busiest pipeline stage's capacity in use"""
+    backlog = 0.0
+    if session_writer is not None:
+        backlog = session_writer.get_status()['pending_batches'] / session_writer.max_pending_batches
+    if inference_pool is not None:
+        status = inference_pool.get_status()
+        backlog = max(backlog, 1.0 - status['idle'] / status['workers'])
+    return backlog
+
+def setup_rate_controller():
+    """Start adaptive sampling-rate control if RATE_CONTROL=1"""
+    global rate_controller
+
+    if not RATE_CONTROL:
+        return
+    try:
+        rate_controller = RateController(
+            _send_device_command,
+            min_hz=RATE_MIN_HZ,
+            max_hz=RATE_MAX_HZ,
+            default_hz=RATE_DEFAULT_HZ,
+            command_template=RATE_COMMAND,
+            backlog_fn=_pipeline_backlog
+        )
+        logger.info(f"Rate control enabled ({RATE_MIN_HZ}-{RATE_MAX_HZ} Hz)")
+    except Exception as e:
+        logger.error(f"Failed to setup rate controller: {e}")
+
+def setup_session_writer():
+    """Start persisting readings into session_sensor_data if SENSOR_DB_URL is set"""
+    global session_writer
+
+    if not SENSOR_DB_URL:
+        logger.info("SENSOR_DB_URL not set, session data will not be persisted")
+        return
+
+    try:
+        writer = SessionDataWriter(backend_from_url(SENSOR_DB_URL), SENSOR_SPOOL_PATH)
+        writer.start()
+        session_writer = writer
+    except Exception as e:
+        logger.error(f"Failed to setup session data writer: {e}")
+
 def get_latest_training_data():
 	"""Return latest labeled sensor data as (X, y).
 
 	X shape: (n_samples, 4) with columns [EDA, TEMP, ACC_Mag, BVP]
 	y shape: (n_samples,) with labels {0,1}
 
-	Replace this stub to fetch from your database or buffer.
+	Reads the preprocessed dataset cache (see dataset_cache.py). When
+	WESAD_ROOT is set, subjects whose source changed are rebuilt first.
+	"""
+	try:
+		if WESAD_ROOT:
+			dataset_cache.build_cache(WESAD_ROOT, DATASET_CACHE_DIR)
+		if dataset_cache.read_manifest(DATASET_CACHE_DIR) is None:
+			return None, None
+		return dataset_cache.load_training_arrays(DATASET_CACHE_DIR)
+	except Exception as e:
+		logger.error(f"Failed to load training data from dataset cache: {e}")
+		return None, None
+
+def _save_and_swap_model(model, scaler_candidate=None):
+	"""Persist a trained model and swap it in as the served model.
+
+	When the model was trained with freshly prepared scaler statistics, they
+	are published in the same step so predictions never mix the two.
 	"""
-	return None, None
+	global ml_model, model_file_version
+	model.save(MODEL_PATH)
+	# The in-memory model is already usable; no need to reload it from disk
+	served = NumpyModel.from_keras(model) if MODEL_RUNTIME == 'numpy' else model
+	previous = scaler.current()
+	with model_lock:
+		if scaler_candidate is not None:
+			scaler.commit(scaler_candidate)
+		ml_model = served
+	if inference_pool is not None:
+		# Old workers keep the old snapshots until their replacements are ready
+		inference_pool.reload(scaler.current(), previous)
+	scaler.save(SCALER_STATE_PATH)
+	model_file_version = _model_file_version()
+	if model_state != 'ready':
+		warm_up_model(offload=False)
+
+def _full_retrain(X_extra=None, y_extra=None):
+	"""Rebuild the model from scratch on all available data."""
+	X_new, y_new = get_latest_training_data()
+	if X_extra is not None:
+		X_new = X_extra if X_new is None else np.concatenate([X_new, X_extra])
+		y_new = y_extra if y_new is None else np.concatenate([y_new, y_extra])
+	if X_new is None or y_new is None:
+		logger.info("Retraining skipped: no new training data available.")
+		return
+
+	np_X = np.array(X_new, dtype=np.float32)
+	np_y = np.array(y_new, dtype=np.float32)
+
+	# Fit the scaler on exactly the data the model is trained on
+	# (order already expected as EDA, TEMP, ACC_Mag, BVP)
+	scaler_candidate = scaler.prepare(np_X)
+	np_X_scaled = scaler_candidate[0].scale(np_X)
+
+	model = build_model(np_X_scaled.shape[1])
+	history = model.fit(np_X_scaled, np_y, epochs=5, batch_size=32, verbose=0)
+
+	_save_and_swap_model(model, scaler_candidate)
+	drift_detector.set_reference(np_X_scaled, history.history['accuracy'][-1])
+	online_trainer.mark_rebuilt()
+	logger.info("Full retraining completed and model hot-swapped.")
+
+def _trainable_model():
+	"""The served model as a Keras model (loaded from disk when serving with NumPy)"""
+	if MODEL_RUNTIME != 'numpy':
+		return ml_model
+	import tensorflow as tf
+	return tf.keras.models.load_model(MODEL_PATH)
 
 def retrain_model():
-	"""Background job to retrain and hot-swap the TensorFlow model."""
-	global ml_model
+	"""Background job to update or retrain and hot-swap the TensorFlow model.
+
+	In 'online' mode the served model is fine-tuned on newly labeled samples,
+	falling back to a full rebuild when drift is detected or a periodic
+	rebuild is due. In 'full' mode every run rebuilds from scratch.
+	"""
+	X_new = y_new = None
 	try:
-		X_new, y_new = get_latest_training_data()
-		if X_new is None or y_new is None:
-			logger.info("Retraining skipped: no new training data available.")
+		if MODEL_PATH.endswith('.npz'):
+			logger.info("Retraining skipped: exported .npz models are trained offline (retrain, then export again)")
+			return
+
+		X_new, y_new = labeled_buffer.drain()
+
+		if RETRAIN_MODE != 'online' or ml_model is None or online_trainer.full_rebuild_due():
+			_full_retrain(X_new, y_new)
 			return
 
-		# Lazy import TensorFlow to avoid hard dependency if unused
-		import tensorflow as tf
-		np_X = np.array(X_new, dtype=np.float32)
-		np_y = np.array(y_new, dtype=np.float32)
-
-		# Ensure correct scaling (order already expected as EDA, TEMP, ACC_Mag, BVP)
-		np_X_scaled = (np_X - SCALER_MEAN) / SCALER_STD
-
-		# Build simple feed-forward network
-		model = tf.keras.models.Sequential([
-			tf.keras.layers.Input(shape=(np_X_scaled.shape[1],)),
-			tf.keras.layers.Dense(64, activation='relu'),
-			tf.keras.layers.BatchNormalization(),
-			tf.keras.layers.Dropout(0.3),
-			tf.keras.layers.Dense(32, activation='relu'),
-			tf.keras.layers.BatchNormalization(),
-			tf.keras.layers.Dropout(0.3),
-			tf.keras.layers.Dense(1, activation='sigmoid')
-		])
-
-		model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-		model.fit(np_X_scaled, np_y, epochs=5, batch_size=32, verbose=0)
-
-		current_dir = os.path.dirname(os.path.abspath(__file__))
-		model_path = os.path.join(current_dir, 'stress_model.h5')
-		model.save(model_path)
-		# Hot-swap
-		ml_model = tf.keras.models.load_model(model_path)
-		logger.info("Retraining completed and model hot-swapped.")
+		if X_new is None:
+			logger.info("Online update skipped: no newly labeled samples.")
+			return
+
+		# Fine-tuning keeps the served model's scaler; it only changes on full rebuilds
+		X_scaled = scaler.published.scale(X_new)
+		needs_rebuild, report = drift_detector.check(ml_model, X_scaled, y_new)
+		logger.info(f"Drift check: {report}")
+		if needs_rebuild:
+			_full_retrain(X_new, y_new)
+			return
+
+		_save_and_swap_model(online_trainer.fine_tune(_trainable_model(), X_scaled, y_new))
+		logger.info("Online update completed and model hot-swapped.")
 	except Exception as e:
 		logger.error(f"Retraining failed: {e}")
+		# Keep the labeled samples for the next run
+		labeled_buffer.requeue(X_new, y_new)
 
-if __name__ == '__main__':
-    # Load ML model on startup
+def preload():
+    """Load the model before the launcher forks workers (no TensorFlow, no threads)"""
     load_ml_model()
-    
+    warm_up_model(offload=False)
+
+def start_background_services(serial=True, retraining=True):
+    """Start everything besides the web server.
+
+    The production launcher runs the serial manager and retraining in one
+    worker only, so a port is never opened twice.
+    """
+    # Start inference workers (if configured); they load the model file themselves
+    setup_inference_pool()
+
+    # The launcher has already loaded the model (see preload)
+    if model_state == 'pending':
+        if STARTUP_MODE == 'blocking':
+            load_ml_model()
+            warm_up_model()
+        else:
+            # Runs once the server is serving
+            socketio.start_background_task(load_model_in_background)
+
+    # Start persisting readings before any arrive
+    setup_session_writer()
+    setup_rate_controller()
+    setup_client_delivery()
+    if episode_detector is not None:
+        socketio.start_background_task(episode_sweep_loop)
+
     # Setup serial manager
-    setup_serial_manager()
+    if serial:
+        setup_serial_manager()
 
     # Start background retraining scheduler (non-blocking)
+    if not retraining:
+        return
     try:
+        from apscheduler.schedulers.background import BackgroundScheduler
         scheduler = BackgroundScheduler()
-        scheduler.add_job(retrain_model, 'interval', minutes=30)
+        scheduler.add_job(retrain_model, 'interval', minutes=RETRAIN_INTERVAL_MINUTES)
         scheduler.start()
-        logger.info("Background retraining scheduler started.")
+        logger.info(f"Background retraining scheduler started ({RETRAIN_MODE} mode, every {RETRAIN_INTERVAL_MINUTES} min).")
     except Exception as e:
         logger.error(f"Failed to start retraining scheduler: {e}")
-    
+
+if __name__ == '__main__':
+    debug = True
+    # In debug mode this module runs twice: in a reloader process that only
+    # restarts the server, and in the server itself (WERKZEUG_RUN_MAIN set).
+    # Only the server starts the inference pool, serial port and other services.
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+
     # Run the Flask-SocketIO server
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    startup_timings['server_start'] = round(time.perf_counter() - _startup_t0, 3)
+    logger.info(f"Server starting {startup_timings['server_start']}s after startup ({STARTUP_MODE} model loading)")
+    socketio.run(app, host='0.0.0.0', port=5000, debug=debug)
\ No newline at end of file
@@ -0,0 +1,71 @@
+import math
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from sensor_reading import SensorReading, feature_buffer
+
+# Micro-benchmark of the per-reading parse -> feature -> scale path.
+# The "legacy" functions reproduce the dict/list based path app.py used before
+# SensorReading, so the two can be compared on the same machine.
+
+SCALER_MEAN = np.array([0.0, 0.0, 0.0, 0.0], dtype=np.float32)
+SCALER_STD = np.array([1.0, 1.0, 1.0, 1.0], dtype=np.float32)
+SCALER_MEAN_F = tuple(float(v) for v in SCALER_MEAN)
+SCALER_INV_STD_F = tuple(1.0 / float(v) for v in SCALER_STD)
+
+SAMPLE = {
+    "bvp": 0.85,
+    "temperature": 36.5,
+    "eda": 0.12,
+    "acceleration": {"x": 0.02, "y": -0.01, "z": 0.98}
+}
+
+
+def legacy_acceleration_magnitude(acceleration):
+    x = acceleration.get('x', 0)
+    y = acceleration.get('y', 0)
+    z = acceleration.get('z', 0)
+    return math.sqrt(x**2 + y**2 + z**2)
+
+
+def legacy_path(data):
+    if 'acceleration' in data and isinstance(data['acceleration'], dict):
+        acc_mag = legacy_acceleration_magnitude(data['acceleration'])
+    else:
+        acc_mag = data.get('acceleration_magnitude', 0)
+    features = [
+        float(data.get('bvp', 0)),
+        float(data.get('temperature', 0)),
+        float(data.get('eda', 0)),
+        float(acc_mag)
+    ]
+    arranged = [float(features[2]), float(features[1]), float(features[3]), float(features[0])]
+    features_arr = np.array(arranged, dtype=np.float32)
+    return ((features_arr - SCALER_MEAN) / SCALER_STD).reshape(1, -1)
+
+
+def current_path(data):
+    reading = SensorReading.from_dict(data)
+    return reading.write_scaled_features(feature_buffer(), SCALER_MEAN_F, SCALER_INV_STD_F)
+
+
+def measure(name, fn, number=200000):
+    per_call = min(timeit.repeat(lambda: fn(SAMPLE), number=number, repeat=5)) / number
+    tracemalloc.start()
+    for _ in range(10000):
+        fn(SAMPLE)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>8}: {per_call * 1e6:7.3f} µs/reading, peak traced memory {peak} bytes")
+    return per_call
+
+
+if __name__ == "__main__":
+    print("🚀 Per-reading feature path micro-benchmark")
+    print("=" * 50)
+    assert np.allclose(legacy_path(SAMPLE), current_path(SAMPLE))
+    legacy = measure("legacy", legacy_path)
+    current = measure("current", current_path)
+    print(f"📊 Speedup: {legacy / current:.2f}x")
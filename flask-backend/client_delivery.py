@@ -0,0 +1,303 @@
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# What happens when a client's queue is full:
+#   drop_oldest  the oldest queued message is dropped
+#   sample_down  as drop_oldest, and the client then gets every 2nd, 4th, ...
+#                message until its queue drains again
+#   disconnect   as drop_oldest, and a client full for ``evict_after`` seconds
+#                is disconnected
+POLICIES = ('drop_oldest', 'sample_down', 'disconnect')
+MAX_STRIDE = 64
+# Sample-down changes its stride at most once per this many seconds
+STRIDE_INTERVAL = 1.0
+MAX_QUEUE_SIZE = 4096
+MAX_WINDOW = 1024
+
+
+class _Client:
+    __slots__ = ('sid', 'policy', 'window', 'queue_size', 'acks', 'queue', 'next_seq', 'acked', 'unacked',
+                 'ack_latency', 'stride', 'offered', 'sent', 'dropped', 'sampled_out', 'full_since',
+                 'stride_changed', 'connected_at', 'sending')
+
+    def __init__(self, sid, policy, window, queue_size, now):
+        self.sid = sid
+        self.policy = policy
+        self.window = window
+        self.queue_size = queue_size
+        self.acks = False
+        self.queue = deque()
+        self.next_seq = 1
+        self.acked = 0
+        self.unacked = deque()
+        self.ack_latency = None
+        self.stride = 1
+        self.offered = 0
+        self.sent = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.full_since = None
+        self.stride_changed = now
+        self.connected_at = now
+        self.sending = False
+
+
+def _check_settings(policy, window, queue_size):
+    if policy is not None and policy not in POLICIES:
+        raise ValueError(f"Unknown policy '{policy}' (expected one of {', '.join(POLICIES)})")
+    if window is not None and not (isinstance(window, int) and 1 <= window <= MAX_WINDOW):
+        raise ValueError(f"window must be an integer from 1 to {MAX_WINDOW}")
+    if queue_size is not None and not (isinstance(queue_size, int) and 1 <= queue_size <= MAX_QUEUE_SIZE):
+        raise ValueError(f"queue_size must be an integer from 1 to {MAX_QUEUE_SIZE}")
+
+
+class ClientDelivery:
+    """Flow-controlled delivery of a high-rate event to each client.
+
+    Every client has a bounded queue. A published message is encoded once
+    with ``encode(event, payload)`` and the result is appended to each
+    queue (shared, not copied), then sent with ``send(sid, message, seq)``
+    while the client has credit: fewer than ``window`` messages in flight.
+
+    - Clients that opt in to acknowledgements get a ``seq`` with each
+      message (None for other clients) and send back the highest ``seq``
+      they have processed; messages sent but not yet acknowledged are in
+      flight.
+    - For other clients, the packets still waiting in their Engine.IO send
+      queue (``backlog(sid)``) are in flight, so a slow network stops the
+      sending as well.
+
+    Messages are taken off a queue under the lock but sent after it is
+    released, one sender per client at a time, so a slow send holds up no
+    other client; messages whose send fails go back to the head of the
+    queue. When a queue is full the client's policy (see POLICIES) decides
+    what to drop. flush() runs periodically: it sends what the transports have
+    room for, restores sampled-down clients and disconnects clients that
+    are full past ``evict_after`` (with the 'disconnect' policy), or whose
+    Engine.IO queue holds more than ``max_backlog`` packets from any
+    source. One slow client therefore only costs its own bounded queue.
+    """
+
+    def __init__(self, send, encode=None, backlog=None, disconnect=None, policy='drop_oldest', window=32,
+                 queue_size=256, evict_after=10.0, max_backlog=2048, history=100):
+        _check_settings(policy, window, queue_size)
+        self.send = send
+        # Without an encoder the message is the (event, payload) pair
+        self.encode = encode or (lambda event, payload: (event, payload))
+        self.backlog = backlog
+        self.disconnect = disconnect
+        self.policy = policy
+        self.window = window
+        self.queue_size = queue_size
+        self.evict_after = evict_after
+        self.max_backlog = max_backlog
+        self.evicted = deque(maxlen=history)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def add(self, sid):
+        """Start delivering to a client with the default settings"""
+        with self._lock:
+            if sid not in self._clients:
+                self._clients[sid] = _Client(sid, self.policy, self.window, self.queue_size, time.monotonic())
+
+    def remove(self, sid):
+        with self._lock:
+            self._clients.pop(sid, None)
+
+    def configure(self, sid, policy=None, window=None, queue_size=None, acks=None):
+        """Change a client's settings; raises ValueError for invalid ones"""
+        _check_settings(policy, window, queue_size)
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                raise KeyError(sid)
+            if policy is not None:
+                client.policy = policy
+                client.stride = 1
+            if window is not None:
+                client.window = window
+            if queue_size is not None:
+                client.queue_size = queue_size
+                while len(client.queue) > queue_size:
+                    client.queue.popleft()
+                    client.dropped += 1
+            if acks is not None and bool(acks) != client.acks:
+                client.acks = bool(acks)
+                # Start counting from here; earlier messages carried no seq
+                client.acked = client.next_seq - 1
+                client.unacked.clear()
+            job = self._take(client, time.monotonic())
+        self._send_all([job])
+
+    def _in_flight(self, client):
+        if client.acks:
+            return client.next_seq - 1 - client.acked
+        return self.backlog(client.sid) if self.backlog is not None else 0
+
+    def _take(self, client, now):
+        """Under the lock: reserve the queued messages the client has credit for.
+
+        Returns (client, [(queued_at, message)], first seq or None), or None
+        if there is nothing to send or another sender is busy with the client.
+        """
+        if client.sending:
+            return None
+        credit = client.window - self._in_flight(client)
+        queue = client.queue
+        if credit <= 0 or not queue:
+            return None
+        messages = [queue.popleft() for _ in range(min(credit, len(queue)))]
+        first_seq = None
+        if client.acks:
+            first_seq = client.next_seq
+            client.next_seq += len(messages)
+            client.unacked.extend((first_seq + i, now) for i in range(len(messages)))
+        client.sending = True
+        if client.full_since is not None and len(queue) <= client.queue_size // 2:
+            client.full_since = None
+        return client, messages, first_seq
+
+    def _send_all(self, jobs):
+        """Outside the lock: send reserved messages; unsent ones go back to the head of their queue"""
+        for job in jobs:
+            if job is None:
+                continue
+            client, messages, first_seq = job
+            sent = 0
+            for _, message in messages:
+                try:
+                    self.send(client.sid, message, None if first_seq is None else first_seq + sent)
+                except Exception as e:
+                    logger.debug(f"Send to client {client.sid} failed: {e}")
+                    break
+                sent += 1
+            with self._lock:
+                client.sending = False
+                client.sent += sent
+                unsent = messages[sent:]
+                if not unsent:
+                    continue
+                if first_seq is not None and client.acks:
+                    # Nothing else assigns seqs while a client is sending
+                    client.next_seq = first_seq + sent
+                    while client.unacked and client.unacked[-1][0] >= client.next_seq:
+                        client.unacked.pop()
+                client.queue.extendleft(reversed(unsent))
+                while len(client.queue) > client.queue_size:
+                    client.queue.pop()
+                    client.dropped += 1
+
+    def _overflow(self, client, now):
+        client.queue.popleft()
+        client.dropped += 1
+        if client.full_since is None:
+            client.full_since = now
+        if (client.policy == 'sample_down' and client.stride < MAX_STRIDE
+                and now - client.stride_changed >= STRIDE_INTERVAL):
+            client.stride *= 2
+            client.stride_changed = now
+            logger.info(f"Client {client.sid} is behind: sending every {client.stride} messages")
+
+    def publish(self, event, payload):
+        """Queue a message for every client and send what their credit allows"""
+        now = time.monotonic()
+        jobs = []
+        with self._lock:
+            if not self._clients:
+                return
+            message = self.encode(event, payload)
+            for client in self._clients.values():
+                client.offered += 1
+                if client.stride > 1 and client.offered % client.stride:
+                    client.sampled_out += 1
+                    continue
+                if len(client.queue) >= client.queue_size:
+                    self._overflow(client, now)
+                client.queue.append((now, message))
+                jobs.append(self._take(client, now))
+        self._send_all(jobs)
+
+    def ack(self, sid, seq):
+        """Record that a client has processed every message up to ``seq``"""
+        now = time.monotonic()
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None or not client.acks:
+                return
+            seq = min(int(seq), client.next_seq - 1)
+            if seq <= client.acked:
+                return
+            client.acked = seq
+            sent_at = None
+            while client.unacked and client.unacked[0][0] <= seq:
+                _, sent_at = client.unacked.popleft()
+            if sent_at is not None:
+                latency = now - sent_at
+                client.ack_latency = latency if client.ack_latency is None else (
+                    0.9 * client.ack_latency + 0.1 * latency)
+            job = self._take(client, now)
+        self._send_all([job])
+
+    def flush(self):
+        """Send queued messages, adjust sampled-down clients and evict stuck ones"""
+        now = time.monotonic()
+        evict = []
+        jobs = []
+        with self._lock:
+            for client in self._clients.values():
+                jobs.append(self._take(client, now))
+                backlog = self.backlog(client.sid) if self.backlog is not None else 0
+                if backlog > self.max_backlog:
+                    evict.append((client, f"{backlog} packets waiting in its transport"))
+                elif (client.policy == 'disconnect' and client.full_since is not None
+                        and now - client.full_since >= self.evict_after):
+                    evict.append((client, f"queue full for {now - client.full_since:.1f}s"))
+                elif client.stride > 1 and not client.queue and now - client.stride_changed >= STRIDE_INTERVAL:
+                    client.stride //= 2
+                    client.stride_changed = now
+            for client, reason in evict:
+                del self._clients[client.sid]
+                self.evicted.append({'sid': client.sid, 'reason': reason, 'time': time.time(),
+                                     'sent': client.sent, 'dropped': client.dropped})
+        self._send_all(jobs)
+        # Outside the lock: disconnecting runs the disconnect handler, which calls remove()
+        for client, reason in evict:
+            logger.warning(f"Disconnecting slow client {client.sid}: {reason}")
+            if self.disconnect is not None:
+                try:
+                    self.disconnect(client.sid)
+                except Exception as e:
+                    logger.error(f"Failed to disconnect client {client.sid}: {e}")
+
+    def get_status(self):
+        """Queue depth, lag, credit and drop counts per client"""
+        now = time.monotonic()
+        with self._lock:
+            clients = {}
+            for sid, client in self._clients.items():
+                clients[sid] = {
+                    'policy': client.policy,
+                    'acks': client.acks,
+                    'window': client.window,
+                    'queue_size': client.queue_size,
+                    'queued': len(client.queue),
+                    'in_flight': self._in_flight(client),
+                    'lag_ms': round((now - client.queue[0][0]) * 1000, 1) if client.queue else 0.0,
+                    'ack_latency_ms': None if client.ack_latency is None else round(client.ack_latency * 1000, 1),
+                    'stride': client.stride,
+                    'sent': client.sent,
+                    'dropped': client.dropped,
+                    'sampled_out': client.sampled_out,
+                    'connected_s': round(now - client.connected_at, 1),
+                }
+            return {
+                'defaults': {'policy': self.policy, 'window': self.window, 'queue_size': self.queue_size,
+                             'evict_after': self.evict_after, 'max_backlog': self.max_backlog},
+                'clients': clients,
+                'evicted': list(self.evicted),
+            }
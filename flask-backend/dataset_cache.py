@@ -0,0 +1,282 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the on-disk layout or the preprocessing itself changes
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Same preprocessing parameters as StressMonitorModel.ipynb
+DEFAULT_SUBJECTS = [f"S{i}" for i in range(2, 18) if i != 12]
+SELECTED_FEATURES = ['EDA', 'TEMP', 'ACC', 'BVP']
+FEATURE_ORDER = ['EDA', 'TEMP', 'ACC_Mag', 'BVP']
+TARGET_LENGTH = 7000
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def subject_source_path(wesad_root, subject):
+    """Path of a subject's raw WESAD pickle"""
+    return os.path.join(wesad_root, subject, f"{subject}.pkl")
+
+
+def preprocess_subject(pkl_path, target_length=TARGET_LENGTH):
+    """Convert one raw WESAD pickle into (X, y) arrays.
+
+    Mirrors the notebook: wrist signals are resampled to ``target_length``,
+    ACC is reduced to its magnitude, and only calm (0) / stressed (1)
+    samples are kept. X columns follow FEATURE_ORDER.
+    """
+    # scipy is only needed when (re)building the cache, not when loading it
+    from scipy.signal import resample
+
+    with open(pkl_path, 'rb') as f:
+        data = pickle.load(f, encoding='latin1')
+
+    signal = data['signal']['wrist']
+    label = data['label']
+
+    feature_arrays = []
+    for feature in SELECTED_FEATURES:
+        values = signal[feature]
+        if feature == 'ACC':
+            values = np.linalg.norm(values, axis=1).reshape(-1, 1)
+        if values.shape[0] != target_length:
+            values = resample(values, target_length)
+        feature_arrays.append(values if values.ndim == 2 else values.reshape(-1, 1))
+    features = np.hstack(feature_arrays)
+
+    label_array = resample(np.asarray(label).reshape(-1, 1), target_length).astype(int).flatten()
+    mask = np.isin(label_array, [1, 2])
+
+    X = features[mask].astype(np.float32)
+    y = np.where(label_array[mask] == 1, 0, 1).astype(np.int8)
+    return X, y
+
+
+def _preprocess_params(target_length):
+    """Parameters that invalidate every cached subject when they change"""
+    return {
+        'format_version': FORMAT_VERSION,
+        'target_length': target_length,
+        'features': FEATURE_ORDER,
+    }
+
+
+def _atomic_save_npy(path, array):
+    """Write an .npy file via a temporary file so readers never see partial data"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _atomic_save_json(path, obj):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(cache_dir):
+    """Return the cache manifest, or None if the cache has not been built"""
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _entry_is_current(entry, source_path, cache_dir):
+    """Check whether a manifest entry still matches its source pickle.
+
+    Size and mtime are compared first so unchanged subjects are never rehashed;
+    the content hash settles it when the cheap check disagrees (e.g. a copy).
+    """
+    if not entry:
+        return False
+    for key in ('X', 'y'):
+        if not os.path.exists(os.path.join(cache_dir, entry['files'][key])):
+            return False
+    stat = os.stat(source_path)
+    if entry['source_size'] == stat.st_size and entry['source_mtime_ns'] == stat.st_mtime_ns:
+        return True
+    return entry['source_sha256'] == file_sha256(source_path)
+
+
+def _build_subject(subject, source_path, cache_dir, target_length):
+    """Preprocess one subject into the cache; returns (subject, manifest entry, error)"""
+    try:
+        X, y = preprocess_subject(source_path, target_length)
+        files = {'X': f"{subject}_X.npy", 'y': f"{subject}_y.npy"}
+        _atomic_save_npy(os.path.join(cache_dir, files['X']), X)
+        _atomic_save_npy(os.path.join(cache_dir, files['y']), y)
+
+        stat = os.stat(source_path)
+        entry = {
+            'files': files,
+            'samples': int(X.shape[0]),
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'source_sha256': file_sha256(source_path),
+            'data_sha256': {key: file_sha256(os.path.join(cache_dir, name)) for key, name in files.items()},
+            'built_at': datetime.now().isoformat(),
+        }
+        return subject, entry, None
+    except Exception as e:
+        return subject, None, str(e)
+
+
+def build_cache(wesad_root, cache_dir, subjects=None, target_length=TARGET_LENGTH, force=False, workers=1):
+    """Preprocess raw WESAD subjects into the on-disk cache.
+
+    Only subjects whose source pickle changed (or that are missing from the
+    cache) are rebuilt, in up to ``workers`` processes (each subject is
+    independent). Returns the updated manifest.
+    """
+    subjects = subjects or DEFAULT_SUBJECTS
+    os.makedirs(cache_dir, exist_ok=True)
+
+    params = _preprocess_params(target_length)
+    manifest = read_manifest(cache_dir)
+    if force or manifest is None or manifest.get('params') != params:
+        if manifest is not None:
+            logger.info("Dataset cache parameters changed, rebuilding all subjects")
+        manifest = {'params': params, 'subjects': {}}
+
+    stale = []
+    for subject in subjects:
+        source_path = subject_source_path(wesad_root, subject)
+        if not os.path.exists(source_path):
+            logger.warning(f"{subject}: source not found at {source_path}, skipping")
+            continue
+
+        entry = manifest['subjects'].get(subject)
+        try:
+            if _entry_is_current(entry, source_path, cache_dir):
+                # Refresh the cheap fingerprint so the next run skips hashing
+                stat = os.stat(source_path)
+                entry['source_size'] = stat.st_size
+                entry['source_mtime_ns'] = stat.st_mtime_ns
+                continue
+        except Exception as e:
+            logger.error(f"{subject}: failed to check cached entry: {e}")
+        stale.append((subject, source_path))
+
+    rebuilt = []
+
+    def record(results):
+        for subject, entry, error in results:
+            if error:
+                logger.error(f"{subject}: failed to preprocess: {error}")
+                continue
+            manifest['subjects'][subject] = entry
+            rebuilt.append(subject)
+            logger.info(f"{subject}: cached {entry['samples']} samples")
+
+    jobs = [(subject, source_path, cache_dir, target_length) for subject, source_path in stale]
+    workers = max(1, min(workers, len(jobs)))
+    if workers > 1:
+        # spawn: the caller may be a threaded server
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            record(executor.map(_build_subject, *zip(*jobs)))
+    else:
+        record(_build_subject(*job) for job in jobs)
+
+    manifest['updated_at'] = datetime.now().isoformat()
+    _atomic_save_json(os.path.join(cache_dir, MANIFEST_NAME), manifest)
+    logger.info(f"Dataset cache ready at {cache_dir} ({len(rebuilt)} subject(s) rebuilt)")
+    return manifest
+
+
+def load_cache(cache_dir, subjects=None, mmap=True):
+    """Return {subject: (X, y)} from the cache, memory-mapped by default"""
+    manifest = read_manifest(cache_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No dataset cache manifest in {cache_dir}")
+    if manifest.get('params', {}).get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Dataset cache in {cache_dir} uses an unsupported format version")
+
+    mmap_mode = 'r' if mmap else None
+    result = {}
+    for subject, entry in manifest['subjects'].items():
+        if subjects and subject not in subjects:
+            continue
+        X = np.load(os.path.join(cache_dir, entry['files']['X']), mmap_mode=mmap_mode)
+        y = np.load(os.path.join(cache_dir, entry['files']['y']), mmap_mode=mmap_mode)
+        result[subject] = (X, y)
+    return result
+
+
+def load_training_arrays(cache_dir, subjects=None):
+    """Return stacked (X, y) for all cached subjects, or (None, None) if empty"""
+    per_subject = load_cache(cache_dir, subjects)
+    if not per_subject:
+        return None, None
+    X = np.concatenate([X for X, _ in per_subject.values()])
+    y = np.concatenate([y for _, y in per_subject.values()])
+    return X, y
+
+
+def verify_cache(cache_dir):
+    """Recompute data hashes and return the subjects whose arrays are corrupt"""
+    manifest = read_manifest(cache_dir) or {'subjects': {}}
+    corrupt = []
+    for subject, entry in manifest['subjects'].items():
+        for key, name in entry['files'].items():
+            path = os.path.join(cache_dir, name)
+            if not os.path.exists(path) or file_sha256(path) != entry['data_sha256'][key]:
+                corrupt.append(subject)
+                break
+    return corrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the preprocessed WESAD dataset cache")
+    parser.add_argument('wesad_root', nargs='?',
+                        help="Root directory of the raw WESAD dataset (not needed with --verify)")
+    parser.add_argument('cache_dir', nargs='?', help="Directory to write the cache into")
+    parser.add_argument('--subjects', nargs='*', help="Subjects to process (default: all)")
+    parser.add_argument('--target-length', type=int, default=TARGET_LENGTH)
+    parser.add_argument('--force', action='store_true', help="Rebuild every subject")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Subjects preprocessed in parallel (default: one per CPU)")
+    parser.add_argument('--verify', action='store_true', help="Check cached arrays against their hashes")
+    args = parser.parse_args()
+    if args.cache_dir is None:
+        # A single path is the cache, which is all --verify reads
+        if not args.verify or args.wesad_root is None:
+            parser.error("wesad_root and cache_dir are required unless --verify is given")
+        args.wesad_root, args.cache_dir = None, args.wesad_root
+
+    if args.verify:
+        corrupt = verify_cache(args.cache_dir)
+        print(f"Corrupt subjects: {corrupt}" if corrupt else "Dataset cache OK")
+        return
+
+    manifest = build_cache(args.wesad_root, args.cache_dir, args.subjects, args.target_length, args.force,
+                           args.workers)
+    total = sum(entry['samples'] for entry in manifest['subjects'].values())
+    print(f"Cached {len(manifest['subjects'])} subjects, {total} samples")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
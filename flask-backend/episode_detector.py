@@ -0,0 +1,184 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Signals summarized per episode, in the order observe() receives them
+SIGNALS = ('temperature', 'eda', 'bvp', 'acc_mag')
+# Labels that say something about the subject; anything else (model missing,
+# prediction error) is ignored, as in rate_controller.py
+STATE_LABELS = ('Calm', 'Stressed')
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+class _DeviceEpisodes:
+    """Smoothed stress level and the open (or candidate) episode of one device"""
+
+    __slots__ = ('level', 'last_seen', 'active', 'onset', 'confirmed', 'last_stressed',
+                 'readings', 'stressed', 'sums', 'peaks', 'peak_level')
+
+    def __init__(self, now):
+        self.level = 0.0
+        self.last_seen = now
+        self.active = False
+        self.clear()
+
+    def clear(self):
+        self.onset = None
+        self.confirmed = None
+        self.last_stressed = None
+        self.readings = 0
+        self.stressed = 0
+        self.sums = [0.0] * len(SIGNALS)
+        self.peaks = [-math.inf] * len(SIGNALS)
+        self.peak_level = 0.0
+
+    def accumulate(self, stressed, values):
+        self.readings += 1
+        if stressed:
+            self.stressed += 1
+        sums = self.sums
+        peaks = self.peaks
+        for i, value in enumerate(values):
+            sums[i] += value
+            if value > peaks[i]:
+                peaks[i] = value
+        if self.level > self.peak_level:
+            self.peak_level = self.level
+
+
+class EpisodeDetector:
+    """Turns per-reading Calm/Stressed labels into stress episodes per device.
+
+    Each device keeps an exponentially smoothed stress level: the Stressed
+    fraction of roughly the last ``tau`` seconds, weighted by the time
+    between readings so it means the same at any sampling rate. An episode
+    starts once the level reaches ``enter`` and ends once it falls to
+    ``exit``; the gap between the two thresholds keeps a flickering label
+    from opening and closing episodes. An episode is dated from when the
+    level rose past ``exit`` (a rise that falls back without reaching
+    ``enter`` is dropped) to its last Stressed reading, and its statistics
+    cover the same readings. A device silent for ``max_gap`` seconds has
+    its episode closed by sweep(), which the app runs periodically, or at
+    its next reading, whichever comes first.
+
+    Per reading the work and memory are O(1): the level, the episode's
+    counts and the running sum and peak of each signal.
+    """
+
+    def __init__(self, tau=5.0, enter=0.7, exit=0.3, max_gap=30.0, history=100):
+        if not 0 < exit < enter < 1:
+            raise ValueError("Expected 0 < exit < enter < 1")
+        self.tau = tau
+        self.enter = enter
+        self.exit = exit
+        self.max_gap = max_gap
+        self.recent = deque(maxlen=history)
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def _summary(self, device_id, state):
+        readings = state.readings or 1
+        return {
+            'device_id': device_id,
+            'episode_id': f"{device_id}:{int(state.onset * 1000)}",
+            'started_at': _iso(state.onset),
+            'readings': state.readings,
+            'stressed_fraction': round(state.stressed / readings, 3),
+            'peak_level': round(state.peak_level, 3),
+            'mean': {name: round(total / readings, 4) for name, total in zip(SIGNALS, state.sums)},
+            'max': {name: round(peak, 4) for name, peak in zip(SIGNALS, state.peaks)},
+        }
+
+    def _end(self, device_id, state, reason):
+        event = self._summary(device_id, state)
+        event['ended_at'] = _iso(state.last_stressed)
+        event['duration_s'] = round(state.last_stressed - state.onset, 3)
+        event['reason'] = reason
+        state.active = False
+        state.clear()
+        self.recent.append(event)
+        logger.info(f"Device {device_id}: stress episode ended after {event['duration_s']}s ({reason})")
+        return 'episode_end', event
+
+    def observe(self, device_id, label, values, now=None):
+        """Record one prediction; returns ('episode_start' | 'episode_end', event) or None.
+
+        ``values`` are the reading's (temperature, eda, bvp, acc_mag).
+        """
+        if label not in STATE_LABELS:
+            return None
+        now = time.time() if now is None else now
+        stressed = label == 'Stressed'
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = _DeviceEpisodes(now)
+            dt = now - state.last_seen
+            state.last_seen = now
+            if dt > self.max_gap:
+                # The device went away; whatever it was doing then is over
+                event = self._end(device_id, state, 'gap') if state.active else None
+                state.level = 0.0
+                state.clear()
+                if event is not None:
+                    return event
+                dt = 0.0
+
+            if dt > 0:
+                alpha = 1.0 - math.exp(-dt / self.tau)
+                state.level += alpha * ((1.0 if stressed else 0.0) - state.level)
+
+            if not state.active:
+                if state.level <= self.exit:
+                    # A rise that fell back before reaching ``enter`` was noise
+                    if state.onset is not None:
+                        state.clear()
+                    return None
+                if state.onset is None:
+                    state.onset = now
+
+            if stressed:
+                state.last_stressed = now
+            state.accumulate(stressed, values)
+
+            if state.active:
+                if state.level <= self.exit:
+                    return self._end(device_id, state, 'recovered')
+            elif state.level >= self.enter:
+                state.active = True
+                state.confirmed = now
+                event = self._summary(device_id, state)
+                event['confirmed_at'] = _iso(now)
+                logger.info(f"Device {device_id}: stress episode started")
+                return 'episode_start', event
+        return None
+
+    def sweep(self, now=None):
+        """End the episodes of devices silent for over ``max_gap`` seconds and forget those devices.
+
+        Returns the ('episode_end', event) pairs.
+        """
+        now = time.time() if now is None else now
+        events = []
+        with self._lock:
+            for device_id in [k for k, state in self._devices.items() if now - state.last_seen > self.max_gap]:
+                state = self._devices.pop(device_id)
+                if state.active:
+                    events.append(self._end(device_id, state, 'gap'))
+        return events
+
+    def get_status(self):
+        """Open episodes (summary so far) and the most recent ended ones"""
+        with self._lock:
+            active = [dict(self._summary(device_id, state), confirmed_at=_iso(state.confirmed))
+                      for device_id, state in self._devices.items() if state.active]
+            levels = {device_id: round(state.level, 3) for device_id, state in self._devices.items()}
+            return {'active': active, 'recent': list(self.recent), 'levels': levels}
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import argparse
+import logging
+from datetime import datetime
+
+from sensor_store import COLUMNS, backend_from_url
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Database fetches run in eventlet's OS thread pool so a long export
+    # never blocks the hub between chunks
+    from eventlet import tpool as _tpool
+except ImportError:
+    _tpool = None
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+EXTENSIONS = {'ndjson': 'ndjson', 'arrow': 'arrows', 'parquet': 'parquet'}
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def _run(fn, *args):
+    if _tpool is not None:
+        return _tpool.execute(fn, *args)
+    return fn(*args)
+
+
+def _next_chunk(chunks):
+    return next(chunks, None)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise RuntimeError("pyarrow is required for Arrow and Parquet exports (pip install pyarrow)")
+
+
+def check_format(fmt):
+    """Raise ValueError/RuntimeError if ``fmt`` cannot be exported"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}' (expected one of {', '.join(FORMATS)})")
+    if fmt != 'ndjson':
+        _import_pyarrow()
+
+
+def _arrow_schema(pa):
+    return pa.schema([
+        ('session_id', pa.string()),
+        ('timestamp', pa.string()),
+        ('temperature', pa.float64()),
+        ('gsr', pa.float64()),
+        ('prediction', pa.string()),
+        ('device_id', pa.string()),
+    ])
+
+
+def _record_batch(pa, schema, rows):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+class _DrainSink:
+    """Write-only file object whose contents are handed out as they are produced"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_export(backend, fmt='ndjson', session_id=None, device_id=None, start=None, end=None,
+                chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield an export of session_sensor_data as byte chunks.
+
+    Rows are read ``chunk_size`` at a time and each chunk is encoded and
+    handed out before the next is fetched (one Arrow record batch or one
+    Parquet row group per chunk), so memory does not grow with the range.
+    """
+    check_format(fmt)
+    conn = _run(backend.connect)
+    try:
+        chunks = backend.iter_rows(conn, session_id, device_id, start, end, chunk_size)
+        if fmt == 'ndjson':
+            while True:
+                rows = _run(_next_chunk, chunks)
+                if rows is None:
+                    break
+                yield ''.join(json.dumps(dict(zip(COLUMNS, row))) + '\n' for row in rows).encode()
+            return
+
+        pa = _import_pyarrow()
+        schema = _arrow_schema(pa)
+        sink = _DrainSink()
+        if fmt == 'arrow':
+            writer = pa.ipc.new_stream(sink, schema)
+        else:
+            writer = pa.parquet.ParquetWriter(sink, schema, compression='zstd')
+        while True:
+            rows = _run(_next_chunk, chunks)
+            if rows is None:
+                break
+            batch = _record_batch(pa, schema, rows)
+            if fmt == 'arrow':
+                writer.write_batch(batch)
+            else:
+                writer.write_table(pa.Table.from_batches([batch]))
+            data = sink.drain()
+            if data:
+                yield data
+        writer.close()
+        yield sink.drain()
+    finally:
+        conn.close()
+
+
+def read_export(path):
+    """Load an export file into a dict of NumPy arrays keyed by column"""
+    import numpy as np
+
+    if path.endswith('.ndjson'):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return {name: np.array([row[name] for row in rows]) for name in COLUMNS}
+
+    pa = _import_pyarrow()
+    if path.endswith('.parquet'):
+        table = pa.parquet.read_table(path)
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_stream(source).read_all()
+    return {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+
+
+def parse_time(value):
+    """Parse an epoch-seconds or ISO 8601 bound into a datetime (None passes through)"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export recorded sensor data from session_sensor_data")
+    parser.add_argument('--db', default=os.environ.get('SENSOR_DB_URL'),
+                        help="postgresql://... or sqlite:///path.db (default: $SENSOR_DB_URL)")
+    parser.add_argument('--session-id')
+    parser.add_argument('--device-id')
+    parser.add_argument('--start', help="Epoch seconds or ISO 8601")
+    parser.add_argument('--end', help="Epoch seconds or ISO 8601")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='parquet')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('-o', '--output', help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    if not args.db:
+        parser.error("no database given (--db or SENSOR_DB_URL)")
+
+    chunks = iter_export(
+        backend_from_url(args.db), args.format, args.session_id, args.device_id,
+        parse_time(args.start), parse_time(args.end), args.chunk_size
+    )
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        written = 0
+        for data in chunks:
+            out.write(data)
+            written += len(data)
+    finally:
+        if args.output:
+            out.close()
+    logger.info(f"Exported {written} bytes as {args.format}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
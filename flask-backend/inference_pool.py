@@ -0,0 +1,301 @@
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+import subprocess
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+from sensor_reading import NUM_FEATURES
+
+logger = logging.getLogger(__name__)
+
+try:
+    from eventlet.hubs import trampoline as _green_wait
+except ImportError:
+    _green_wait = None
+
+# Upper bound on rows per request; sizes each worker's shared-memory slot
+DEFAULT_MAX_BATCH = 256
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inference_worker.py')
+
+
+class _Worker:
+    """Parent-side handle for one inference process and its shared-memory slot"""
+
+    def __init__(self, index, model_path, runtime, max_batch, generation=0, context=None):
+        self.index = index
+        self.max_batch = max_batch
+        size = max_batch * NUM_FEATURES * 4 + max_batch * 4
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.inputs = np.ndarray((max_batch, NUM_FEATURES), dtype=np.float32, buffer=self.shm.buf)
+        self.outputs = np.ndarray((max_batch,), dtype=np.float32, buffer=self.shm.buf,
+                                  offset=self.inputs.nbytes)
+        # Plain OS pipes as the worker's stdin/stdout (not eventlet's green sockets)
+        request_read, request_write = os.pipe()
+        reply_read, reply_write = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, WORKER_SCRIPT, model_path, self.shm.name, str(max_batch), str(NUM_FEATURES),
+                 '--runtime', runtime],
+                stdin=request_read, stdout=reply_write
+            )
+        except Exception:
+            for fd in (request_read, request_write, reply_read, reply_write):
+                os.close(fd)
+            del self.inputs, self.outputs
+            self.shm.close()
+            self.shm.unlink()
+            raise
+        os.close(request_read)
+        os.close(reply_write)
+        self.requests = Connection(request_write, readable=False)
+        self.replies = Connection(reply_read, writable=False)
+        self.ready = False
+        self.retired = False
+        self.generation = generation
+        # Whatever the caller tied to the model this worker serves (see reload)
+        self.context = context
+
+    def close(self):
+        try:
+            self.requests.send(None)
+        except Exception:
+            pass
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            self.process.wait()
+        self.requests.close()
+        self.replies.close()
+        del self.inputs, self.outputs
+        self.shm.close()
+        self.shm.unlink()
+
+
+class InferencePool:
+    """Pool of model-serving worker processes.
+
+    Each worker loads its own copy of the model, so TensorFlow runs outside
+    the web process: predictions neither hold the GIL nor block the eventlet
+    hub, and a crashing worker is restarted without taking the server down.
+    Requests are dispatched to whichever worker is idle. Workers only join
+    the pool once their model has loaded; starting, replacing crashed
+    workers and reload() all load in the background.
+    """
+
+    def __init__(self, model_path, workers=None, max_batch=DEFAULT_MAX_BATCH, timeout=10.0, runtime='keras',
+                 load_timeout=300.0):
+        if os.name != 'posix':
+            raise RuntimeError("Inference workers need a POSIX system")
+        self.model_path = model_path
+        # Passed to model_loader.load_model_file in the workers
+        self.runtime = runtime
+        self.num_workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self._slots = [None] * self.num_workers
+        self._idle = queue.Queue()
+        self._any_ready = threading.Event()
+        self.restarts = 0
+        self.failed_loads = 0
+        # Bumped by reload(); each slot is replaced once its new worker is ready
+        self.generation = 0
+        self.context = None
+
+    def start(self, context=None):
+        """Start all worker processes; they join the pool as their models load"""
+        self.context = context
+        self._in_background(self._replace_all, self.generation)
+        logger.info(f"Inference pool starting {self.num_workers} worker(s)")
+
+    def stop(self):
+        self.generation += 1  # Stops any replacement still in progress
+        for worker in self._slots:
+            if worker is not None:
+                worker.retired = True
+                worker.close()
+        self._slots = [None] * self.num_workers
+        logger.info("Inference pool stopped")
+
+    def wait_ready(self, timeout=None):
+        """Wait until at least one worker serves; returns False on timeout"""
+        return self._any_ready.wait(self.load_timeout if timeout is None else timeout)
+
+    def _in_background(self, target, *args):
+        # A green thread under eventlet (app.py monkey-patches threading)
+        threading.Thread(target=target, args=args, daemon=True).start()
+
+    def _wait_result(self, worker, timeout=None):
+        """Wait for ``worker`` to reply, yielding to the eventlet hub meanwhile"""
+        timeout = self.timeout if timeout is None else timeout
+        if _green_wait is not None:
+            # Only this green thread waits; the reply itself is a few bytes,
+            # so the recv below returns immediately once the pipe is readable
+            _green_wait(worker.replies.fileno(), read=True, timeout=timeout, timeout_exc=TimeoutError)
+        elif not worker.replies.poll(timeout):
+            raise TimeoutError(f"Inference worker {worker.index} timed out")
+        return worker.replies.recv()
+
+    def _load_worker(self, index, generation):
+        """Start a worker and wait for its model; returns it, or None if loading failed"""
+        try:
+            worker = _Worker(index, self.model_path, self.runtime, self.max_batch, generation, self.context)
+        except Exception as e:
+            logger.error(f"Failed to start inference worker {index}: {e}")
+            self.failed_loads += 1
+            return None
+        try:
+            status, detail = self._wait_result(worker, self.load_timeout)
+        except (EOFError, OSError, TimeoutError) as e:
+            status, detail = 'error', f"no reply while loading ({type(e).__name__})"
+        if status != 'ready':
+            logger.error(f"Inference worker {index} could not load the model: {detail}")
+            self.failed_loads += 1
+            worker.close()
+            return None
+        worker.ready = True
+        return worker
+
+    def _install(self, worker):
+        """Put a loaded worker in its slot and retire the one it replaces"""
+        old = self._slots[worker.index]
+        if old is not None and old.generation > worker.generation:
+            # A newer reload got there first
+            worker.close()
+            return
+        self._slots[worker.index] = worker
+        if old is not None:
+            old.retired = True
+        self._idle.put(worker)
+        self._any_ready.set()
+        self._purge_retired()
+
+    def _purge_retired(self):
+        """Close retired workers that are idle; busy ones are closed when released"""
+        for _ in range(self._idle.qsize()):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker.retired:
+                worker.close()
+            else:
+                self._idle.put(worker)
+
+    def _replace_all(self, generation):
+        for index in range(self.num_workers):
+            if generation != self.generation:
+                return  # Superseded by a newer reload
+            worker = self._load_worker(index, generation)
+            if worker is None:
+                # Keep serving with the workers we have rather than lose more slots
+                logger.error(f"Inference pool generation {generation} stopped loading at worker {index}")
+                return
+            self._install(worker)
+        if generation == self.generation:
+            logger.info(f"Inference pool serving generation {generation}")
+
+    def _restart(self, worker):
+        """Replace a failed worker in the background"""
+        self.restarts += 1
+        worker.retired = True
+        if self._slots[worker.index] is worker:
+            self._slots[worker.index] = None
+        try:
+            worker.close()
+        except Exception:
+            pass
+        replacement = self._load_worker(worker.index, self.generation)
+        if replacement is not None:
+            self._install(replacement)
+
+    def reload(self, context=None, previous_context=None):
+        """Make workers load the model file again, e.g. after retraining.
+
+        New workers load in the background and each replaces an old one
+        only once it is ready, so the pool keeps serving with the previous
+        model in the meantime. ``context`` (e.g. the scaler snapshots of the
+        new model) is handed to predict's ``prepare`` for requests served by
+        the new workers; old workers started without one are given
+        ``previous_context`` until they are replaced.
+        """
+        for worker in self._slots:
+            if worker is not None and worker.context is None:
+                worker.context = previous_context
+        self.generation += 1
+        self.context = context
+        logger.info(f"Inference pool reload requested (generation {self.generation})")
+        self._in_background(self._replace_all, self.generation)
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                worker = self._idle.get(timeout=max(remaining, 0.0))
+            except queue.Empty:
+                raise RuntimeError("No inference worker available")
+            if not worker.retired:
+                return worker
+            worker.close()
+
+    def _release(self, worker):
+        if worker.retired:
+            worker.close()
+        else:
+            self._idle.put(worker)
+
+    def predict(self, X=None, prepare=None):
+        """Score a (n, NUM_FEATURES) batch of scaled features; returns (n,) probabilities.
+
+        ``X`` is copied before any wait, so callers may reuse their buffer.
+        Alternatively ``prepare(context)`` builds the batch once a worker is
+        picked, from the context of the model that worker serves.
+        """
+        if X is not None:
+            X = np.array(X, dtype=np.float32).reshape(-1, NUM_FEATURES)
+            if X.shape[0] > self.max_batch:
+                return np.concatenate([self.predict(X[i:i + self.max_batch])
+                                       for i in range(0, X.shape[0], self.max_batch)])
+
+        worker = self._acquire()
+        failed = False
+        try:
+            if prepare is not None:
+                X = np.asarray(prepare(worker.context), dtype=np.float32).reshape(-1, NUM_FEATURES)
+            n = X.shape[0]
+            worker.inputs[:n] = X
+            worker.requests.send(n)
+            status, detail = self._wait_result(worker)
+            if status != 'ok':
+                raise RuntimeError(detail)
+            return worker.outputs[:n].copy()
+        except (EOFError, OSError, TimeoutError):
+            failed = True
+            logger.error(f"Inference worker {worker.index} failed, restarting it")
+            self._in_background(self._restart, worker)
+            raise RuntimeError("Inference worker failed; it is being restarted")
+        finally:
+            if not failed:
+                self._release(worker)
+
+    def get_status(self):
+        workers = [w for w in self._slots if w is not None]
+        return {
+            'workers': self.num_workers,
+            'alive': sum(1 for w in workers if w.process.poll() is None),
+            'ready': sum(1 for w in workers if w.ready),
+            'current': sum(1 for w in workers if w.generation == self.generation),
+            'idle': self._idle.qsize(),
+            'restarts': self.restarts,
+            'failed_loads': self.failed_loads,
+            'generation': self.generation,
+            'max_batch': self.max_batch,
+        }
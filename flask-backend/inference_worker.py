@@ -0,0 +1,72 @@
+import os
+import argparse
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+from model_loader import load_model_file
+
+# Entry point of an inference pool worker (see inference_pool.py). It runs as
+# its own script, so a worker imports only this module and the model modules,
+# never app.py, Flask or eventlet, whatever the server was started with.
+
+
+def serve(requests, replies, model_path, runtime, shm_name, max_batch, num_features):
+    """Load the model, then score batches placed in shared memory.
+
+    The parent only sends the row count; inputs and outputs live in this
+    worker's shared-memory slot, so no arrays are pickled.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # The parent owns the segment: this process's resource tracker must not unlink it on exit
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    inputs = np.ndarray((max_batch, num_features), dtype=np.float32, buffer=shm.buf)
+    outputs = np.ndarray((max_batch,), dtype=np.float32, buffer=shm.buf, offset=inputs.nbytes)
+    try:
+        model = load_model_file(model_path, runtime)
+        replies.send(('ready', None))
+    except Exception as e:
+        replies.send(('error', f"Failed to load model: {e}"))
+        del inputs, outputs
+        shm.close()
+        return
+
+    try:
+        while True:
+            message = requests.recv()
+            if message is None:
+                break
+            n = message
+            try:
+                scores = model.predict(inputs[:n], verbose=0)
+                outputs[:n] = np.asarray(scores, dtype=np.float32).reshape(-1)
+                replies.send(('ok', n))
+            except Exception as e:
+                replies.send(('error', str(e)))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del inputs, outputs
+        shm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference pool worker (started by inference_pool.py)")
+    parser.add_argument('model_path')
+    parser.add_argument('shm_name')
+    parser.add_argument('max_batch', type=int)
+    parser.add_argument('num_features', type=int)
+    parser.add_argument('--runtime', default='keras')
+    args = parser.parse_args()
+
+    # Requests arrive on stdin and replies leave on the original stdout;
+    # anything the model libraries print goes to stderr instead
+    requests = Connection(os.dup(0), writable=False)
+    replies = Connection(os.dup(1), readable=False)
+    os.dup2(2, 1)
+    serve(requests, replies, args.model_path, args.runtime, args.shm_name, args.max_batch, args.num_features)
+
+
+if __name__ == '__main__':
+    main()
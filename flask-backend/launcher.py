@@ -0,0 +1,342 @@
+import os
+import gc
+import sys
+import time
+import zlib
+import signal
+import argparse
+import logging
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger('launcher')
+
+# Worker 0 owns the serial port and runs retraining
+PRIMARY = 0
+# Seconds the master waits for a new connection's request line before routing by IP alone
+PEEK_TIMEOUT = 1.0
+PEEK_BYTES = 1024
+
+
+class _HandoffListener:
+    """Listening-socket stand-in for eventlet.wsgi: accept() yields connections sent by the master"""
+
+    def __init__(self, channel, address, family, grace, on_stop=None):
+        self.channel = channel
+        self.address = address
+        self.family = family
+        self.grace = grace
+        self.on_stop = on_stop
+        self.stopping = False
+
+    def getsockname(self):
+        return self.address
+
+    def accept(self):
+        import eventlet
+        from eventlet.greenio import GreenSocket
+        from eventlet.hubs import trampoline
+        from eventlet.patcher import original
+
+        _socket = original('socket')
+        while True:
+            if self.stopping:
+                if self.on_stop:
+                    self.on_stop()
+                # Existing connections get ``grace`` seconds to finish
+                eventlet.spawn_after(self.grace, os._exit, 0)
+                raise SystemExit
+            try:
+                trampoline(self.channel.fileno(), read=True, timeout=1.0, timeout_exc=TimeoutError)
+            except TimeoutError:
+                continue
+            _, fds, _, _ = _socket.recv_fds(self.channel, 1, 1)
+            if not fds:
+                # Master went away
+                self.stopping = True
+                continue
+            conn = GreenSocket(_socket.socket(fileno=fds[0]))
+            try:
+                return conn, conn.getpeername()
+            except OSError:
+                conn.close()
+
+    def close(self):
+        self.channel.close()
+
+
+def _run_worker(application, index, channel, address, family, grace, keepalive):
+    """Body of a forked worker process; never returns"""
+    import eventlet.wsgi
+
+    def release_serial():
+        # Release the port right away so the next primary can open it
+        if application.serial_manager:
+            application.serial_manager.stop()
+
+    listener = _HandoffListener(channel, address, family, grace, on_stop=release_serial)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The master decides when to stop
+    signal.signal(signal.SIGTERM, lambda signum, frame: setattr(listener, 'stopping', True))
+
+    # Each worker replays its own spool file
+    application.SENSOR_SPOOL_PATH = f"{application.SENSOR_SPOOL_PATH}.{index}"
+    application.WORKER_INDEX = index
+    primary = index == PRIMARY
+    application.start_background_services(serial=primary, retraining=primary)
+    if not primary:
+        # Models retrained by the primary are picked up from disk
+        application.socketio.start_background_task(application.watch_model_file)
+
+    application.startup_timings['server_start'] = round(time.perf_counter() - application._startup_t0, 3)
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving{' as primary' if primary else ''}")
+    try:
+        eventlet.wsgi.server(listener, application.app, log_output=False, keepalive=keepalive)
+    finally:
+        os._exit(0)
+
+
+class Launcher:
+    """Pre-forking master process.
+
+    The master imports app.py and loads the model with the NumPy runtime (no
+    TensorFlow), freezes the heap for the garbage collector and forks the
+    workers, which share that memory copy-on-write. It accepts every
+    connection, peeks at its request line and hands it to a worker: requests
+    with a ``worker=<n>`` query parameter go to worker n, those for
+    application.PRIMARY_PATHS to worker 0, which holds the per-device state,
+    and all others to the worker chosen by the client's IP, so a
+    Socket.IO session (long-polling included) always reaches the same worker.
+    With several workers, connections are not kept alive, so every request is
+    routed on its own.
+
+    SIGHUP recycles the workers one at a time, SIGTERM/SIGINT shut down
+    gracefully, and a worker that dies is respawned in its slot. The master
+    only uses the unpatched socket/select/os/time modules and never starts
+    the eventlet hub, so forked workers start with a clean one.
+    """
+
+    def __init__(self, application, host, port, num_workers, grace=30.0, recycle_interval=2.0):
+        from eventlet.patcher import original
+
+        self._socket = original('socket')
+        self._select = original('select')
+        self._os = original('os')
+        self._time = original('time')
+        self.application = application
+        self.host = host
+        self.port = port
+        self.num_workers = num_workers
+        self.grace = grace
+        self.recycle_interval = recycle_interval
+        self.slots = [None] * num_workers     # index -> (pid, channel, started_at)
+        self.draining = set()                 # pids of recycled workers still finishing
+        self.recycle_queue = []
+        self.next_recycle = 0.0
+        self.respawn_at = {}                  # index -> time before which a crashed slot stays empty
+        self.pending = {}                     # accepted connection -> (address, routing deadline)
+        self.stopping = False
+
+    def _spawn(self, index):
+        parent_channel, child_channel = self._socket.socketpair(self._socket.AF_UNIX, self._socket.SOCK_STREAM)
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            address, family = self.listener.getsockname(), self.listener.family
+            parent_channel.close()
+            self.listener.close()
+            for slot in self.slots:
+                if slot is not None:
+                    slot[1].close()
+            for conn in self.pending:
+                conn.close()
+            _run_worker(self.application, index, child_channel, address, family, self.grace,
+                        keepalive=self.num_workers == 1)
+        child_channel.close()
+        self.slots[index] = (pid, parent_channel, self._time.monotonic())
+        logger.info(f"Started worker {index} (pid {pid})")
+
+    def _retire(self, index):
+        """Stop routing to a slot's worker and let it drain"""
+        pid, channel, _ = self.slots[index]
+        self.slots[index] = None
+        channel.close()
+        self.draining.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _accept(self):
+        conn, addr = self.listener.accept()
+        if self.num_workers == 1:
+            self._route(conn, addr)
+        else:
+            self.pending[conn] = (addr, self._time.monotonic() + PEEK_TIMEOUT)
+
+    def _peek(self, conn):
+        """Route a pending connection by the path in its request line"""
+        addr, _ = self.pending.pop(conn)
+        try:
+            head = conn.recv(PEEK_BYTES, self._socket.MSG_PEEK)
+        except OSError:
+            conn.close()
+            return
+        if not head:
+            conn.close()
+            return
+        parts = head.split(b' ', 2)
+        self._route(conn, addr, parts[1].decode('latin-1') if len(parts) == 3 else None)
+
+    def _target(self, path):
+        """Worker asked for with ``?worker=<n>`` (e.g. for per-worker stats), or None"""
+        try:
+            index = int(parse_qs(urlsplit(path).query).get('worker', [''])[0])
+        except ValueError:
+            return None
+        return index if 0 <= index < self.num_workers else None
+
+    def _route(self, conn, addr, path=None):
+        try:
+            target = self._target(path) if path is not None else None
+            if target is not None:
+                start = target
+            elif path is not None and path.startswith(self.application.PRIMARY_PATHS):
+                start = PRIMARY
+            else:
+                # Sticky: the same client IP always maps to the same slot
+                start = zlib.crc32(addr[0].encode()) % self.num_workers
+            for offset in range(self.num_workers):
+                slot = self.slots[(start + offset) % self.num_workers]
+                if slot is None:
+                    continue
+                try:
+                    self._socket.send_fds(slot[1], [b'c'], [conn.fileno()])
+                    return
+                except OSError:
+                    continue
+            logger.error(f"No worker available for {addr[0]}")
+        finally:
+            conn.close()
+
+    def _reap(self):
+        now = self._time.monotonic()
+        while True:
+            try:
+                pid, status = self._os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.draining:
+                self.draining.discard(pid)
+                continue
+            for index, slot in enumerate(self.slots):
+                if slot is not None and slot[0] == pid:
+                    logger.error(f"Worker {index} (pid {pid}) exited with status {status}, respawning")
+                    slot[1].close()
+                    self.slots[index] = None
+                    # Don't spin on a worker that crashes at startup
+                    self.respawn_at[index] = now + 1.0 if now - slot[2] < 1.0 else now
+
+    def _supervise(self):
+        now = self._time.monotonic()
+        self._reap()
+
+        for conn in [c for c, (_, deadline) in self.pending.items() if now >= deadline]:
+            addr, _ = self.pending.pop(conn)
+            self._route(conn, addr)
+
+        if self.recycle_queue and now >= self.next_recycle:
+            index = self.recycle_queue[0]
+            if self.slots[index] is not None:
+                self._retire(index)
+            # The primary's replacement waits until the old one has released the serial port
+            if index != PRIMARY or not self.draining:
+                self.recycle_queue.pop(0)
+                self._spawn(index)
+                self.next_recycle = now + self.recycle_interval
+
+        for index, slot in enumerate(self.slots):
+            if slot is None and index not in self.recycle_queue and now >= self.respawn_at.get(index, 0.0):
+                self._spawn(index)
+
+    def run(self):
+        self.application.preload()
+        # Objects allocated so far are never collected or moved, which keeps
+        # their pages shared with the workers
+        gc.collect()
+        gc.freeze()
+
+        family = self._socket.AF_INET6 if ':' in self.host else self._socket.AF_INET
+        self.listener = self._socket.socket(family, self._socket.SOCK_STREAM)
+        self.listener.setsockopt(self._socket.SOL_SOCKET, self._socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, self.port))
+        self.listener.listen(1024)
+
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.recycle())
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, 'stopping', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, 'stopping', True))
+
+        for index in range(self.num_workers):
+            self._spawn(index)
+        logger.info(f"Listening on {self.host}:{self.port} with {self.num_workers} worker(s)")
+
+        while not self.stopping:
+            readable, _, _ = self._select.select([self.listener, *self.pending], [], [], 0.5)
+            for sock in readable:
+                if sock is self.listener:
+                    self._accept()
+                else:
+                    self._peek(sock)
+            self._supervise()
+        self.shutdown()
+
+    def recycle(self):
+        """Replace every worker, one at a time (e.g. to release leaked memory)"""
+        logger.info("Recycling workers")
+        self.recycle_queue = [i for i in range(self.num_workers) if i not in self.recycle_queue] + self.recycle_queue
+
+    def shutdown(self):
+        logger.info("Shutting down workers")
+        self.listener.close()
+        for conn in self.pending:
+            conn.close()
+        self.pending.clear()
+        for index, slot in enumerate(self.slots):
+            if slot is not None:
+                self._retire(index)
+        deadline = self._time.monotonic() + self.grace + 1.0
+        while self.draining and self._time.monotonic() < deadline:
+            self._reap()
+            self._time.sleep(0.1)
+        for pid in self.draining:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the IntegriSense backend with pre-forked workers")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--grace', type=float, default=30.0,
+                        help="Seconds a stopping worker gets to finish its connections")
+    args = parser.parse_args()
+
+    # Workers serve with NumPy; TensorFlow must not be loaded before fork()
+    os.environ['MODEL_RUNTIME'] = 'numpy'
+    os.environ.setdefault('SOCKETIO_DEBUG_LOGS', '0')
+    if args.workers > 1 and not os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+        logger.warning("SOCKETIO_MESSAGE_QUEUE is not set: only clients of worker 0, "
+                       "which handles the readings, receive them")
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as application
+
+    Launcher(application, args.host, args.port, args.workers, args.grace).run()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+
+import numpy as np
+
+import dataset_cache
+from numpy_model import NumpyModel
+from streaming_scaler import StreamingScaler, state_path_for
+from train_pipeline import evaluate
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ('float16', 'int8')
+LATENCY_BATCH = 1024
+
+
+def _median_seconds(fn, calls, repeats=5):
+    """Median time of one call, over ``repeats`` runs of ``calls`` calls"""
+    runs = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        runs.append((time.perf_counter() - started) / calls)
+    return float(np.median(runs))
+
+
+def training_subjects(model_path):
+    """Subjects the model was trained on, from train_pipeline's <model>.cv.json, or None if unknown"""
+    path = os.path.splitext(model_path)[0] + '.cv.json'
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get('subjects')
+
+
+def load_holdout(cache_dir, model_path, holdout_subjects=None, rows=20000, seed=0):
+    """Scaled (X_calibration, X_test, y_test, evaluation) from the dataset cache.
+
+    The test set is the ``holdout_subjects``, by default every cached subject
+    the model was not trained on (see training_subjects); the rest calibrate
+    pruning. ``evaluation`` says which subjects were used and how they were
+    picked. Features are scaled with the scaler state saved next to the model.
+    """
+    per_subject = dataset_cache.load_cache(cache_dir)
+    if not per_subject:
+        raise FileNotFoundError(f"No cached subjects in {cache_dir}")
+    trained = training_subjects(model_path)
+    if holdout_subjects:
+        missing = set(holdout_subjects) - set(per_subject)
+        if missing:
+            raise ValueError(f"Subjects not in the cache: {', '.join(sorted(missing))}")
+        selected = 'given'
+    elif trained is None:
+        raise ValueError("The model's training subjects are unknown (no .cv.json next to it); "
+                         "pass --holdout with subjects it was not trained on")
+    else:
+        holdout_subjects = sorted(s for s in per_subject if s not in trained)
+        if not holdout_subjects:
+            raise ValueError("Every cached subject was used for training; "
+                             "pass --holdout or train with --subjects leaving some out")
+        selected = 'not trained on'
+    overlap = sorted(set(holdout_subjects) & set(trained or ()))
+    if overlap:
+        logger.warning(f"The model was trained on {', '.join(overlap)}; their accuracy is not held-out accuracy")
+
+    rng = np.random.default_rng(seed)
+    test = [per_subject[s] for s in holdout_subjects]
+    calibration = [per_subject[s] for s in per_subject if s not in holdout_subjects] or test
+    X_test, y_test = np.concatenate([X for X, _ in test]), np.concatenate([y for _, y in test])
+    X_calibration = np.concatenate([X for X, _ in calibration])
+    if len(X_test) > rows:
+        pick = rng.choice(len(X_test), rows, replace=False)
+        X_test, y_test = X_test[pick], y_test[pick]
+    X_calibration = X_calibration[rng.choice(len(X_calibration), min(rows, len(X_calibration)), replace=False)]
+
+    scaler = StreamingScaler(np.zeros(X_test.shape[1]), np.ones(X_test.shape[1]))
+    if not scaler.load(state_path_for(model_path), running=False):
+        logger.warning("No scaler state next to the model; evaluating on unscaled features")
+    snapshot = scaler.published
+    evaluation = {'subjects': list(holdout_subjects), 'selected': selected, 'trained_on': trained,
+                  'overlaps_training': overlap, 'rows': int(len(X_test))}
+    return snapshot.scale(X_calibration), snapshot.scale(X_test), np.asarray(y_test), evaluation
+
+
+def measure(name, model, X_test, y_test, reference=None, file_bytes=None, param_bytes=None):
+    """Accuracy, agreement with the reference, latency and size of one variant"""
+    scores = model.predict(X_test, verbose=0)[:, 0]
+    result = {'variant': name}
+    result.update(evaluate(y_test, scores))
+    if reference is not None:
+        result['max_abs_diff'] = float(np.max(np.abs(scores - reference)))
+        result['label_agreement'] = float(np.mean((scores > 0.5) == (reference > 0.5)))
+    single = X_test[:1]
+    batch = X_test[:LATENCY_BATCH]
+    result['latency_1_us'] = round(_median_seconds(lambda: model.predict(single, verbose=0), 200) * 1e6, 1)
+    result['latency_batch_ms'] = round(_median_seconds(lambda: model.predict(batch, verbose=0), 20) * 1e3, 3)
+    result['param_bytes'] = param_bytes if param_bytes is not None else model.nbytes
+    result['file_bytes'] = file_bytes
+    return result, scores
+
+
+def _file_bytes(model, directory, name):
+    path = os.path.join(directory, f"{name}.npz")
+    model.save(path)
+    return os.path.getsize(path)
+
+
+def export_variants(model_path, X_calibration, X_test, y_test, prune=0.0):
+    """Build every export variant and measure it against the original model.
+
+    Returns (report rows, {variant: NumpyModel}). The original is the
+    unmodified layers from the .h5 (the same computation as Keras); when
+    TensorFlow is installed the Keras model itself is measured as well.
+    """
+    original = NumpyModel.load(model_path)
+    rows = []
+    reference_row, reference = measure('original', original, X_test, y_test,
+                                       file_bytes=os.path.getsize(model_path))
+    rows.append(reference_row)
+
+    try:
+        import tensorflow as tf
+        keras_model = tf.keras.models.load_model(model_path)
+        keras_row, _ = measure('keras', keras_model, X_test, y_test, reference, os.path.getsize(model_path),
+                               param_bytes=int(keras_model.count_params()) * 4)
+        rows.append(keras_row)
+    except ImportError:
+        logger.info("TensorFlow not installed; comparing against the NumPy forward pass of the same weights")
+
+    variants = {'folded': original.folded()}
+    base = 'folded'
+    if prune > 0:
+        variants['pruned'] = variants['folded'].pruned(X_calibration, prune)
+        base = 'pruned'
+    for dtype in QUANTIZATIONS:
+        variants[f"{base}+{dtype}"] = variants[base].quantized(dtype)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, model in variants.items():
+            row, _ = measure(name, model, X_test, y_test, reference, _file_bytes(model, directory, name))
+            rows.append(row)
+    return rows, variants
+
+
+def choose(rows, max_accuracy_drop):
+    """Smallest exported variant whose accuracy is within ``max_accuracy_drop`` of the original"""
+    baseline = rows[0]['accuracy']
+    candidates = [row for row in rows if row['variant'] not in ('original', 'keras')
+                  and baseline - row['accuracy'] <= max_accuracy_drop]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda row: (row['file_bytes'], -row['accuracy']))['variant']
+
+
+def format_report(rows):
+    header = (f"{'variant':<16}{'accuracy':>9}{'f1':>7}{'agree':>8}{'max|dP|':>9}"
+              f"{'1 row us':>10}{'1024 rows ms':>14}{'params B':>10}{'file B':>9}")
+    lines = [header]
+    for row in rows:
+        lines.append(
+            f"{row['variant']:<16}{row['accuracy']:>9.4f}{row['f1']:>7.3f}"
+            f"{row.get('label_agreement', 1.0):>8.4f}{row.get('max_abs_diff', 0.0):>9.4f}"
+            f"{row['latency_1_us']:>10.1f}{row['latency_batch_ms']:>14.3f}{row['param_bytes']:>10}{row['file_bytes']:>9}"
+        )
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold, prune and quantize the Keras model into a NumPy .npz")
+    parser.add_argument('model', help="Keras .h5 model (e.g. stress_model.h5)")
+    parser.add_argument('-o', '--output', required=True, help="Exported .npz model")
+    parser.add_argument('--cache-dir', default=os.environ.get('DATASET_CACHE_DIR', 'dataset_cache'),
+                        help="Dataset cache with the evaluation data (see dataset_cache.py)")
+    parser.add_argument('--holdout', nargs='*',
+                        help="Subjects to evaluate on (default: cached subjects the model was not trained on)")
+    parser.add_argument('--rows', type=int, default=20000, help="Evaluation rows at most")
+    parser.add_argument('--prune', type=float, default=0.0,
+                        help="Fraction of hidden units to remove from each Dense layer")
+    parser.add_argument('--quantize', choices=('auto', 'none') + QUANTIZATIONS, default='auto',
+                        help="'auto' picks the smallest variant within --max-accuracy-drop")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.005)
+    args = parser.parse_args()
+
+    if not args.output.endswith('.npz'):
+        parser.error("output must be a .npz file")
+    if not 0 <= args.prune < 1:
+        parser.error("--prune must be in [0, 1)")
+
+    try:
+        X_calibration, X_test, y_test, evaluation = load_holdout(args.cache_dir, args.model, args.holdout, args.rows)
+    except ValueError as e:
+        parser.error(str(e))
+    rows, variants = export_variants(args.model, X_calibration, X_test, y_test, args.prune)
+    note = evaluation['selected']
+    if evaluation['overlaps_training']:
+        note += f"; the model was trained on {', '.join(evaluation['overlaps_training'])}"
+    print(f"Evaluated on {evaluation['rows']} rows of {', '.join(evaluation['subjects'])} ({note})")
+    print(format_report(rows))
+
+    base = 'pruned' if args.prune > 0 else 'folded'
+    if args.quantize == 'auto':
+        chosen = choose(rows, args.max_accuracy_drop)
+        if chosen is None:
+            raise SystemExit(f"No variant is within {args.max_accuracy_drop} accuracy of the original")
+    else:
+        chosen = base if args.quantize == 'none' else f"{base}+{args.quantize}"
+
+    variants[chosen].save(args.output)
+    scaler_path = state_path_for(args.model)
+    if os.path.exists(scaler_path):
+        # Written last: app.py treats the scaler file's mtime as the model version
+        shutil.copyfile(scaler_path, state_path_for(args.output))
+    report = {'model': args.model, 'output': args.output, 'chosen': chosen, 'evaluation': evaluation,
+              'variants': rows}
+    with open(os.path.splitext(args.output)[0] + '.report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {chosen} as {args.output}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,23 @@
+from numpy_model import NumpyModel
+from tree_model import TreeEnsemble, is_tree_file
+
+# Kept out of app.py: inference pool workers (inference_worker.py) load their
+# model with this module and must not import the app or eventlet.
+
+
+def model_runtime(model_path, runtime='keras'):
+    """'trees', 'numpy', or ``runtime`` ('keras' or 'numpy') for a Keras .h5 file"""
+    if is_tree_file(model_path):
+        return 'trees'
+    return 'numpy' if model_path.endswith('.npz') else runtime
+
+
+def load_model_file(model_path, runtime='keras'):
+    """Load a saved model with the runtime it needs"""
+    runtime = model_runtime(model_path, runtime)
+    if runtime == 'trees':
+        return TreeEnsemble.load(model_path)
+    if runtime == 'numpy':
+        return NumpyModel.load(model_path)
+    import tensorflow as tf
+    return tf.keras.models.load_model(model_path)
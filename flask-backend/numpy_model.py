@@ -0,0 +1,249 @@
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0, out=x),
+    'sigmoid': lambda x: 0.5 * np.tanh(0.5 * x) + 0.5,  # Same as 1 / (1 + e^-x), without overflow
+    'tanh': np.tanh,
+}
+
+
+def _param_name(weight_name):
+    """'dense_1/kernel:0' -> 'kernel'"""
+    return weight_name.rsplit('/', 1)[-1].split(':')[0]
+
+
+class NumpyModel:
+    """Forward pass of a Dense/BatchNormalization/Dropout network in NumPy.
+
+    Serves predictions from the Keras model's weights without importing
+    TensorFlow: a (1, 4) prediction takes microseconds, the arrays are
+    read-only after loading (safe to share copy-on-write between forked
+    workers), and the interface matches what the app uses from Keras.
+
+    Layers are kept as ('dense', kernel, bias, activation) and
+    ('affine', scale, shift). At inference BatchNormalization is a fixed
+    per-feature affine transform and Dropout does nothing, so they are
+    converted to 'affine' and dropped when loading. Exported models (see
+    model_export.py) may also contain ('qdense', kernel, scale, bias,
+    activation), a Dense layer whose int8/float16 kernel is multiplied by a
+    per-output scale.
+    """
+
+    def __init__(self, layers):
+        self.layers = []
+        for layer in layers:
+            kind, *arrays = layer
+            if kind in ('dense', 'qdense'):
+                *weights, activation = arrays
+                if activation not in ACTIVATIONS:
+                    raise ValueError(f"Unsupported activation: {activation}")
+                if kind == 'qdense':
+                    kernel, scale, bias = weights
+                    weights = [self._frozen(kernel, kernel.dtype), self._frozen(scale), self._frozen(bias)]
+                else:
+                    weights = [self._frozen(w) for w in weights]
+                arrays = weights + [activation]
+            else:
+                arrays = [self._frozen(a) for a in arrays]
+            self.layers.append((kind, *arrays))
+
+    @staticmethod
+    def _frozen(array, dtype=np.float32):
+        array = np.array(array, dtype=dtype)
+        array.setflags(write=False)
+        return array
+
+    @staticmethod
+    def _convert(class_name, config, weights):
+        """Translate one Keras layer (config dict and {param: array}) into layers"""
+        if class_name in ('InputLayer', 'Dropout', 'Flatten'):
+            return []
+        if class_name == 'Dense':
+            bias = weights.get('bias', np.zeros(weights['kernel'].shape[1], dtype=np.float32))
+            return [('dense', weights['kernel'], bias, config.get('activation', 'linear'))]
+        if class_name == 'BatchNormalization':
+            variance = weights['moving_variance']
+            gamma = weights.get('gamma', np.ones_like(variance))
+            beta = weights.get('beta', np.zeros_like(variance))
+            scale = gamma / np.sqrt(variance + config.get('epsilon', 1e-3))
+            return [('affine', scale, beta - weights['moving_mean'] * scale)]
+        raise ValueError(f"Unsupported layer type: {class_name}")
+
+    @classmethod
+    def from_keras(cls, model):
+        """Build from an in-memory Keras model (e.g. one that was just trained)"""
+        layers = []
+        for layer in model.layers:
+            names = [_param_name(w.name if hasattr(w, 'name') else w.path) for w in layer.weights]
+            weights = dict(zip(names, layer.get_weights()))
+            layers.extend(cls._convert(type(layer).__name__, layer.get_config(), weights))
+        return cls(layers)
+
+    @classmethod
+    def load_h5(cls, path):
+        """Read a Keras .h5 model file with h5py only (no TensorFlow import)"""
+        import h5py
+
+        with h5py.File(path, 'r') as f:
+            config = f.attrs['model_config']
+            config = json.loads(config.decode() if isinstance(config, bytes) else config)
+            root = f['model_weights'] if 'model_weights' in f else f
+            layers = []
+            for layer in config['config']['layers']:
+                layer_config = layer['config']
+                weights = {}
+                name = layer_config['name']
+                if name in root:
+                    group = root[name]
+                    for weight_name in group.attrs.get('weight_names', []):
+                        weight_name = weight_name.decode() if isinstance(weight_name, bytes) else weight_name
+                        weights[_param_name(weight_name)] = group[weight_name][()]
+                layers.extend(cls._convert(layer['class_name'], layer_config, weights))
+        return cls(layers)
+
+    def folded(self):
+        """Equivalent model with every affine (BatchNormalization) folded into a Dense layer.
+
+        An affine right after a linear Dense is folded into that layer; any
+        other affine is folded into the next Dense:
+        (x * s + t) @ W + b == x @ (s[:, None] * W) + (t @ W + b).
+        """
+        layers, pending = [], None
+        for kind, *params in self.layers:
+            if kind == 'affine':
+                scale, shift = (p.astype(np.float64) for p in params)
+                previous = layers[-1] if layers else None
+                if pending is None and previous is not None and previous[0] == 'dense' and previous[3] == 'linear':
+                    layers[-1] = ('dense', previous[1] * scale, previous[2] * scale + shift, 'linear')
+                elif pending is None:
+                    pending = (scale, shift)
+                else:
+                    pending = (pending[0] * scale, pending[1] * scale + shift)
+                continue
+            if kind == 'dense' and pending is not None:
+                kernel, bias = params[0].astype(np.float64), params[1].astype(np.float64)
+                layers.append(('dense', pending[0][:, None] * kernel, pending[1] @ kernel + bias, params[2]))
+                pending = None
+                continue
+            if pending is not None:
+                layers.append(('affine', *pending))
+                pending = None
+            layers.append((kind, *params))
+        if pending is not None:
+            layers.append(('affine', *pending))
+        return NumpyModel(layers)
+
+    def pruned(self, X, ratio):
+        """Drop the least important ``ratio`` of the units of every Dense layer that feeds another Dense.
+
+        A unit's importance is its mean |activation| on ``X`` times the norm
+        of its outgoing weights. Its mean activation is added to the next
+        layer's bias, so dead ReLU units are removed without changing the
+        output at all. Run on a folded model.
+        """
+        layers = list(self.layers)
+        x = np.asarray(X, dtype=np.float32)
+        for i in range(len(layers)):
+            kind, *params = layers[i]
+            output = NumpyModel([layers[i]]).predict(x)
+            following = layers[i + 1] if i + 1 < len(layers) else None
+            if kind == 'dense' and following is not None and following[0] == 'dense' and ratio > 0:
+                next_kernel, next_bias, next_activation = following[1:]
+                importance = np.abs(output).mean(axis=0) * np.linalg.norm(next_kernel, axis=1)
+                order = np.argsort(importance, kind='stable')
+                drop, keep = order[:int(len(order) * ratio)], np.sort(order[int(len(order) * ratio):])
+                next_bias = next_bias + output.mean(axis=0)[drop] @ next_kernel[drop]
+                layers[i] = ('dense', params[0][:, keep], params[1][keep], params[2])
+                layers[i + 1] = ('dense', next_kernel[keep], next_bias, next_activation)
+                output = output[:, keep]
+            x = output
+        return NumpyModel(layers)
+
+    def quantized(self, dtype='int8'):
+        """Weight-only quantization of every Dense kernel.
+
+        int8 uses a symmetric scale per output unit; float16 just halves
+        the precision. Activations stay float32.
+        """
+        if dtype not in ('int8', 'float16'):
+            raise ValueError(f"Unsupported quantization: {dtype}")
+        layers = []
+        for kind, *params in self.layers:
+            if kind != 'dense':
+                layers.append((kind, *params))
+                continue
+            kernel, bias, activation = params
+            if dtype == 'float16':
+                qkernel, scale = kernel.astype(np.float16), np.ones(kernel.shape[1], dtype=np.float32)
+            else:
+                scale = np.abs(kernel).max(axis=0) / 127.0
+                scale[scale == 0] = 1.0
+                qkernel = np.clip(np.round(kernel / scale), -127, 127).astype(np.int8)
+            layers.append(('qdense', qkernel, scale, bias, activation))
+        return NumpyModel(layers)
+
+    @property
+    def nbytes(self):
+        """Memory taken by the parameters"""
+        return sum(p.nbytes for _, *params in self.layers for p in params if isinstance(p, np.ndarray))
+
+    def save(self, path):
+        """Save as .npz (a JSON layer spec plus one array per parameter)"""
+        spec, arrays = [], {}
+        for i, (kind, *params) in enumerate(self.layers):
+            if kind == 'dense':
+                arrays[f"{i}_kernel"], arrays[f"{i}_bias"] = params[0], params[1]
+                spec.append({'kind': kind, 'activation': params[2]})
+            elif kind == 'qdense':
+                arrays[f"{i}_kernel"], arrays[f"{i}_scale"], arrays[f"{i}_bias"] = params[:3]
+                spec.append({'kind': kind, 'activation': params[3]})
+            else:
+                arrays[f"{i}_scale"], arrays[f"{i}_shift"] = params
+                spec.append({'kind': kind})
+        np.savez(path, spec=np.array(json.dumps(spec)), **arrays)
+
+    @classmethod
+    def load_npz(cls, path):
+        with np.load(path) as data:
+            spec = json.loads(str(data['spec']))
+            layers = []
+            for i, layer in enumerate(spec):
+                if layer['kind'] == 'dense':
+                    layers.append(('dense', data[f"{i}_kernel"], data[f"{i}_bias"], layer['activation']))
+                elif layer['kind'] == 'qdense':
+                    layers.append(('qdense', data[f"{i}_kernel"], data[f"{i}_scale"], data[f"{i}_bias"],
+                                   layer['activation']))
+                else:
+                    layers.append(('affine', data[f"{i}_scale"], data[f"{i}_shift"]))
+        return cls(layers)
+
+    @classmethod
+    def load(cls, path):
+        return cls.load_npz(path) if path.endswith('.npz') else cls.load_h5(path)
+
+    def predict(self, X, verbose=0):
+        """Keras-compatible predict: (n, features) -> (n, outputs)"""
+        x = np.asarray(X, dtype=np.float32)
+        for kind, *params in self.layers:
+            if kind == 'dense':
+                x = ACTIVATIONS[params[2]](x @ params[0] + params[1])
+            elif kind == 'qdense':
+                x = ACTIVATIONS[params[3]]((x @ params[0]).astype(np.float32, copy=False) * params[1] + params[2])
+            else:
+                x = x * params[0] + params[1]
+        return x
+
+    def summary(self, print_fn=print):
+        for kind, *params in self.layers:
+            if kind == 'dense':
+                print_fn(f"dense {params[0].shape[0]} -> {params[0].shape[1]} ({params[2]})")
+            elif kind == 'qdense':
+                print_fn(f"dense {params[0].shape[0]} -> {params[0].shape[1]} ({params[3]}, {params[0].dtype})")
+            else:
+                print_fn(f"affine {params[0].shape[0]}")
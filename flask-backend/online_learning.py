@@ -0,0 +1,166 @@
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LabeledSampleBuffer:
+    """Thread-safe buffer of newly labeled samples awaiting training"""
+
+    def __init__(self, max_samples=100000):
+        self.max_samples = max_samples
+        self._X = []
+        self._y = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, X, y):
+        """Append labeled rows (X in [EDA, TEMP, ACC_Mag, BVP] order, y in {0,1})"""
+        X = np.asarray(X, dtype=np.float32).reshape(-1, 4)
+        y = np.asarray(y, dtype=np.float32).reshape(-1)
+        if X.shape[0] != y.shape[0]:
+            raise ValueError(f"Got {X.shape[0]} samples but {y.shape[0]} labels")
+        # A chunk larger than the buffer keeps only its newest rows
+        X, y = X[-self.max_samples:], y[-self.max_samples:]
+        with self._lock:
+            self._X.append(X)
+            self._y.append(y)
+            self._count += X.shape[0]
+            self._trim()
+        return X.shape[0]
+
+    def requeue(self, X, y):
+        """Put drained samples back (e.g. after a failed update), ahead of newer ones"""
+        if X is None:
+            return
+        with self._lock:
+            self._X.insert(0, X[-self.max_samples:])
+            self._y.insert(0, y[-self.max_samples:])
+            self._count += self._X[0].shape[0]
+            self._trim()
+
+    def _trim(self):
+        # Drop the oldest rows rather than growing without bound
+        while self._count > self.max_samples:
+            excess = self._count - self.max_samples
+            if self._X[0].shape[0] <= excess:
+                self._count -= self._X.pop(0).shape[0]
+                self._y.pop(0)
+            else:
+                self._X[0], self._y[0] = self._X[0][excess:], self._y[0][excess:]
+                self._count -= excess
+
+    def drain(self):
+        """Return and clear all buffered samples as (X, y), or (None, None) if empty"""
+        with self._lock:
+            if not self._X:
+                return None, None
+            X = np.concatenate(self._X)
+            y = np.concatenate(self._y)
+            self._X, self._y, self._count = [], [], 0
+        return X, y
+
+    def __len__(self):
+        return self._count
+
+
+class DriftDetector:
+    """Decide whether incremental updates are enough or a full rebuild is needed.
+
+    Two signals are checked on each new labeled batch: the standardized shift
+    of the feature means relative to the data the model was last fully built
+    on, and the served model's accuracy on the batch compared with its
+    accuracy at build time.
+    """
+
+    def __init__(self, mean_shift_threshold=0.5, accuracy_drop=0.1, min_accuracy=0.7, min_samples=50):
+        self.mean_shift_threshold = mean_shift_threshold
+        self.accuracy_drop = accuracy_drop
+        self.min_accuracy = min_accuracy
+        self.min_samples = min_samples
+        self.reference_mean = None
+        self.reference_std = None
+        self.reference_accuracy = None
+
+    def set_reference(self, X_scaled, accuracy=None):
+        """Record the (scaled) training distribution of a freshly built model"""
+        self.reference_mean = X_scaled.mean(axis=0)
+        self.reference_std = np.maximum(X_scaled.std(axis=0), 1e-6)
+        self.reference_accuracy = accuracy
+
+    def check(self, model, X_scaled, y):
+        """Return (needs_full_retrain, report) for a new labeled batch"""
+        report = {'samples': int(X_scaled.shape[0])}
+        if X_scaled.shape[0] < self.min_samples:
+            report['reason'] = 'too few samples to judge drift'
+            return False, report
+
+        scores = np.asarray(model.predict(X_scaled, verbose=0)).reshape(-1)
+        accuracy = float(np.mean((scores > 0.5) == (y > 0.5)))
+        report['accuracy'] = accuracy
+
+        accuracy_floor = self.min_accuracy
+        if self.reference_accuracy is not None:
+            accuracy_floor = max(accuracy_floor, self.reference_accuracy - self.accuracy_drop)
+        if accuracy < accuracy_floor:
+            report['reason'] = f"accuracy {accuracy:.3f} below {accuracy_floor:.3f}"
+            return True, report
+
+        if self.reference_mean is not None:
+            shift = np.abs(X_scaled.mean(axis=0) - self.reference_mean) / self.reference_std
+            report['max_mean_shift'] = float(shift.max())
+            if shift.max() > self.mean_shift_threshold:
+                report['reason'] = f"feature mean shift {shift.max():.3f} above {self.mean_shift_threshold}"
+                return True, report
+
+        report['reason'] = 'no drift'
+        return False, report
+
+
+class OnlineTrainer:
+    """Fine-tune the served Keras model on mini-batches of new data.
+
+    Updates are applied to a copy of the model so the served one is never
+    modified mid-prediction; the caller swaps the returned model in.
+    """
+
+    def __init__(self, learning_rate=1e-4, batch_size=32, epochs=1, full_rebuild_every=None):
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.epochs = epochs
+        # Force a full rebuild after this many incremental updates (None disables)
+        self.full_rebuild_every = full_rebuild_every
+        self.updates_since_rebuild = 0
+
+    def full_rebuild_due(self):
+        return (self.full_rebuild_every is not None and
+                self.updates_since_rebuild >= self.full_rebuild_every)
+
+    def mark_rebuilt(self):
+        self.updates_since_rebuild = 0
+
+    def fine_tune(self, model, X_scaled, y):
+        """Return a copy of ``model`` updated with one pass over (X_scaled, y)"""
+        import tensorflow as tf
+
+        updated = tf.keras.models.clone_model(model)
+        updated.set_weights(model.get_weights())
+        # Small learning rate so new batches nudge rather than overwrite what was learned
+        updated.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=self.learning_rate),
+            loss='binary_crossentropy',
+            metrics=['accuracy']
+        )
+
+        order = np.random.permutation(X_scaled.shape[0])
+        for _ in range(self.epochs):
+            for start in range(0, len(order), self.batch_size):
+                idx = order[start:start + self.batch_size]
+                updated.train_on_batch(X_scaled[idx], y[idx])
+
+        self.updates_since_rebuild += 1
+        logger.info(f"Online update applied on {X_scaled.shape[0]} samples "
+                    f"({self.updates_since_rebuild} since last full rebuild)")
+        return updated
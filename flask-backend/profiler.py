@@ -0,0 +1,158 @@
+import os
+import gc
+import sys
+import logging
+import weakref
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+try:
+    # The sampler must be a real OS thread with a real clock: a green thread
+    # would only run when the hub lets it, i.e. never during a CPU spike
+    from eventlet.patcher import original as _original
+    _threading = _original('threading')
+    _time = _original('time')
+except ImportError:
+    import threading as _threading
+    import time as _time
+
+try:
+    import greenlet as _greenlet
+except ImportError:
+    _greenlet = None
+
+# Functions/classes whose share of the samples is reported separately
+DEFAULT_FOCUS = ('process_and_broadcast_data', 'predict_stress_level', 'SerialManager')
+MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+    """Stack-sampling profiler for all OS threads and green threads.
+
+    Nothing is installed until start(): a background OS thread then reads
+    every thread's current stack via sys._current_frames() each ``interval``
+    seconds. Under eventlet the hub thread's stack is whichever green thread
+    is running. In 'wall' mode the stacks of suspended green threads are
+    sampled too, which shows where they wait (tpool, sockets, sleeps). Those
+    greenlets are found once at start and then followed through
+    greenlet.settrace, which must be set from the hub thread. stop()
+    removes both.
+
+    Samples are aggregated as collapsed stacks ('root;outer;...;inner N'),
+    the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005, mode='cpu', focus=DEFAULT_FOCUS):
+        if mode not in ('cpu', 'wall'):
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.interval = interval
+        self.mode = mode
+        self.focus = focus
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self._labels = {}
+        self._greenlets = weakref.WeakSet()
+        self._previous_trace = None
+        self._stop = _threading.Event()
+        self._thread = None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = self._labels[code] = f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return labels
+
+    def _trace_greenlets(self, event, args):
+        if event in ('switch', 'throw'):
+            self._greenlets.add(args[1])
+        if self._previous_trace is not None:
+            self._previous_trace(event, args)
+
+    def _sample(self, sampler_id, thread_names):
+        for ident, frame in sys._current_frames().items():
+            if ident != sampler_id:
+                root = f"thread:{thread_names.get(ident, ident)}"
+                self.stacks[';'.join([root] + self._stack(frame))] += 1
+        if self.mode == 'wall':
+            for glet in list(self._greenlets):
+                # gr_frame is None while a greenlet runs (it was sampled above
+                # with its thread) and once it has finished
+                frame = getattr(glet, 'gr_frame', None)
+                if frame is not None:
+                    self.stacks[';'.join(['greenlet (waiting)'] + self._stack(frame))] += 1
+        self.samples += 1
+
+    def _run(self, duration):
+        sampler_id = _threading.get_ident()
+        deadline = _time.monotonic() + duration
+        thread_names = {}
+        while not self._stop.wait(self.interval) and _time.monotonic() < deadline:
+            if not self.samples % 200:
+                thread_names = {t.ident: t.name for t in _threading.enumerate()}
+            self._sample(sampler_id, thread_names)
+
+    def start(self, duration):
+        """Sample for up to ``duration`` seconds; call from the thread running the eventlet hub"""
+        if self.mode == 'wall' and _greenlet is not None:
+            self._greenlets.update(obj for obj in gc.get_objects() if isinstance(obj, _greenlet.greenlet))
+            self._previous_trace = _greenlet.settrace(self._trace_greenlets)
+        self.started_at = _time.monotonic()
+        self._thread = _threading.Thread(target=self._run, args=(duration,), name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.mode == 'wall' and _greenlet is not None:
+            _greenlet.settrace(self._previous_trace)
+            self._previous_trace = None
+        self._greenlets = weakref.WeakSet()
+        self.elapsed = _time.monotonic() - self.started_at
+        logger.info(f"Profiled {self.samples} samples over {self.elapsed:.1f}s ({self.mode})")
+
+    def collapsed(self):
+        """Collapsed stacks, heaviest first"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _matches(self, label, name):
+        qualname = label.split(' (', 1)[0]
+        return qualname == name or qualname.startswith(name + '.')
+
+    def report(self, top=20):
+        """Samples per focus function, hottest leaf functions, and the collapsed stacks"""
+        focus = Counter()
+        leaves = Counter()
+        total = sum(self.stacks.values())
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            leaves[frames[-1]] += count
+            for name in self.focus:
+                if any(self._matches(label, name) for label in frames[1:]):
+                    focus[name] += count
+
+        def share(count):
+            return {'samples': count, 'percent': round(100.0 * count / total, 1) if total else 0.0}
+
+        return {
+            'mode': self.mode,
+            'interval_ms': round(self.interval * 1000, 3),
+            'seconds': round(self.elapsed, 3),
+            'samples': self.samples,
+            'stacks': total,
+            'focus': {name: share(focus[name]) for name in self.focus},
+            'top_functions': [dict(share(count), function=label) for label, count in leaves.most_common(top)],
+            'collapsed': self.collapsed(),
+        }
@@ -0,0 +1,173 @@
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Labels that say something about the subject; anything else (model missing,
+# prediction error) neither extends nor breaks a stable run
+STATE_LABELS = ('Calm', 'Stressed')
+
+
+class _DeviceState:
+    __slots__ = ('rate', 'measured_from', 'window_start', 'window_count', 'label', 'run', 'target_hz',
+                 'last_change')
+
+    def __init__(self, now, target_hz):
+        self.rate = 0.0
+        self.measured_from = None
+        self.window_start = now
+        self.window_count = 0
+        self.label = None
+        self.run = 0
+        self.target_hz = target_hz
+        self.last_change = now
+
+
+class RateController:
+    """Adjusts each device's sampling rate from what the backend observes.
+
+    Per reading it updates, in O(1), the length of the device's current run
+    of identical predictions and its ingest rate, counted over windows of
+    ``rate_window`` seconds (readings that arrive in a batch all count). A
+    device whose prediction changes, or that is Stressed, is raised to
+    ``max_hz`` at once. After ``stable_readings`` identical Calm predictions
+    its rate is halved, down to ``min_hz``, at most once per ``cooldown``
+    seconds. When the pipeline backlog passes ``backlog_high``, devices that
+    have been stable for a quarter of that run are lowered too. A device
+    whose measured rate stays more than ``tolerance`` off its target for a
+    cooldown is sent its target again (the command may have been lost).
+
+    Commands are built from ``command_template`` (e.g. 'SET_RATE {hz}') and
+    handed to ``send(device_id, command)``; every decision is logged.
+    """
+
+    def __init__(self, send, min_hz=5, max_hz=50, default_hz=25, command_template='SET_RATE {hz}',
+                 stable_readings=600, cooldown=30.0, backlog_fn=None, backlog_high=0.5,
+                 rate_window=5.0, tolerance=0.5, history=200):
+        if not min_hz <= default_hz <= max_hz:
+            raise ValueError("Expected min_hz <= default_hz <= max_hz")
+        self.send = send
+        self.min_hz = min_hz
+        self.max_hz = max_hz
+        self.default_hz = default_hz
+        self.command_template = command_template
+        self.stable_readings = stable_readings
+        self.cooldown = cooldown
+        self.backlog_fn = backlog_fn
+        self.backlog_high = backlog_high
+        self.rate_window = rate_window
+        self.tolerance = tolerance
+        self.decisions = deque(maxlen=history)
+        self._devices = {}
+        self._backlog = 0.0
+        self._backlog_checked = 0.0
+        self._lock = threading.Lock()
+
+    def _current_backlog(self, now):
+        """Pipeline backlog (0-1), sampled at most once per second"""
+        if self.backlog_fn is not None and now - self._backlog_checked >= 1.0:
+            self._backlog_checked = now
+            try:
+                self._backlog = float(self.backlog_fn())
+            except Exception as e:
+                logger.debug(f"Backlog check failed: {e}")
+        return self._backlog
+
+    def observe(self, device_id, prediction, now=None):
+        """Record one processed reading; sends a rate command if one is due"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = _DeviceState(now, self.default_hz)
+            else:
+                state.window_count += 1
+                elapsed = now - state.window_start
+                if elapsed >= self.rate_window:
+                    state.rate = state.window_count / elapsed
+                    state.measured_from = state.window_start
+                    state.window_start = now
+                    state.window_count = 0
+
+            if prediction not in STATE_LABELS:
+                return None
+            changed = state.label is not None and prediction != state.label
+            if prediction == state.label:
+                state.run += 1
+            else:
+                state.label = prediction
+                state.run = 1
+
+            decision = self._decide(state, changed, now)
+            if decision is None:
+                return None
+            new_hz, reason = decision
+            old_hz = state.target_hz
+            state.target_hz = new_hz
+            state.last_change = now
+            record = {
+                'time': time.time(),
+                'device_id': device_id,
+                'from_hz': old_hz,
+                'to_hz': new_hz,
+                'reason': reason,
+                'observed_hz': round(state.rate, 2),
+                'run': state.run,
+                'backlog': round(self._backlog, 3),
+            }
+            self.decisions.append(record)
+
+        command = self.command_template.format(hz=new_hz)
+        logger.info(f"Rate control {device_id}: {old_hz} -> {new_hz} Hz ({reason}, "
+                    f"observed {record['observed_hz']} Hz, run {record['run']}, backlog {record['backlog']})")
+        try:
+            record['sent'] = bool(self.send(device_id, command))
+        except Exception as e:
+            record['sent'] = False
+            logger.error(f"Failed to send rate command to {device_id}: {e}")
+        return command
+
+    def _decide(self, state, changed, now):
+        """(new rate, reason) or None"""
+        if (changed or state.label == 'Stressed') and state.target_hz < self.max_hz:
+            return self.max_hz, 'state changed' if changed else 'stressed'
+
+        if now - state.last_change < self.cooldown:
+            return None
+        # Only a window measured entirely since the last command says whether it took effect
+        if (state.measured_from is not None and state.measured_from >= state.last_change
+                and abs(state.rate - state.target_hz) > self.tolerance * state.target_hz):
+            return state.target_hz, 'not applied'
+        if state.label == 'Stressed' or state.target_hz <= self.min_hz:
+            return None
+        lowered = max(self.min_hz, state.target_hz // 2)
+        if state.run >= self.stable_readings:
+            return lowered, 'stable'
+        if state.run >= self.stable_readings // 4 and self._current_backlog(now) > self.backlog_high:
+            return lowered, 'backlog'
+        return None
+
+    def forget(self, device_id):
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def get_status(self):
+        with self._lock:
+            devices = {
+                device_id: {
+                    'target_hz': state.target_hz,
+                    'observed_hz': round(state.rate, 2),
+                    'prediction': state.label,
+                    'run': state.run,
+                }
+                for device_id, state in self._devices.items()
+            }
+            decisions = list(self.decisions)[-20:]
+        return {
+            'bounds_hz': [self.min_hz, self.max_hz],
+            'backlog': round(self._backlog, 3),
+            'devices': devices,
+            'recent_decisions': decisions,
+        }
@@ -0,0 +1,126 @@
+import time
+import threading
+
+import numpy as np
+
+# One row per processed payload; ~30 bytes instead of a payload dict
+RECORD_DTYPE = np.dtype([
+    ('t', np.float64),
+    ('bvp', np.float32),
+    ('temperature', np.float32),
+    ('eda', np.float32),
+    ('acceleration_magnitude', np.float32),
+    ('prediction', np.int8),
+])
+
+PREDICTION_CODES = {'Calm': 0, 'Stressed': 1}
+PREDICTION_LABELS = {0: 'Calm', 1: 'Stressed', -1: 'Unavailable'}
+
+
+class DeviceRingBuffer:
+    """Fixed-capacity ring of a device's most recent payloads"""
+
+    __slots__ = ('records', 'capacity', 'next', 'size', 'last_update')
+
+    def __init__(self, capacity):
+        self.records = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.capacity = capacity
+        self.next = 0
+        self.size = 0
+        self.last_update = 0.0
+
+    def append(self, t, bvp, temperature, eda, acc_mag, prediction):
+        self.records[self.next] = (t, bvp, temperature, eda, acc_mag, PREDICTION_CODES.get(prediction, -1))
+        self.next = (self.next + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        self.last_update = time.monotonic()
+
+    def ordered(self):
+        """Records oldest to newest (a copy, safe to use after the lock is released)"""
+        if self.size < self.capacity:
+            return self.records[:self.size].copy()
+        return np.concatenate((self.records[self.next:], self.records[:self.next]))
+
+
+class RecentHistory:
+    """Per-device recent history for late-joining clients.
+
+    Every device gets a preallocated ring of ``window_seconds * max_rate_hz``
+    records, so memory per device is fixed. Rows older than the window are
+    dropped from snapshots, and devices idle for ``idle_timeout`` seconds
+    are evicted.
+    """
+
+    def __init__(self, window_seconds=60, max_rate_hz=50, idle_timeout=300, max_devices=256):
+        self.window_seconds = window_seconds
+        self.capacity = int(window_seconds * max_rate_hz)
+        self.idle_timeout = idle_timeout
+        self.max_devices = max_devices
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def add(self, device_id, t, bvp, temperature, eda, acc_mag, prediction):
+        with self._lock:
+            buf = self._buffers.get(device_id)
+            if buf is None:
+                self._evict_idle()
+                if len(self._buffers) >= self.max_devices:
+                    # Reuse the least recently updated device's memory
+                    oldest = min(self._buffers, key=lambda k: self._buffers[k].last_update)
+                    del self._buffers[oldest]
+                buf = self._buffers[device_id] = DeviceRingBuffer(self.capacity)
+            buf.append(t, bvp, temperature, eda, acc_mag, prediction)
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for device_id in [k for k, b in self._buffers.items() if now - b.last_update > self.idle_timeout]:
+            del self._buffers[device_id]
+
+    def devices(self):
+        with self._lock:
+            self._evict_idle()
+            return list(self._buffers)
+
+    def snapshot(self, device_id, seconds=None):
+        """Columnar snapshot of a device's last ``seconds`` (None if unknown device)"""
+        with self._lock:
+            buf = self._buffers.get(device_id)
+            if buf is None:
+                return None
+            records = buf.ordered()
+
+        seconds = self.window_seconds if seconds is None else min(seconds, self.window_seconds)
+        if len(records):
+            records = records[records['t'] >= records['t'][-1] - seconds]
+        return {
+            'device_id': device_id,
+            't': records['t'].tolist(),
+            'bvp': records['bvp'].round(4).tolist(),
+            'temperature': records['temperature'].round(4).tolist(),
+            'eda': records['eda'].round(4).tolist(),
+            'acceleration_magnitude': records['acceleration_magnitude'].round(4).tolist(),
+            'prediction': [PREDICTION_LABELS[code] for code in records['prediction'].tolist()],
+        }
+
+    def snapshot_all(self, seconds=None, max_device_seconds=None):
+        """Snapshots of active devices, keyed by device_id.
+
+        With ``max_device_seconds``, devices x seconds stays within that budget:
+        the window is shortened to share it between the devices, down to one
+        second each for the most recently updated ones.
+        """
+        with self._lock:
+            self._evict_idle()
+            device_ids = sorted(self._buffers, key=lambda k: self._buffers[k].last_update, reverse=True)
+        seconds = self.window_seconds if seconds is None else min(seconds, self.window_seconds)
+        if max_device_seconds is not None and device_ids:
+            device_ids = device_ids[:max(1, int(max_device_seconds))]
+            seconds = min(seconds, max(1.0, max_device_seconds / len(device_ids)))
+
+        snapshots = {}
+        for device_id in device_ids:
+            snapshot = self.snapshot(device_id, seconds)
+            if snapshot is not None:
+                snapshots[device_id] = snapshot
+        return snapshots
@@ -0,0 +1,284 @@
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+# Channels kept per bucket, in the order they appear in bucket tuples
+CHANNELS = ('temperature', 'eda', 'bvp', 'acceleration_magnitude')
+NUM_CHANNELS = len(CHANNELS)
+
+# (bucket width in seconds, buckets retained)
+DEFAULT_RESOLUTIONS = (
+    (1, 3600),      # 1s buckets for the last hour
+    (10, 2160),     # 10s buckets for the last 6 hours
+    (60, 10080),    # 1min buckets for the last 7 days
+)
+DEFAULT_RAW_RETENTION = 30000  # raw samples kept for zoomed-in views
+# Finished sessions keep only resolutions at least this coarse
+COMPACT_WIDTH = 10
+
+
+class _Bucket:
+    """Open (still filling) bucket: per-channel min/max/sum plus counts"""
+
+    __slots__ = ('start', 'count', 'stressed', 'mins', 'maxs', 'sums')
+
+    def __init__(self, start, values, stressed):
+        self.start = start
+        self.count = 1
+        self.stressed = stressed
+        self.mins = list(values)
+        self.maxs = list(values)
+        self.sums = list(values)
+
+    def add(self, values, stressed):
+        self.count += 1
+        self.stressed += stressed
+        mins, maxs, sums = self.mins, self.maxs, self.sums
+        i = 0
+        for v in values:
+            if v < mins[i]:
+                mins[i] = v
+            if v > maxs[i]:
+                maxs[i] = v
+            sums[i] += v
+            i += 1
+
+    def freeze(self):
+        """Closed buckets are stored as flat tuples to keep them small"""
+        return (self.start, self.count, self.stressed, *self.mins, *self.maxs, *self.sums)
+
+
+class _Series:
+    """All resolutions plus the raw tail for one device or session"""
+
+    def __init__(self, resolutions, raw_retention):
+        self.resolutions = resolutions
+        self.open = [None] * len(resolutions)
+        self.closed = [deque(maxlen=retention) for _, retention in resolutions]
+        self.raw = deque(maxlen=raw_retention)
+        self.last_update = 0.0
+        self.compacted = False
+
+    def add(self, t, values, stressed):
+        self.last_update = time.monotonic()
+        if self.raw is not None:
+            self.raw.append((t, stressed, *values))
+        for i, (width, _) in enumerate(self.resolutions):
+            if self.closed[i] is None:
+                continue
+            start = t - (t % width)
+            bucket = self.open[i]
+            if bucket is not None and bucket.start == start:
+                bucket.add(values, stressed)
+                continue
+            if bucket is not None:
+                self.closed[i].append(bucket.freeze())
+            self.open[i] = _Bucket(start, values, stressed)
+
+    def buckets(self, i, start, end):
+        """Frozen buckets of resolution ``i`` overlapping [start, end]"""
+        width = self.resolutions[i][0]
+        rows = [b for b in self.closed[i] if b[0] + width > start and b[0] <= end]
+        if self.open[i] is not None and self.open[i].start + width > start and self.open[i].start <= end:
+            rows.append(self.open[i].freeze())
+        return rows
+
+    def covers(self, i, start):
+        """Whether resolution ``i`` (-1 for raw) holds everything from ``start`` on"""
+        history = self.raw if i < 0 else self.closed[i]
+        if history is None:
+            return False
+        if len(history) < history.maxlen:
+            return bool(history) or (i >= 0 and self.open[i] is not None)  # Nothing evicted yet
+        return history[0][0] <= start
+
+    def compact(self, min_width):
+        """Free the raw tail and every resolution finer than ``min_width`` seconds"""
+        self.raw = None
+        for i, (width, _) in enumerate(self.resolutions):
+            if width < min_width:
+                self.closed[i] = None
+                self.open[i] = None
+        self.compacted = True
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of ``threshold`` points that keep the shape of (x, y)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket is the third triangle vertex
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean() if next_hi > next_lo else x[-1]
+        avg_y = y[next_lo:next_hi].mean() if next_hi > next_lo else y[-1]
+        areas = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(areas)) if hi > lo else lo
+        selected[i + 1] = a
+    return selected
+
+
+class RollupStore:
+    """Incremental multi-resolution rollups of the reading stream.
+
+    Each reading updates the open bucket at every resolution in O(1), so
+    history queries read precomputed min/max/mean/count and stress ratio
+    instead of scanning raw samples. Memory per series is bounded by the
+    retention of each resolution and of the raw tail.
+
+    Session series (keys ``('session', id)``) are short-lived: once a
+    session is finished, or has had no readings for ``session_idle_timeout``
+    seconds, it is compacted to the resolutions of at least COMPACT_WIDTH
+    seconds, which hold a few kilobytes per hour of session, and dropped
+    after ``finished_timeout``. Other series are dropped after
+    ``idle_timeout``.
+    """
+
+    def __init__(self, resolutions=DEFAULT_RESOLUTIONS, raw_retention=DEFAULT_RAW_RETENTION, idle_timeout=7 * 24 * 3600,
+                 session_idle_timeout=900, finished_timeout=24 * 3600):
+        self.resolutions = resolutions
+        self.raw_retention = raw_retention
+        self.idle_timeout = idle_timeout
+        self.session_idle_timeout = session_idle_timeout
+        self.finished_timeout = finished_timeout
+        # Never compact away the coarsest resolution
+        self.compact_width = min(COMPACT_WIDTH, max(width for width, _ in resolutions))
+        self._series = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+    def add(self, keys, t, values, stressed):
+        """Record one reading (epoch seconds, CHANNELS values) under each series key"""
+        stressed = 1 if stressed else 0
+        with self._lock:
+            for key in keys:
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = _Series(self.resolutions, self.raw_retention)
+                series.add(t, values, stressed)
+            if time.monotonic() - self._last_eviction > 60:
+                self._evict_idle()
+
+    def finish(self, key):
+        """Compact a series that will get no more readings, e.g. an ended session"""
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None and not series.compacted:
+                series.compact(self.compact_width)
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        self._last_eviction = now
+        for key, series in list(self._series.items()):
+            idle = now - series.last_update
+            if series.compacted:
+                if idle > self.finished_timeout:
+                    del self._series[key]
+            elif key[0] == 'session':
+                if idle > self.session_idle_timeout:
+                    series.compact(self.compact_width)
+            elif idle > self.idle_timeout:
+                del self._series[key]
+
+    def history(self, key, start, end, max_points=500):
+        """Return columnar history for [start, end] within ``max_points``.
+
+        Raw samples are served, LTTB-downsampled if needed, while the raw tail
+        still covers the range. Otherwise the finest resolution that covers
+        the range within the point budget is used; if even the coarsest one
+        has too many buckets, adjacent buckets are merged.
+        """
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                return None
+
+            if series.covers(-1, start):
+                raw = [r for r in series.raw if start <= r[0] <= end]
+                return self._raw_response(raw, max_points)
+
+            chosen = None
+            for i, (width, _) in enumerate(self.resolutions):
+                if not series.covers(i, start):
+                    continue
+                chosen = i
+                if (end - start) / width <= max_points:
+                    break
+            if chosen is None:
+                # Nothing retained that far back: use the longest history available
+                chosen = len(self.resolutions) - 1
+            buckets = series.buckets(chosen, start, end)
+            width = self.resolutions[chosen][0]
+
+        return self._bucket_response(buckets, width, max_points)
+
+    def _raw_response(self, raw, max_points):
+        if not raw:
+            return {'resolution': 'raw', 't': []}
+        data = np.array(raw, dtype=np.float64)
+        # Shape is preserved on EDA, the most stress-relevant channel
+        idx = lttb_indices(data[:, 0], data[:, 2 + CHANNELS.index('eda')], max_points)
+        data = data[idx]
+        response = {'resolution': 'raw', 't': data[:, 0].tolist(), 'stressed': data[:, 1].astype(int).tolist()}
+        for c, name in enumerate(CHANNELS):
+            response[name] = data[:, 2 + c].tolist()
+        return response
+
+    def _bucket_response(self, buckets, width, max_points):
+        if not buckets:
+            return {'resolution': f"{width}s", 't': []}
+        data = np.array(buckets, dtype=np.float64)
+        group = int(np.ceil(len(data) / max_points))
+        if group > 1:
+            data = self._merge(data, group)
+            width *= group
+
+        counts = data[:, 1]
+        mins = data[:, 3:3 + NUM_CHANNELS]
+        maxs = data[:, 3 + NUM_CHANNELS:3 + 2 * NUM_CHANNELS]
+        sums = data[:, 3 + 2 * NUM_CHANNELS:]
+        response = {
+            'resolution': f"{width}s",
+            't': data[:, 0].tolist(),
+            'count': counts.astype(int).tolist(),
+            'stress_ratio': (data[:, 2] / counts).round(4).tolist(),
+        }
+        for c, name in enumerate(CHANNELS):
+            response[f"{name}_min"] = mins[:, c].tolist()
+            response[f"{name}_max"] = maxs[:, c].tolist()
+            response[f"{name}_mean"] = (sums[:, c] / counts).round(4).tolist()
+        return response
+
+    @staticmethod
+    def _merge(data, group):
+        """Combine every ``group`` consecutive buckets into one"""
+        n = len(data)
+        starts = np.arange(0, n, group)
+        merged = np.empty((len(starts), data.shape[1]))
+        merged[:, 0] = data[starts, 0]
+        merged[:, 1] = np.add.reduceat(data[:, 1], starts)
+        merged[:, 2] = np.add.reduceat(data[:, 2], starts)
+        lo = 3
+        merged[:, lo:lo + NUM_CHANNELS] = np.minimum.reduceat(data[:, lo:lo + NUM_CHANNELS], starts)
+        lo += NUM_CHANNELS
+        merged[:, lo:lo + NUM_CHANNELS] = np.maximum.reduceat(data[:, lo:lo + NUM_CHANNELS], starts)
+        lo += NUM_CHANNELS
+        merged[:, lo:] = np.add.reduceat(data[:, lo:], starts)
+        return merged
+
+    def get_status(self):
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'compacted': sum(1 for series in self._series.values() if series.compacted),
+                'resolutions': [f"{width}s" for width, _ in self.resolutions],
+            }
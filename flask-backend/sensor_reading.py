@@ -0,0 +1,126 @@
+import math
+import struct
+import threading
+
+import numpy as np
+
+try:
+    # Under eventlet, threading.local is per green thread, which would give
+    # every HTTP request its own buffer. Buffers only need to be per OS thread
+    # because nothing yields between filling a buffer and consuming it.
+    from eventlet.patcher import original as _original
+    _BufferLocal = _original('threading').local
+except ImportError:
+    _BufferLocal = threading.local
+
+# Model input order, as used during training
+FEATURE_ORDER = ('EDA', 'TEMP', 'ACC_Mag', 'BVP')
+NUM_FEATURES = len(FEATURE_ORDER)
+
+# Packs one float32 feature row straight into a NumPy buffer. For four values
+# this is an order of magnitude cheaper than building and scaling an ndarray.
+_pack_features = struct.Struct(f'={NUM_FEATURES}f').pack_into
+
+
+class SensorReading:
+    """Compact representation of a single sensor reading"""
+
+    __slots__ = ('bvp', 'temperature', 'eda', 'acc_x', 'acc_y', 'acc_z', 'acc_mag', 'device_id')
+
+    def __init__(self, bvp=0.0, temperature=0.0, eda=0.0, acc_x=0.0, acc_y=0.0, acc_z=0.0, acc_mag=None,
+                 device_id=None):
+        self.bvp = bvp
+        self.temperature = temperature
+        self.eda = eda
+        self.acc_x = acc_x
+        self.acc_y = acc_y
+        self.acc_z = acc_z
+        # Magnitude is either reported directly or derived from the components
+        self.acc_mag = math.hypot(acc_x, acc_y, acc_z) if acc_mag is None else acc_mag
+        self.device_id = device_id
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a reading from a JSON-style dict (HTTP or serial JSON)"""
+        get = data.get
+        acceleration = get('acceleration')
+        if isinstance(acceleration, dict):
+            acc_get = acceleration.get
+            return cls(
+                float(get('bvp', 0)),
+                float(get('temperature', 0)),
+                float(get('eda', 0)),
+                float(acc_get('x', 0)),
+                float(acc_get('y', 0)),
+                float(acc_get('z', 0)),
+                device_id=get('device_id'),
+            )
+        return cls(
+            float(get('bvp', 0)),
+            float(get('temperature', 0)),
+            float(get('eda', 0)),
+            acc_mag=float(get('acceleration_magnitude', 0)),
+            device_id=get('device_id'),
+        )
+
+    @classmethod
+    def from_csv(cls, line):
+        """Build a reading from an ESP32 CSV line, or return None if incomplete.
+
+        Expected format: "bvp,temperature,acc_x,acc_y,acc_z"
+        """
+        values = line.strip().split(',')
+        if len(values) < 5:
+            return None
+        acc_x = float(values[2])
+        return cls(
+            float(values[0]) if values[0] != 'No prediction' else 0.0,
+            float(values[1]),
+            acc_x,  # The ESP32 has no separate EDA channel in CSV mode
+            acc_x,
+            float(values[3]),
+            float(values[4]),
+        )
+
+    def features(self):
+        """Return the raw features as a tuple in model input order"""
+        return (self.eda, self.temperature, self.acc_mag, self.bvp)
+
+    def write_scaled_features(self, buf, mean, inv_std):
+        """Write standardized features into ``buf`` in model input order.
+
+        ``buf`` is a C-contiguous float32 array such as feature_buffer();
+        ``mean`` and ``inv_std`` are plain float sequences in FEATURE_ORDER.
+        """
+        _pack_features(
+            buf, 0,
+            (self.eda - mean[0]) * inv_std[0],
+            (self.temperature - mean[1]) * inv_std[1],
+            (self.acc_mag - mean[2]) * inv_std[2],
+            (self.bvp - mean[3]) * inv_std[3],
+        )
+        return buf
+
+    def to_payload(self, prediction, timestamp, source):
+        """Build the WebSocket payload for this reading"""
+        return {
+            'bvp': self.bvp,
+            'temperature': self.temperature,
+            'eda': self.eda,
+            'acceleration_magnitude': round(self.acc_mag, 4),
+            'prediction': prediction,
+            'timestamp': timestamp,
+            'source': source,
+            'device_id': self.device_id,
+        }
+
+
+_buffers = _BufferLocal()
+
+
+def feature_buffer():
+    """Return this thread's reusable (1, NUM_FEATURES) float32 model input buffer"""
+    buf = getattr(_buffers, 'features', None)
+    if buf is None:
+        buf = _buffers.features = np.zeros((1, NUM_FEATURES), dtype=np.float32)
+    return buf
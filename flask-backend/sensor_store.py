@@ -0,0 +1,499 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import queue as queue_module
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Flushing runs in real OS threads so blocking database drivers never
+    # stall the eventlet hub; they need the unpatched primitives.
+    from eventlet.patcher import original as _original
+    _threading = _original('threading')
+    _queue = _original('queue')
+except ImportError:
+    _threading = threading
+    _queue = queue_module
+
+# Columns of public.session_sensor_data written by the backend, in row order
+COLUMNS = ('session_id', 'timestamp', 'temperature', 'gsr', 'prediction', 'device_id')
+
+
+def is_session_id(value):
+    """session_sensor_data.session_id is a UUID referencing test_sessions"""
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+def _is_rejected(error):
+    """True for errors about the rows themselves, which retrying cannot fix.
+
+    DataError and IntegrityError are DB-API exceptions that psycopg2 and
+    sqlite3 both define (e.g. an invalid UUID or a missing session).
+    """
+    return any(cls.__name__ in ('DataError', 'IntegrityError') for cls in type(error).__mro__)
+
+
+def _rollback(conn):
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+
+def _filters(placeholder, session_id, device_id, start, end):
+    """WHERE clause and parameters shared by the backends' range queries"""
+    clauses, params = [], []
+    for column, op, value in (('session_id', '=', session_id), ('device_id', '=', device_id),
+                              ('timestamp', '>=', start), ('timestamp', '<=', end)):
+        if value is not None:
+            clauses.append(f"{column} {op} {placeholder}")
+            params.append(value)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    return where, params
+
+
+class PostgresBackend:
+    """Writes rows to PostgreSQL with multi-row INSERT statements"""
+
+    def __init__(self, dsn, table='public.session_sensor_data'):
+        self.dsn = dsn
+        self.table = table
+
+    def connect(self):
+        import psycopg2
+        return psycopg2.connect(self.dsn)
+
+    def insert_rows(self, conn, rows):
+        from psycopg2.extras import execute_values
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                f"INSERT INTO {self.table} ({', '.join(COLUMNS)}) VALUES %s",
+                rows,
+                page_size=len(rows)
+            )
+        conn.commit()
+
+    def iter_rows(self, conn, session_id=None, device_id=None, start=None, end=None, chunk_size=10000):
+        """Yield lists of up to ``chunk_size`` rows (COLUMNS order) by timestamp.
+
+        Uses a server-side cursor, so memory stays constant for any range.
+        """
+        where, params = _filters('%s', session_id, device_id, start, end)
+        with conn.cursor(name='session_sensor_data_export') as cur:
+            cur.itersize = chunk_size
+            cur.execute(f"SELECT {', '.join(COLUMNS)} FROM {self.table}{where} ORDER BY timestamp", params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                # timestamptz comes back as datetime; export it as ISO 8601 like SQLite
+                yield [(r[0], r[1].isoformat() if hasattr(r[1], 'isoformat') else r[1], *r[2:]) for r in rows]
+        conn.commit()
+
+
+class SQLiteBackend:
+    """Local SQLite stand-in with the same columns, for development and tests"""
+
+    def __init__(self, path, table='session_sensor_data'):
+        self.path = path
+        self.table = table
+
+    def connect(self):
+        import sqlite3
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, timestamp TEXT NOT NULL, "
+            "heart_rate REAL, temperature REAL, gsr REAL, stress_level REAL, prediction TEXT, device_id TEXT, "
+            "created_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+        )
+        return conn
+
+    def insert_rows(self, conn, rows):
+        placeholders = ', '.join('?' for _ in COLUMNS)
+        with conn:
+            conn.executemany(f"INSERT INTO {self.table} ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows)
+
+    def iter_rows(self, conn, session_id=None, device_id=None, start=None, end=None, chunk_size=10000):
+        """Yield lists of up to ``chunk_size`` rows (COLUMNS order) by timestamp"""
+        # Timestamps are stored as ISO 8601 text, which sorts and compares correctly
+        start = start.isoformat() if start is not None else None
+        end = end.isoformat() if end is not None else None
+        where, params = _filters('?', session_id, device_id, start, end)
+        cur = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM {self.table}{where} ORDER BY timestamp", params)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+
+def backend_from_url(url):
+    """Build a backend from 'postgresql://...' or 'sqlite:///path/to.db'"""
+    if url.startswith(('postgres://', 'postgresql://')):
+        return PostgresBackend(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported database URL: {url}")
+
+
+class DiskSpool:
+    """Append-only NDJSON file holding rows the database could not take in time.
+
+    take() moves the spool aside as the replay file. The replay is read from
+    a saved byte offset and advance() moves that offset past each delivered
+    batch, so a replay that fails resumes where it stopped, without reading
+    back or rewriting what came before. ``rows`` counts everything not yet
+    delivered, in both files.
+    """
+
+    def __init__(self, path, decode=tuple):
+        self.path = path
+        self.decode = decode  # Applied to each JSON row read back
+        self.replay_path = f"{path}.replay"
+        self.offset_path = f"{self.replay_path}.offset"
+        self._lock = _threading.Lock()
+        self.replay_offset = 0
+        self.rows = 0
+        if os.path.exists(self.replay_path):
+            # Leftover from an interrupted replay: it is older than the spool, so take() returns it first
+            self.replay_offset = self._load_offset()
+            self.rows += self._count_lines(self.replay_path, self.replay_offset)
+        if os.path.exists(path):
+            self.rows += self._count_lines(path)
+
+    @staticmethod
+    def _count_lines(path, offset=0):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return sum(1 for _ in f)
+
+    def _load_offset(self):
+        try:
+            with open(self.offset_path) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def append(self, rows):
+        with self._lock:
+            with open(self.path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps(row))
+                    f.write('\n')
+            self.rows += len(rows)
+
+    def take(self):
+        """Path of the rows to replay next, or None if nothing is spooled.
+
+        A replay file that was set aside but not fully replayed yet (the
+        writers were busy, or the connection failed) is returned again;
+        otherwise the spool is moved aside as the new replay file.
+        """
+        with self._lock:
+            if os.path.exists(self.replay_path):
+                return self.replay_path
+            if self.rows == 0 or not os.path.exists(self.path):
+                return None
+            os.replace(self.path, self.replay_path)
+            self.replay_offset = 0
+            return self.replay_path
+
+    def read_batches(self, path, batch_size):
+        """Yield (rows, lines read, end offset) from where the last replay stopped"""
+        with open(path, 'rb') as f:
+            f.seek(self.replay_offset)
+            offset = self.replay_offset
+            batch, lines = [], 0
+            for line in f:
+                offset += len(line)
+                lines += 1
+                try:
+                    batch.append(self.decode(json.loads(line)))
+                except ValueError:
+                    # Cut short by a crash while appending
+                    logger.warning(f"Skipping unreadable spooled row in {path}")
+                if len(batch) >= batch_size:
+                    yield batch, lines, offset
+                    batch, lines = [], 0
+            if lines:
+                yield batch, lines, offset
+
+    def advance(self, offset, lines):
+        """Record that the replay file has been delivered up to ``offset``"""
+        with self._lock:
+            self.replay_offset = offset
+            self.rows -= lines
+            tmp_path = f"{self.offset_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(str(offset))
+            os.replace(tmp_path, self.offset_path)
+
+    def finish_replay(self):
+        """Drop the fully replayed file"""
+        with self._lock:
+            for path in (self.replay_path, self.offset_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.replay_offset = 0
+
+
+class SessionDataWriter:
+    """Buffers readings per session and writes them in batches.
+
+    ``submit`` only appends to an in-memory buffer, so ingestion never waits
+    on the database. A dispatcher thread cuts a session's buffer into a batch
+    once it holds ``batch_size`` rows or its oldest row is ``flush_interval``
+    seconds old. ``pool_size`` writer threads, each owning one connection,
+    insert the batches. When the database is slow or down, batches go to a
+    disk spool instead of piling up in memory, and are replayed in order
+    once writes succeed again. Rows the database rejects as invalid are
+    split out of their batch and moved to a dead-letter file
+    (``<spool_path>.rejected``), so they never hold up the rows around them.
+    """
+
+    def __init__(self, backend, spool_path, batch_size=500, flush_interval=1.0, pool_size=2, max_pending_batches=8):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pool_size = pool_size
+        self.spool = DiskSpool(spool_path)
+        self.rejected_path = f"{spool_path}.rejected"
+        self._rejected_lock = _threading.Lock()
+
+        self._buffers = {}        # session_id -> deque of rows
+        self._first_seen = {}     # session_id -> monotonic time of oldest buffered row
+        self._lock = _threading.Lock()
+        self._wake = _threading.Event()
+        self.max_pending_batches = max_pending_batches
+        self._batches = _queue.Queue(maxsize=max_pending_batches)
+        # Set while a replay task is queued or running, so it is queued only once
+        self._replay_queued = False
+        self._threads = []
+        self._running = False
+        self._healthy = True
+        # After a failure, spooled rows are retried with exponential backoff
+        self._retry_delay = 1.0
+        self._retry_at = 0.0
+        self._stats_lock = _threading.Lock()
+
+        self.stats = {
+            'rows_submitted': 0,
+            'rows_written': 0,
+            'batches_written': 0,
+            'rows_spooled': 0,
+            'rows_replayed': 0,
+            'rows_rejected': 0,
+            'write_failures': 0,
+            'last_error': None,
+        }
+
+    def submit(self, session_id, timestamp, temperature, gsr, prediction, device_id):
+        """Queue one row for session_sensor_data (non-blocking); False if the session id is invalid"""
+        row = (session_id, timestamp, temperature, gsr, prediction, device_id)
+        with self._lock:
+            buf = self._buffers.get(session_id)
+            if buf is None:
+                if not is_session_id(session_id):
+                    self.stats['rows_rejected'] += 1
+                    return False
+                buf = self._buffers[session_id] = deque()
+                self._first_seen[session_id] = time.monotonic()
+            buf.append(row)
+            self.stats['rows_submitted'] += 1
+            full = len(buf) >= self.batch_size
+        if full:
+            self._wake.set()
+        return True
+
+    def start(self):
+        self._running = True
+        self._threads = [_threading.Thread(target=self._dispatch_loop, name='sensor-store-dispatch', daemon=True)]
+        for i in range(self.pool_size):
+            self._threads.append(_threading.Thread(target=self._write_loop, name=f'sensor-store-writer-{i}', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Session data writer started ({self.pool_size} connection(s), batch size {self.batch_size})")
+
+    def stop(self, timeout=5):
+        """Flush everything still buffered, then stop the threads"""
+        self._running = False
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        logger.info("Session data writer stopped")
+
+    def _cut_batches(self, force=False):
+        """Take every buffer that is full or old enough, split into batches"""
+        now = time.monotonic()
+        batches = []
+        with self._lock:
+            for session_id in list(self._buffers):
+                buf = self._buffers[session_id]
+                if not (force or len(buf) >= self.batch_size or
+                        now - self._first_seen[session_id] >= self.flush_interval):
+                    continue
+                del self._buffers[session_id]
+                del self._first_seen[session_id]
+                rows = list(buf)
+                batches.extend(rows[i:i + self.batch_size] for i in range(0, len(rows), self.batch_size))
+        return batches
+
+    def _dispatch_loop(self):
+        while self._running:
+            self._wake.wait(self.flush_interval / 2)
+            self._wake.clear()
+            self._dispatch(self._cut_batches())
+            if (not self._replay_queued and self._batches.empty()
+                    and (self._healthy or time.monotonic() >= self._retry_at)):
+                replay_path = self.spool.take()
+                if replay_path:
+                    self._put(('replay', replay_path))
+
+        # Final flush: anything left goes through the writers, or the spool
+        self._dispatch(self._cut_batches(force=True))
+        for _ in range(self.pool_size):
+            self._batches.put(None)
+
+    def _dispatch(self, batches):
+        for batch in batches:
+            if not self._healthy:
+                self._spool(batch)
+            else:
+                self._put(('rows', batch))
+
+    def _put(self, task):
+        try:
+            self._batches.put_nowait(task)
+            if task[0] == 'replay':
+                self._replay_queued = True
+        except _queue.Full:
+            # Writers are behind: keep memory bounded by spooling to disk.
+            # A replay file simply stays where it is and is taken again later.
+            if task[0] == 'rows':
+                self._spool(task[1])
+
+    def _spool(self, rows):
+        self.spool.append(rows)
+        self._count('rows_spooled', len(rows))
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _write_loop(self):
+        conn = None
+        while True:
+            task = self._batches.get()
+            if task is None:
+                break
+            kind, payload = task
+            try:
+                if conn is None:
+                    conn = self.backend.connect()
+                if kind == 'rows':
+                    self._write_checked(conn, payload)
+                else:
+                    conn = self._replay(conn, payload)
+            except Exception as e:
+                self._record_failure(e, probe=(kind == 'replay'))
+                if kind == 'rows':
+                    self._spool(payload)
+                conn = self._close(conn)
+            finally:
+                if kind == 'replay':
+                    self._replay_queued = False
+        self._close(conn)
+
+    def _write(self, conn, rows):
+        self.backend.insert_rows(conn, rows)
+        self._count('rows_written', len(rows))
+        self._count('batches_written')
+        self._healthy = True
+        self._retry_delay = 1.0
+
+    def _write_checked(self, conn, rows):
+        """Write rows, moving any the database rejects to the dead-letter file.
+
+        A rejected batch is split in halves until the bad rows are isolated,
+        so the valid rows around them are still written.
+        """
+        try:
+            self._write(conn, rows)
+        except Exception as e:
+            if not _is_rejected(e):
+                raise
+            _rollback(conn)
+            if len(rows) == 1:
+                self._reject(rows[0], e)
+                return
+            middle = len(rows) // 2
+            self._write_checked(conn, rows[:middle])
+            self._write_checked(conn, rows[middle:])
+
+    def _reject(self, row, error):
+        with self._rejected_lock:
+            with open(self.rejected_path, 'a') as f:
+                f.write(json.dumps({'row': list(row), 'error': str(error), 'time': time.time()}))
+                f.write('\n')
+        self._count('rows_rejected')
+        logger.warning(f"Sensor data row rejected by the database, moved to {self.rejected_path}: {error}")
+
+    def _replay(self, conn, path):
+        """Insert spooled rows in order; the first failure ends it, and the next replay resumes there"""
+        for batch, lines, offset in self.spool.read_batches(path, self.batch_size):
+            try:
+                if batch:
+                    self._write_checked(conn, batch)
+            except Exception as e:
+                self._record_failure(e, probe=True)
+                return self._close(conn)
+            self.spool.advance(offset, lines)
+            self._count('rows_replayed', len(batch))
+        self.spool.finish_replay()
+        logger.info("Spooled sensor data replayed")
+        return conn
+
+    def _record_failure(self, error, probe=False):
+        """Mark the database unhealthy; failed replays back off exponentially"""
+        was_healthy = self._healthy
+        self._healthy = False
+        if was_healthy or probe:
+            self._retry_at = time.monotonic() + self._retry_delay
+        if probe:
+            self._retry_delay = min(self._retry_delay * 2, 30.0)
+        self._count('write_failures')
+        self.stats['last_error'] = str(error)
+        logger.error(f"Failed to write sensor data batch: {error}")
+
+    def _close(self, conn):
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return None
+
+    def get_status(self):
+        with self._lock:
+            buffered = sum(len(buf) for buf in self._buffers.values())
+        return dict(
+            self.stats,
+            healthy=self._healthy,
+            buffered_rows=buffered,
+            pending_batches=self._batches.qsize(),
+            spooled_rows=self.spool.rows,
+        )
@@ -1,49 +1,191 @@
 import serial
 import json
+import queue
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import logging
 import threading
 from serial_manager import SerialManager
+from sensor_store import DiskSpool
 
 logger = logging.getLogger(__name__)
 
+
+class _RetryLater(Exception):
+    """The backend is unreachable or overloaded; keep the batch for later"""
+
+
+class BatchingForwarder:
+    """Forwards readings to the backend's bulk endpoint from a sender thread.
+
+    Readings are queued without blocking the serial reader, then sent in
+    batches of up to ``batch_size`` or every ``flush_interval`` seconds over
+    a pooled keep-alive session. While the backend is unreachable, batches
+    are appended to an NDJSON spool file and replayed in order, with
+    exponential backoff, before anything newer is sent.
+
+    Device commands returned by the backend (e.g. sampling-rate changes) are
+    passed to ``on_command(device_id, command)``.
+    """
+
+    def __init__(self, flask_url, batch_size=200, flush_interval=0.5, spool_path='serial_spool.ndjson',
+                 timeout=10, max_pending=50000, on_command=None):
+        self.url = f"{flask_url}/api/sensor-data/batch"
+        self.on_command = on_command
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.spool = DiskSpool(spool_path, decode=dict)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._running = False
+        self._thread = None
+        self._retry_at = 0.0
+        self._retry_delay = 1.0
+        self.stats = {'sent': 0, 'batches': 0, 'spooled': 0, 'replayed': 0, 'rejected': 0}
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='batching-forwarder', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Send (or spool) everything still queued, then stop"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=self.timeout + 5)
+
+    def submit(self, data):
+        """Queue one reading; never blocks the caller"""
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            # Sender is far behind: keep the reading on disk rather than in memory
+            self.spool.append([data])
+            self.stats['spooled'] += 1
+
+    def _collect(self):
+        """Wait for up to one batch, ending early when the time window closes"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self._running or not self._queue.empty():
+            batch = self._collect()
+            if self.spool.rows and time.monotonic() >= self._retry_at:
+                self._replay()
+            if batch:
+                self._send_or_spool(batch)
+
+    def _post(self, batch):
+        try:
+            response = self.session.post(self.url, json={'readings': batch}, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise _RetryLater(str(e))
+        if response.status_code >= 500 or response.status_code in (408, 429):
+            raise _RetryLater(f"status {response.status_code}")
+        if response.status_code != 200:
+            # Retrying would fail the same way; don't let one bad batch block the rest
+            logger.error(f"Backend rejected a batch of {len(batch)} readings: {response.status_code} {response.text[:200]}")
+            self.stats['rejected'] += len(batch)
+            return
+        self.stats['sent'] += len(batch)
+        self.stats['batches'] += 1
+        if self.on_command:
+            for device_id, command in response.json().get('commands', {}).items():
+                self.on_command(device_id, command)
+
+    def _send_or_spool(self, batch):
+        # Older readings are still spooled: queue behind them to keep the order
+        if self.spool.rows:
+            self._spool(batch)
+            return
+        try:
+            self._post(batch)
+            self._retry_delay = 1.0
+        except _RetryLater as e:
+            logger.warning(f"Backend unavailable ({e}), spooling readings")
+            self._spool(batch)
+            self._back_off()
+
+    def _spool(self, batch):
+        self.spool.append(batch)
+        self.stats['spooled'] += len(batch)
+
+    def _back_off(self):
+        self._retry_at = time.monotonic() + self._retry_delay
+        self._retry_delay = min(self._retry_delay * 2, 60.0)
+
+    def _replay(self):
+        """Send spooled readings oldest first; the first failure ends it, and the next replay resumes there"""
+        path = self.spool.take()
+        if not path:
+            return
+        for batch, lines, offset in self.spool.read_batches(path, self.batch_size):
+            try:
+                if batch:
+                    self._post(batch)
+            except _RetryLater as e:
+                logger.warning(f"Replay failed ({e}), retrying in {self._retry_delay:.0f}s")
+                self._back_off()
+                return
+            self.spool.advance(offset, lines)
+            self.stats['replayed'] += len(batch)
+        self.spool.finish_replay()
+        self._retry_delay = 1.0
+        logger.info("Spooled readings replayed")
+
+    def get_status(self):
+        return dict(self.stats, pending=self._queue.qsize(), spooled_pending=self.spool.rows)
+
+
 class StandaloneSerialListener:
     """Standalone serial listener that posts to Flask backend"""
     
-    def __init__(self, flask_url='http://localhost:5000'):
+    def __init__(self, flask_url='http://localhost:5000', **forwarder_options):
         self.flask_url = flask_url
         self.serial_manager = SerialManager(
             data_callback=self.send_to_flask
         )
+        # Only one device is attached, so commands go to it whatever the device_id
+        self.forwarder = BatchingForwarder(
+            flask_url,
+            on_command=lambda device_id, command: self.serial_manager.send_command(command),
+            **forwarder_options
+        )
     
     def send_to_flask(self, data):
-        """Send parsed data to Flask backend via HTTP POST"""
-        try:
-            response = requests.post(
-                f"{self.flask_url}/api/sensor-data",
-                json=data,
-                headers={'Content-Type': 'application/json'},
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.info("Data successfully sent to Flask backend")
-            else:
-                logger.error(f"Flask backend returned status {response.status_code}")
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to send data to Flask backend: {e}")
+        """Queue parsed data for the next batch upload to the Flask backend"""
+        self.forwarder.submit(data)
     
     def start(self):
         """Start the standalone serial listener"""
         logger.info("Starting standalone serial listener...")
+        self.forwarder.start()
         self.serial_manager.start()
     
     def stop(self):
         """Stop the standalone serial listener"""
         logger.info("Stopping standalone serial listener...")
         self.serial_manager.stop()
+        self.forwarder.stop()
+        logger.info(f"Forwarder stats: {self.forwarder.get_status()}")
 
 # Example usage
 if __name__ == "__main__":
@@ -2,14 +2,40 @@ import serial
 import serial.tools.list_ports
 import json
 import time
+import random
 import threading
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+try:
+    from eventlet import patcher as _patcher, tpool as _tpool
+except ImportError:
+    _patcher = None
+
+
+def _list_ports():
+    """comports(), in a real OS thread under eventlet (app.py) so its blocking I/O doesn't stall the hub"""
+    if _patcher is not None and _patcher.is_monkey_patched('thread'):
+        return _tpool.execute(serial.tools.list_ports.comports)
+    return serial.tools.list_ports.comports()
+
+# Supervisor states
+STOPPED = 'stopped'
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+BACKOFF = 'backoff'
+
 class SerialManager:
-    """Enhanced serial manager for ESP32 USB communication"""
+    """Enhanced serial manager for ESP32 USB communication.
+
+    A supervisor thread runs connect -> listen -> backoff as a loop (never
+    recursing), retrying forever with jittered exponential backoff. A
+    hotplug watcher diffs the port list, keeps the discovery result cached
+    for status requests and wakes the supervisor as soon as a candidate
+    port appears.
+    """
     
     def __init__(self, data_callback=None, socketio_instance=None):
         self.data_callback = data_callback
@@ -19,18 +45,28 @@ class SerialManager:
             'baudrate': 115200,
             'timeout': 1,
             'auto_detect': True,
-            'enabled': True
+            'enabled': True,
+            'backoff_initial': 0.5,   # Seconds before the first retry
+            'backoff_max': 30.0,
+            'hotplug_interval': 1.0  # Seconds between port list scans
         }
         
         self.serial_conn = None
         self.is_running = False
+        self.state = STOPPED
         self.connection_thread = None
+        self.hotplug_thread = None
         self.reconnect_attempts = 0
-        self.max_reconnect_attempts = 5
-        
-    def find_esp32_ports(self):
-        """Auto-detect potential ESP32 ports"""
-        ports = serial.tools.list_ports.comports()
+        self.last_received = None
+        self.last_error = None
+        self._wake = threading.Event()
+        # Cached discovery, refreshed by the hotplug watcher
+        self._known_ports = set()
+        self.available_ports = []
+
+    @staticmethod
+    def _esp32_candidates(ports):
+        """Filter comports() results down to likely ESP32 devices"""
         esp32_ports = []
         
         for port in ports:
@@ -39,29 +75,53 @@ class SerialManager:
             if any(keyword in description for keyword in 
                    ['esp32', 'cp210x', 'ch340', 'ftdi', 'usb-serial', 'silicon labs']):
                 esp32_ports.append(port.device)
+        return esp32_ports
+
+    @staticmethod
+    def _fallback_ports():
+        """Usual ESP32 port names per platform, for adapters without a known description"""
+        import platform
+        system = platform.system().lower()
+        if system == 'linux':
+            return ['/dev/ttyUSB0', '/dev/ttyUSB1', '/dev/ttyACM0', '/dev/ttyACM1']
+        elif system == 'windows':
+            return ['COM3', 'COM4', 'COM5', 'COM6','COM13']
+        elif system == 'darwin':  # macOS
+            return ['/dev/cu.usbserial-0001', '/dev/cu.SLAB_USBtoUART']
+        return []
+
+    def find_esp32_ports(self):
+        """Auto-detect potential ESP32 ports (enumerates devices; see available_ports for the cache)"""
+        esp32_ports = self._esp32_candidates(_list_ports())
         
         # Platform-specific fallbacks
         if not esp32_ports:
-            import platform
-            system = platform.system().lower()
-            if system == 'linux':
-                esp32_ports = ['/dev/ttyUSB0', '/dev/ttyUSB1', '/dev/ttyACM0', '/dev/ttyACM1']
-            elif system == 'windows':
-                esp32_ports = ['COM3', 'COM4', 'COM5', 'COM6','COM13']
-            elif system == 'darwin':  # macOS
-                esp32_ports = ['/dev/cu.usbserial-0001', '/dev/cu.SLAB_USBtoUART']
+            esp32_ports = self._fallback_ports()
         
         return esp32_ports
+
+    def _detected_ports(self):
+        """Candidate ports among those the hotplug watcher last saw; never enumerates"""
+        return self.available_ports or [port for port in self._fallback_ports() if port in self._known_ports]
     
+    @property
+    def port(self):
+        return self.config['port']
+
     def connect(self):
         """Establish serial connection"""
         try:
-            # Auto-detect port if enabled
+            # Auto-detect port if enabled; discovery is left to the hotplug watcher
             if self.config['auto_detect']:
-                detected_ports = self.find_esp32_ports()
+                detected_ports = self._detected_ports()
                 if detected_ports:
                     self.config['port'] = detected_ports[0]
                     logger.info(f"Auto-detected ESP32 port: {self.config['port']}")
+                elif self.config['port'] not in self._known_ports:
+                    # Nothing plugged in: wait for the watcher instead of probing
+                    self.last_error = f"No ESP32 port found ({self.config['port']} is not present)"
+                    logger.debug(self.last_error)
+                    return False
             
             # Attempt connection
             self.serial_conn = serial.Serial(
@@ -72,6 +132,7 @@ class SerialManager:
             
             logger.info(f"Connected to ESP32 on {self.config['port']} at {self.config['baudrate']} baud")
             self.reconnect_attempts = 0
+            self.last_error = None
             
             # Notify via SocketIO if available
             if self.socketio:
@@ -85,6 +146,7 @@ class SerialManager:
             
         except Exception as e:
             logger.error(f"Failed to connect to {self.config['port']}: {e}")
+            self.last_error = str(e)
             
             # Notify via SocketIO if available
             if self.socketio:
@@ -98,9 +160,11 @@ class SerialManager:
     
     def disconnect(self):
         """Disconnect from serial port"""
-        self.is_running = False
         if self.serial_conn and self.serial_conn.is_open:
-            self.serial_conn.close()
+            try:
+                self.serial_conn.close()
+            except Exception as e:
+                logger.debug(f"Error closing serial port: {e}")
             logger.info("Disconnected from ESP32")
             
             # Notify via SocketIO if available
@@ -111,7 +175,7 @@ class SerialManager:
                 })
     
     def listen_loop(self):
-        """Main listening loop for serial data"""
+        """Read lines until the port fails or the manager stops"""
         while self.is_running:
             try:
                 if self.serial_conn and self.serial_conn.is_open:
@@ -119,10 +183,14 @@ class SerialManager:
                         line = self.serial_conn.readline().decode('utf-8').strip()
                         
                         if line:
+                            self.last_received = datetime.now().isoformat()
                             try:
                                 # Try to parse as JSON
                                 data = json.loads(line)
                                 data['timestamp'] = datetime.now().isoformat()
+                                # Read time, for latency tracing (also forwarded by serial_listener.py)
+                                data['rx_ts'] = time.time()
+                                data.setdefault('device_id', self.config['port'])
                                 
                                 logger.info(f"Received serial data: {data.get('prediction', 'No prediction')}")
                                 
@@ -133,30 +201,77 @@ class SerialManager:
                             except json.JSONDecodeError:
                                 # Handle non-JSON data
                                 logger.debug(f"Received non-JSON data: {line}")
+                else:
+                    # Closed underneath us (e.g. the hotplug watcher saw it unplugged)
+                    return
                 
                 time.sleep(0.01)  # Small delay to prevent CPU overload
                 
-            except serial.SerialException as e:
+            except (serial.SerialException, OSError) as e:
+                # Unplugged or closed: the supervisor reconnects
                 logger.error(f"Serial error: {e}")
-                self.handle_disconnection()
-                break
+                self.last_error = str(e)
+                return
             except Exception as e:
                 logger.error(f"Unexpected error in listen loop: {e}")
                 time.sleep(1)
-    
-    def handle_disconnection(self):
-        """Handle disconnection and attempt reconnection"""
-        self.disconnect()
-        
-        if self.reconnect_attempts < self.max_reconnect_attempts:
-            self.reconnect_attempts += 1
-            logger.info(f"Attempting reconnection {self.reconnect_attempts}/{self.max_reconnect_attempts}")
-            
-            time.sleep(5)  # Wait before reconnecting
+
+    def _backoff_delay(self):
+        """Jittered exponential backoff for the current attempt count"""
+        delay = min(self.config['backoff_max'],
+                    self.config['backoff_initial'] * 2 ** (self.reconnect_attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _supervise(self):
+        """Connect, listen, back off, repeat until stopped"""
+        while self.is_running:
+            self.state = CONNECTING
             if self.connect():
+                self.state = CONNECTED
                 self.listen_loop()
-        else:
-            logger.error("Max reconnection attempts reached. Serial connection stopped.")
+                self.disconnect()
+                if not self.is_running:
+                    break
+
+            self.reconnect_attempts += 1
+            delay = self._backoff_delay()
+            self.state = BACKOFF
+            logger.info(f"Reconnecting in {delay:.1f}s (attempt {self.reconnect_attempts})")
+            # Cut short by stop() or by the hotplug watcher seeing a candidate port
+            self._wake.wait(delay)
+            self._wake.clear()
+        self.state = STOPPED
+
+    def _scan_ports(self):
+        """Diff the port list against the last scan and refresh the discovery cache"""
+        ports = _list_ports()
+        devices = {port.device for port in ports}
+        added = devices - self._known_ports
+        removed = self._known_ports - devices
+        self._known_ports = devices
+        if not added and not removed:
+            return
+
+        self.available_ports = self._esp32_candidates(ports)
+        for device in sorted(removed):
+            logger.info(f"Serial port removed: {device}")
+            if device == self.config['port'] and self.is_connected():
+                # Don't wait for the read to fail
+                self.disconnect()
+        for device in sorted(added):
+            logger.info(f"Serial port added: {device}")
+        candidates = [*self._detected_ports(), self.config['port']] if self.config['auto_detect'] else [self.config['port']]
+        if self.state == BACKOFF and any(device in candidates for device in added):
+            self.reconnect_attempts = 0
+            self._wake.set()
+
+    def _watch_hotplug(self):
+        while self.is_running:
+            try:
+                self._scan_ports()
+            except Exception as e:
+                logger.debug(f"Port scan failed: {e}")
+            time.sleep(self.config['hotplug_interval'])
     
     def send_command(self, message):
         """Send command to ESP32 via serial"""
@@ -179,21 +294,29 @@ class SerialManager:
             return
         
         self.is_running = True
-        
-        if self.connect():
-            self.connection_thread = threading.Thread(target=self.listen_loop, daemon=True)
-            self.connection_thread.start()
-            logger.info("Serial manager started successfully")
-        else:
-            logger.warning("Serial manager failed to start - no connection established")
+        self._wake.clear()
+        self._known_ports = set()
+        try:
+            self._scan_ports()
+        except Exception as e:
+            logger.debug(f"Port scan failed: {e}")
+
+        self.hotplug_thread = threading.Thread(target=self._watch_hotplug, daemon=True)
+        self.hotplug_thread.start()
+        self.connection_thread = threading.Thread(target=self._supervise, daemon=True)
+        self.connection_thread.start()
+        logger.info("Serial manager started")
     
     def stop(self):
         """Stop serial manager"""
         self.is_running = False
+        self._wake.set()
         self.disconnect()
         
-        if self.connection_thread and self.connection_thread.is_alive():
-            self.connection_thread.join(timeout=2)
+        for thread in (self.connection_thread, self.hotplug_thread):
+            if thread and thread.is_alive():
+                thread.join(timeout=2)
+        self.state = STOPPED
         
         logger.info("Serial manager stopped")
     
@@ -216,12 +339,15 @@ class SerialManager:
         """Get current serial manager status"""
         return {
             'connected': self.is_connected(),
+            'state': self.state,
             'port': self.config['port'],
             'baudrate': self.config['baudrate'],
             'auto_detect': self.config['auto_detect'],
             'enabled': self.config['enabled'],
             'reconnect_attempts': self.reconnect_attempts,
-            'available_ports': self.find_esp32_ports(),
+            'last_error': self.last_error,
+            'last_received': self.last_received,
+            'available_ports': self.available_ports,
             'platform': __import__('platform').system().lower()
         }
     
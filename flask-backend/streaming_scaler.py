@@ -0,0 +1,247 @@
+import os
+import json
+import math
+import threading
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from sensor_reading import NUM_FEATURES
+
+logger = logging.getLogger(__name__)
+
+
+class RunningStats:
+    """Welford running mean/variance over NUM_FEATURES features.
+
+    Kept in plain Python floats: for four features this is cheaper per
+    update than any NumPy call.
+    """
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count=0, mean=None, m2=None):
+        self.count = count
+        self.mean = list(mean) if mean is not None else [0.0] * NUM_FEATURES
+        self.m2 = list(m2) if m2 is not None else [0.0] * NUM_FEATURES
+
+    def update(self, values):
+        """Add one sample (a sequence of NUM_FEATURES floats) in O(1)"""
+        self.count += 1
+        inv_n = 1.0 / self.count
+        mean = self.mean
+        m2 = self.m2
+        i = 0
+        for x in values:
+            mu = mean[i]
+            delta = x - mu
+            mu += delta * inv_n
+            mean[i] = mu
+            m2[i] += delta * (x - mu)
+            i += 1
+
+    @classmethod
+    def from_array(cls, X):
+        """Build stats from a (n_samples, NUM_FEATURES) array in one pass"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.shape[0] == 0:
+            return cls()
+        mean = X.mean(axis=0)
+        m2 = ((X - mean) ** 2).sum(axis=0)
+        return cls(int(X.shape[0]), mean.tolist(), m2.tolist())
+
+    def merged(self, other):
+        """Return the combination of two accumulators (Chan et al.)"""
+        if other.count == 0:
+            return self.copy()
+        if self.count == 0:
+            return other.copy()
+        n = self.count + other.count
+        mean, m2 = [], []
+        for i in range(NUM_FEATURES):
+            delta = other.mean[i] - self.mean[i]
+            mean.append(self.mean[i] + delta * other.count / n)
+            m2.append(self.m2[i] + other.m2[i] + delta * delta * self.count * other.count / n)
+        return RunningStats(n, mean, m2)
+
+    def copy(self):
+        return RunningStats(self.count, self.mean, self.m2)
+
+    def std(self):
+        """Population standard deviation per feature"""
+        if self.count == 0:
+            return [0.0] * NUM_FEATURES
+        return [math.sqrt(v / self.count) for v in self.m2]
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['count'], data['mean'], data['m2'])
+
+
+class ScalerSnapshot:
+    """Frozen scaler parameters used for inference.
+
+    Never mutated after creation, so swapping the reference is atomic.
+    """
+
+    __slots__ = ('mean', 'std', 'mean_f', 'inv_std_f', 'count')
+
+    def __init__(self, mean, std, count=0):
+        std = [s if s > 1e-6 else 1.0 for s in std]  # Constant features pass through unscaled
+        self.mean = np.array(mean, dtype=np.float32)
+        self.std = np.array(std, dtype=np.float32)
+        # Plain-float copies for SensorReading.write_scaled_features
+        self.mean_f = tuple(float(v) for v in mean)
+        self.inv_std_f = tuple(1.0 / float(v) for v in std)
+        self.count = count
+
+    @classmethod
+    def from_stats(cls, stats):
+        return cls(stats.mean, stats.std(), stats.count)
+
+    def scale(self, X):
+        """Scale an array of samples in [EDA, TEMP, ACC_Mag, BVP] order"""
+        return (np.asarray(X, dtype=np.float32) - self.mean) / self.std
+
+    def to_dict(self):
+        return {'mean': self.mean.tolist(), 'std': self.std.tolist(), 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['mean'], data['std'], data.get('count', 0))
+
+
+class StreamingScaler:
+    """Running scaler statistics, globally and per device.
+
+    Every reading updates the running accumulators in O(1); they are kept
+    for monitoring and per-device scaling. Inference uses the published
+    snapshots, which only change when a new model is swapped in (see
+    prepare/commit), so a model is always served with the scaler it was
+    trained against.
+    """
+
+    def __init__(self, default_mean, default_std, scope='global', min_device_samples=500):
+        self.scope = scope
+        self.min_device_samples = min_device_samples
+        self.running_global = RunningStats()
+        self.running_devices = {}
+        self.default = ScalerSnapshot(default_mean, default_std)
+        self.published = self.default
+        self.published_devices = {}
+        self.model_version = None
+        self._lock = threading.Lock()
+
+    def update(self, device_id, values):
+        """Add one reading's features (model input order) to the running stats"""
+        with self._lock:
+            self.running_global.update(values)
+            stats = self.running_devices.get(device_id)
+            if stats is None:
+                stats = self.running_devices[device_id] = RunningStats()
+            stats.update(values)
+
+    def snapshot_for(self, device_id=None, published=None):
+        """Return the published snapshot to scale a device's readings with.
+
+        ``published`` is a (global, per-device) pair from current() to pick
+        from instead of the snapshots published now.
+        """
+        global_snapshot, devices = published or (self.published, self.published_devices)
+        if self.scope == 'device' and device_id is not None:
+            snapshot = devices.get(device_id)
+            if snapshot is not None:
+                return snapshot
+        return global_snapshot
+
+    def current(self):
+        """The published (global, per-device) snapshots, as passed to commit()"""
+        return self.published, self.published_devices
+
+    def prepare(self, X_train=None):
+        """Build candidate snapshots for a model about to be trained.
+
+        The global snapshot is fit on the training data only, so the model
+        is served with the scaling it was trained with; live readings are
+        unlabeled and would skew it. Per-device snapshots come from the
+        running stats (SCALER_SCOPE=device). Train the new model with
+        ``candidate[0].scale`` and pass the candidate to commit() together
+        with the model swap.
+        """
+        with self._lock:
+            devices = {
+                device_id: ScalerSnapshot.from_stats(device_stats)
+                for device_id, device_stats in self.running_devices.items()
+                if device_stats.count >= self.min_device_samples
+            }
+        stats = RunningStats.from_array(X_train) if X_train is not None else RunningStats()
+        global_snapshot = ScalerSnapshot.from_stats(stats) if stats.count else self.published
+        return global_snapshot, devices
+
+    def commit(self, candidate, model_version=None):
+        """Publish prepared snapshots; call alongside the model swap"""
+        self.published, self.published_devices = candidate
+        self.model_version = model_version or datetime.now().isoformat()
+
+    def save(self, path):
+        """Persist published snapshots and running accumulators next to the model"""
+        with self._lock:
+            state = {
+                'model_version': self.model_version,
+                'scope': self.scope,
+                'published': self.published.to_dict(),
+                'published_devices': {k: v.to_dict() for k, v in self.published_devices.items()},
+                'running_global': self.running_global.to_dict(),
+                'running_devices': {k: v.to_dict() for k, v in self.running_devices.items()},
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path, running=True):
+        """Restore persisted state; returns False if no state file exists.
+
+        With ``running=False`` only the published snapshots are replaced and
+        the running accumulators of this process are kept.
+        """
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            state = json.load(f)
+        if running:
+            with self._lock:
+                self.running_global = RunningStats.from_dict(state['running_global'])
+                self.running_devices = {k: RunningStats.from_dict(v) for k, v in state['running_devices'].items()}
+        self.published_devices = {k: ScalerSnapshot.from_dict(v) for k, v in state['published_devices'].items()}
+        self.published = ScalerSnapshot.from_dict(state['published'])
+        self.model_version = state.get('model_version')
+        return True
+
+    def get_status(self):
+        """Summary of published and running statistics"""
+        return {
+            'scope': self.scope,
+            'model_version': self.model_version,
+            'published': self.published.to_dict(),
+            'running_samples': self.running_global.count,
+            'devices': {k: v.count for k, v in self.running_devices.items()},
+        }
+
+
+def state_path_for(model_path):
+    """Scaler state file that belongs to a saved model"""
+    return os.path.splitext(model_path)[0] + '.scaler.json'
+
+
+def publish_for_model(model_path, snapshot, model_version=None):
+    """Write the scaler state of an offline-trained model; returns its path"""
+    state = StreamingScaler(snapshot.mean, snapshot.std)
+    state.commit((snapshot, {}), model_version or os.path.basename(model_path))
+    path = state_path_for(model_path)
+    state.save(path)
+    return path
@@ -0,0 +1,199 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import client_delivery
+from client_delivery import ClientDelivery, STRIDE_INTERVAL
+
+
+class Transport:
+    """Records sends; a client's backlog is what it has been sent and not yet consumed"""
+
+    def __init__(self):
+        self.sent = {}
+        self.consumed = {}
+        self.fail = set()
+        self.disconnected = []
+
+    def send(self, sid, message, seq):
+        if sid in self.fail:
+            raise KeyError(sid)
+        self.sent.setdefault(sid, []).append((message, seq))
+
+    def backlog(self, sid):
+        return len(self.sent.get(sid, ())) - self.consumed.get(sid, 0)
+
+    def consume(self, sid):
+        self.consumed[sid] = len(self.sent.get(sid, ()))
+
+    def payloads(self, sid):
+        return [message[1] for message, _ in self.sent.get(sid, ())]
+
+
+def _delivery(transport, **kwargs):
+    return ClientDelivery(transport.send, backlog=transport.backlog, disconnect=transport.disconnected.append,
+                          **kwargs)
+
+
+def _publish(delivery, n, start=0, transport=None, keep_up=()):
+    """Publish n messages; clients in ``keep_up`` consume each one from ``transport`` right away"""
+    for i in range(start, start + n):
+        delivery.publish('stream', i)
+        for sid in keep_up:
+            transport.consume(sid)
+            delivery.flush()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the monotonic clock client_delivery sees; advance it with clock.now += seconds"""
+    fake = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(client_delivery, 'time', SimpleNamespace(monotonic=lambda: fake.now, time=time.time))
+    return fake
+
+
+def test_window_limits_messages_in_flight():
+    transport = Transport()
+    delivery = _delivery(transport, window=4, queue_size=100)
+    delivery.add('a')
+    _publish(delivery, 10)
+    assert transport.payloads('a') == [0, 1, 2, 3]
+    assert delivery.get_status()['clients']['a']['queued'] == 6
+
+    transport.consume('a')
+    delivery.flush()
+    assert transport.payloads('a') == list(range(8))
+
+
+def test_acks_release_credit_and_number_messages():
+    transport = Transport()
+    delivery = _delivery(transport, window=3, queue_size=100)
+    delivery.add('a')
+    delivery.configure('a', acks=True)
+    _publish(delivery, 5)
+    assert [seq for _, seq in transport.sent['a']] == [1, 2, 3]
+    # The transport backlog no longer matters, only acknowledgements
+    transport.consume('a')
+    delivery.flush()
+    assert len(transport.sent['a']) == 3
+
+    delivery.ack('a', 2)
+    assert [seq for _, seq in transport.sent['a']] == [1, 2, 3, 4, 5]
+    status = delivery.get_status()['clients']['a']
+    assert status['in_flight'] == 3
+    assert status['ack_latency_ms'] is not None
+    # Acks beyond what was sent are capped; stale ones are ignored
+    delivery.ack('a', 99)
+    delivery.ack('a', 1)
+    assert delivery.get_status()['clients']['a']['in_flight'] == 0
+
+
+def test_message_is_encoded_once_for_all_clients():
+    transport = Transport()
+    encoded = []
+    delivery = ClientDelivery(transport.send, encode=lambda event, payload: encoded.append(payload) or object())
+    for sid in ('a', 'b', 'c'):
+        delivery.add(sid)
+    delivery.publish('stream', 1)
+    assert len(encoded) == 1
+    assert transport.sent['a'][0][0] is transport.sent['b'][0][0] is transport.sent['c'][0][0]
+
+
+def test_drop_oldest_keeps_the_newest_messages():
+    transport = Transport()
+    delivery = _delivery(transport, window=2, queue_size=3)
+    delivery.add('a')
+    _publish(delivery, 10)
+    transport.consume('a')
+    delivery.flush()
+    transport.consume('a')
+    delivery.flush()
+    assert transport.payloads('a') == [0, 1, 7, 8, 9]
+    assert delivery.get_status()['clients']['a']['dropped'] == 5
+
+
+def test_sample_down_lowers_and_restores_the_rate_of_a_slow_client(clock):
+    transport = Transport()
+    delivery = _delivery(transport, policy='sample_down', window=1, queue_size=2)
+    delivery.add('slow')
+    delivery.add('fast')
+    clock.now += STRIDE_INTERVAL
+    _publish(delivery, 10, transport=transport, keep_up=['fast'])
+    status = delivery.get_status()['clients']['slow']
+    # Halved at most once per STRIDE_INTERVAL
+    assert status['stride'] == 2
+    assert status['sampled_out'] > 0
+    assert delivery.get_status()['clients']['fast']['stride'] == 1
+    assert transport.payloads('fast') == list(range(10))
+
+    # Caught up: the stride is doubled back once the queue is empty
+    transport.consume('slow')
+    delivery.flush()
+    transport.consume('slow')
+    delivery.flush()
+    clock.now += STRIDE_INTERVAL
+    delivery.flush()
+    assert delivery.get_status()['clients']['slow']['stride'] == 1
+
+
+def test_disconnect_policy_evicts_a_client_that_stays_full():
+    transport = Transport()
+    delivery = _delivery(transport, policy='disconnect', window=1, queue_size=2, evict_after=0.0)
+    delivery.add('stuck')
+    delivery.add('ok')
+    _publish(delivery, 5, transport=transport, keep_up=['ok'])
+    assert transport.disconnected == ['stuck']
+    assert set(delivery.get_status()['clients']) == {'ok'}
+    assert delivery.get_status()['evicted'][0]['sid'] == 'stuck'
+
+
+def test_transport_backlog_beyond_max_evicts_whatever_the_policy():
+    transport = Transport()
+    delivery = _delivery(transport, max_backlog=2)
+    delivery.add('a')
+    _publish(delivery, 3)
+    delivery.flush()
+    assert transport.disconnected == ['a']
+
+
+def test_failed_send_keeps_the_message_and_its_seq():
+    transport = Transport()
+    delivery = _delivery(transport, window=4, queue_size=10)
+    delivery.add('a')
+    delivery.configure('a', acks=True)
+    transport.fail.add('a')
+    _publish(delivery, 3)
+    status = delivery.get_status()['clients']['a']
+    assert (status['queued'], status['in_flight'], status['dropped'], status['sent']) == (3, 0, 0, 0)
+
+    transport.fail.clear()
+    delivery.flush()
+    assert transport.sent['a'] == [(('stream', 0), 1), (('stream', 1), 2), (('stream', 2), 3)]
+
+
+def test_requeued_messages_respect_the_queue_size():
+    transport = Transport()
+    delivery = _delivery(transport, window=4, queue_size=2)
+    delivery.add('a')
+    transport.fail.add('a')
+    _publish(delivery, 5)
+    status = delivery.get_status()['clients']['a']
+    assert status['queued'] == 2
+    assert status['dropped'] == 3
+    transport.fail.clear()
+    delivery.flush()
+    assert transport.payloads('a') == [3, 4]
+
+
+@pytest.mark.parametrize('settings', [{'policy': 'nope'}, {'window': 0}, {'queue_size': 10 ** 6}, {'window': 1.5}])
+def test_invalid_settings_are_rejected(settings):
+    delivery = ClientDelivery(Transport().send)
+    delivery.add('a')
+    with pytest.raises(ValueError):
+        delivery.configure('a', **settings)
+
+
+def test_configure_unknown_client():
+    with pytest.raises(KeyError):
+        ClientDelivery(Transport().send).configure('missing', window=2)
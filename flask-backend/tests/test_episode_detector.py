@@ -0,0 +1,87 @@
+import math
+
+import pytest
+
+from episode_detector import EpisodeDetector
+
+VALUES = (36.5, 2.0, 0.1, 9.8)
+
+
+def _feed(detector, labels, start=0.0, step=1.0, device_id='d1'):
+    """Observe ``labels`` one per ``step`` seconds; returns [(time, kind, event)]"""
+    events = []
+    for i, label in enumerate(labels):
+        now = start + i * step
+        result = detector.observe(device_id, label, VALUES, now=now)
+        if result is not None:
+            events.append((now,) + result)
+    return events
+
+
+def test_sustained_stress_starts_one_episode():
+    detector = EpisodeDetector(tau=5.0, enter=0.7, exit=0.3)
+    events = _feed(detector, ['Stressed'] * 20)
+    assert [kind for _, kind, _ in events] == ['episode_start']
+    confirmed, _, event = events[0]
+    # 1 - exp(-t / tau) reaches 0.7 after tau * ln(1 / 0.3) seconds
+    assert confirmed == math.ceil(5.0 * math.log(1 / 0.3))
+    # Dated from when the level passed ``exit``, not from when it was confirmed
+    assert event['started_at'] < event['confirmed_at']
+    assert event['stressed_fraction'] == 1.0
+
+
+def test_flickering_label_opens_no_episode():
+    detector = EpisodeDetector(tau=5.0, enter=0.7, exit=0.3)
+    assert _feed(detector, ['Stressed', 'Calm'] * 50) == []
+    assert detector.get_status()['active'] == []
+
+
+def test_short_rise_below_enter_is_dropped():
+    detector = EpisodeDetector(tau=5.0, enter=0.7, exit=0.3)
+    assert _feed(detector, ['Stressed'] * 4 + ['Calm'] * 20) == []
+    # A later episode is dated from its own rise, not the dropped one
+    [(_, kind, event)] = _feed(detector, ['Stressed'] * 20, start=100.0)
+    assert kind == 'episode_start'
+    assert event['episode_id'] == 'd1:102000'
+
+
+def test_episode_survives_a_dip_and_ends_below_exit():
+    detector = EpisodeDetector(tau=5.0, enter=0.7, exit=0.3)
+    labels = ['Stressed'] * 20 + ['Calm'] * 3 + ['Stressed'] * 5 + ['Calm'] * 20
+    events = _feed(detector, labels)
+    assert [kind for _, kind, _ in events] == ['episode_start', 'episode_end']
+    _, _, end = events[1]
+    assert end['reason'] == 'recovered'
+    # Ends at the last Stressed reading (t=27), whatever the exit threshold's lag
+    assert end['duration_s'] == 27 - 2
+    assert 0 < end['stressed_fraction'] < 1
+
+
+def test_gap_ends_the_episode_at_the_next_reading():
+    detector = EpisodeDetector(tau=5.0, max_gap=30.0)
+    _feed(detector, ['Stressed'] * 20)
+    [(_, kind, event)] = _feed(detector, ['Stressed'], start=19.0 + 31.0)
+    assert (kind, event['reason']) == ('episode_end', 'gap')
+    assert detector.get_status()['levels']['d1'] == 0.0
+
+
+def test_sweep_ends_episodes_of_silent_devices():
+    detector = EpisodeDetector(tau=5.0, max_gap=30.0)
+    _feed(detector, ['Stressed'] * 20, device_id='silent')
+    _feed(detector, ['Calm'] * 5, start=40.0, device_id='live')
+    events = detector.sweep(now=19.0 + 31.0)
+    assert [(kind, event['device_id'], event['reason']) for kind, event in events] == [
+        ('episode_end', 'silent', 'gap')]
+    assert set(detector.get_status()['levels']) == {'live'}
+    assert detector.sweep(now=50.0) == []
+
+
+def test_other_labels_are_ignored():
+    detector = EpisodeDetector()
+    assert detector.observe('d1', 'Model Not Available', VALUES, now=0.0) is None
+    assert detector.get_status()['levels'] == {}
+
+
+def test_thresholds_must_be_ordered():
+    with pytest.raises(ValueError):
+        EpisodeDetector(enter=0.3, exit=0.7)
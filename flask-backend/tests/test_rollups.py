@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from rollups import RollupStore, lttb_indices
+
+KEY = ('device', 'd1')
+
+
+def _values(v):
+    # temperature, eda, bvp, acceleration_magnitude
+    return (36.0 + v, v, -v, 9.8)
+
+
+@pytest.mark.parametrize('threshold', [2, 10, 11])
+def test_lttb_returns_everything_when_nothing_to_drop(threshold):
+    x = np.arange(10.0)
+    np.testing.assert_array_equal(lttb_indices(x, x, threshold), np.arange(10))
+
+
+def test_lttb_keeps_endpoints_order_and_peaks():
+    x = np.arange(1000.0)
+    y = np.zeros(1000)
+    y[357] = 5.0
+    y[700] = -3.0
+    idx = lttb_indices(x, y, 50)
+    assert len(idx) == 50
+    assert idx[0] == 0 and idx[-1] == 999
+    assert np.all(np.diff(idx) > 0)
+    assert 357 in idx and 700 in idx
+
+
+def test_lttb_smallest_useful_threshold():
+    x = np.arange(100.0)
+    idx = lttb_indices(x, np.sin(x / 10), 3)
+    assert len(idx) == 3 and idx[0] == 0 and idx[-1] == 99
+
+
+def test_readings_on_a_boundary_start_the_next_bucket():
+    store = RollupStore(resolutions=((10, 100),), raw_retention=1)
+    for t, v, stressed in ((100.0, 1.0, True), (109.9, 3.0, False), (110.0, 5.0, True)):
+        store.add([KEY], t, _values(v), stressed)
+    store.add([KEY], 111.0, _values(7.0), False)  # Evicts the earlier raw samples
+
+    history = store.history(KEY, 100.0, 119.0)
+    assert history['resolution'] == '10s'
+    assert history['t'] == [100.0, 110.0]
+    assert history['count'] == [2, 2]
+    assert history['stress_ratio'] == [0.5, 0.5]
+    assert history['eda_min'] == [1.0, 5.0]
+    assert history['eda_max'] == [3.0, 7.0]
+    assert history['eda_mean'] == [2.0, 6.0]
+    assert history['bvp_min'] == [-3.0, -7.0]
+
+
+def test_query_boundaries_include_overlapping_buckets():
+    store = RollupStore(resolutions=((10, 100),), raw_retention=1)
+    for t in range(100, 160):
+        store.add([KEY], float(t), _values(1.0), False)
+    # 105 lies inside the bucket starting at 100; 130 starts a bucket, which is included
+    assert store.history(KEY, 105.0, 130.0)['t'] == [100.0, 110.0, 120.0, 130.0]
+    assert store.history(KEY, 110.0, 129.9)['t'] == [110.0, 120.0]
+
+
+def test_raw_samples_are_served_while_the_tail_covers_the_range():
+    store = RollupStore(raw_retention=1000)
+    for t in range(200):
+        store.add([KEY], 1000.0 + t, _values(float(t % 7)), t % 2)
+    history = store.history(KEY, 1050.0, 1149.0, max_points=20)
+    assert history['resolution'] == 'raw'
+    assert len(history['t']) == 20
+    assert history['t'][0] == 1050.0 and history['t'][-1] == 1149.0
+
+
+def test_finest_resolution_within_the_point_budget_is_chosen():
+    store = RollupStore(resolutions=((1, 1000), (10, 1000)), raw_retention=10)
+    for t in range(600):
+        store.add([KEY], float(t), _values(1.0), False)
+    assert store.history(KEY, 0.0, 99.0, max_points=100)['resolution'] == '1s'
+    coarse = store.history(KEY, 0.0, 599.0, max_points=100)
+    assert coarse['resolution'] == '10s'
+    assert sum(coarse['count']) == 600
+
+
+def test_adjacent_buckets_are_merged_beyond_the_coarsest_resolution():
+    store = RollupStore(resolutions=((1, 1000),), raw_retention=10)
+    for t in range(100):
+        store.add([KEY], float(t), _values(float(t)), t < 50)
+    history = store.history(KEY, 0.0, 99.0, max_points=10)
+    assert history['resolution'] == '10s'
+    assert history['count'] == [10] * 10
+    assert history['eda_min'][:2] == [0.0, 10.0]
+    assert history['eda_max'][:2] == [9.0, 19.0]
+    assert history['stress_ratio'][4:6] == [1.0, 0.0]
+
+
+def test_finished_series_keep_only_coarse_resolutions():
+    store = RollupStore(resolutions=((1, 1000), (10, 1000)), raw_retention=1000)
+    key = ('session', 's1')
+    for t in range(100):
+        store.add([key], float(t), _values(1.0), False)
+    store.finish(key)
+    history = store.history(key, 0.0, 99.0, max_points=500)
+    assert history['resolution'] == '10s'
+    assert sum(history['count']) == 100
+    assert store.get_status()['compacted'] == 1
+
+
+def test_unknown_series():
+    assert RollupStore().history(('device', 'missing'), 0.0, 1.0) is None
@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import uuid
+
+import pytest
+
+from sensor_store import DiskSpool, SessionDataWriter, SQLiteBackend
+
+SESSION = str(uuid.UUID(int=1))
+
+
+def _rows(start, stop):
+    return [(SESSION, f"2026-01-01T00:00:{i:05d}", 36.5, 0.3, 'Calm', 'd1') for i in range(start, stop)]
+
+
+class FlakyBackend(SQLiteBackend):
+    """SQLite backend whose inserts fail with a connection error after ``ok_inserts`` calls"""
+
+    def __init__(self, path, ok_inserts=None):
+        super().__init__(path)
+        self.ok_inserts = ok_inserts
+
+    def insert_rows(self, conn, rows):
+        if self.ok_inserts is not None:
+            if self.ok_inserts == 0:
+                raise sqlite3.OperationalError("database is unreachable")
+            self.ok_inserts -= 1
+        super().insert_rows(conn, rows)
+
+
+def _stored(backend):
+    conn = backend.connect()
+    try:
+        return [row[1] for rows in backend.iter_rows(conn) for row in rows]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / 'spool.ndjson')
+
+
+def test_spool_counts_rows_and_replays_in_batches(spool_path):
+    spool = DiskSpool(spool_path)
+    spool.append(_rows(0, 5))
+    assert spool.rows == 5
+    path = spool.take()
+    batches = list(spool.read_batches(path, 2))
+    assert [len(rows) for rows, _, _ in batches] == [2, 2, 1]
+    assert batches[0][0][0] == _rows(0, 1)[0]
+    for _, lines, offset in batches:
+        spool.advance(offset, lines)
+    assert spool.rows == 0
+    spool.finish_replay()
+    assert spool.take() is None
+
+
+def test_interrupted_replay_resumes_from_saved_offset(spool_path):
+    spool = DiskSpool(spool_path)
+    spool.append(_rows(0, 6))
+    path = spool.take()
+    rows, lines, offset = next(spool.read_batches(path, 4))
+    spool.advance(offset, lines)
+    # Newer rows go to a fresh spool while the replay file is pending
+    spool.append(_rows(6, 8))
+
+    restarted = DiskSpool(spool_path)
+    assert restarted.rows == 4
+    assert restarted.take() == path
+    assert [row for rows, _, _ in restarted.read_batches(path, 10) for row in rows] == _rows(4, 6)
+
+
+def test_unreadable_line_is_skipped_but_consumed(spool_path):
+    spool = DiskSpool(spool_path)
+    spool.append(_rows(0, 1))
+    # A row whose append was cut short by a crash (append() had counted it)
+    with open(spool_path, 'a') as f:
+        f.write('{"cut short\n')
+    spool.rows += 1
+    spool.append(_rows(1, 2))
+    path = spool.take()
+    [(rows, lines, offset)] = list(spool.read_batches(path, 10))
+    assert rows == _rows(0, 2)
+    assert lines == 3
+    spool.advance(offset, lines)
+    assert spool.rows == 0
+
+
+def test_failed_replay_stops_and_next_replay_resumes(tmp_path, spool_path):
+    backend = FlakyBackend(str(tmp_path / 'db.sqlite'), ok_inserts=1)
+    writer = SessionDataWriter(backend, spool_path, batch_size=3)
+    writer.spool.append(_rows(0, 7))
+
+    conn = writer._replay(backend.connect(), writer.spool.take())
+    assert conn is None  # Closed after the failure
+    assert writer.stats['rows_replayed'] == 3
+    assert writer.spool.rows == 4
+    assert not writer._healthy
+
+    backend.ok_inserts = None
+    writer._replay(backend.connect(), writer.spool.take())
+    assert writer.spool.rows == 0
+    assert writer.spool.take() is None
+    assert _stored(backend) == [row[1] for row in _rows(0, 7)]
+
+
+def test_rejected_rows_go_to_dead_letter_file(tmp_path, spool_path):
+    backend = SQLiteBackend(str(tmp_path / 'db.sqlite'))
+    writer = SessionDataWriter(backend, spool_path)
+    rows = _rows(0, 5)
+    # timestamp is NOT NULL: an IntegrityError for this row only
+    rows[2] = (SESSION, None, 36.5, 0.3, 'Calm', 'd1')
+    writer._write_checked(backend.connect(), rows)
+
+    assert _stored(backend) == [row[1] for row in rows if row[1] is not None]
+    with open(writer.rejected_path) as f:
+        rejected = [json.loads(line) for line in f]
+    assert [entry['row'] for entry in rejected] == [list(rows[2])]
+    assert writer.stats['rows_rejected'] == 1
+
+
+def test_connection_errors_are_not_dead_lettered(tmp_path, spool_path):
+    backend = FlakyBackend(str(tmp_path / 'db.sqlite'), ok_inserts=0)
+    writer = SessionDataWriter(backend, spool_path)
+    with pytest.raises(sqlite3.OperationalError):
+        writer._write_checked(backend.connect(), _rows(0, 4))
+    assert writer.stats['rows_rejected'] == 0
+
+
+def test_submit_rejects_invalid_session_ids(tmp_path, spool_path):
+    writer = SessionDataWriter(SQLiteBackend(str(tmp_path / 'db.sqlite')), spool_path)
+    assert not writer.submit('not-a-uuid', '2026-01-01T00:00:00', 36.5, 0.3, 'Calm', 'd1')
+    assert writer.submit(SESSION, '2026-01-01T00:00:00', 36.5, 0.3, 'Calm', 'd1')
+    assert writer.get_status()['buffered_rows'] == 1
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from streaming_scaler import RunningStats, ScalerSnapshot, StreamingScaler, state_path_for
+
+
+@pytest.fixture
+def samples():
+    return np.random.default_rng(0).normal([1.0, 34.0, 9.8, 0.0], [0.5, 1.0, 2.0, 50.0], size=(1000, 4))
+
+
+def test_update_matches_numpy(samples):
+    stats = RunningStats()
+    for row in samples:
+        stats.update(row)
+    assert stats.count == len(samples)
+    np.testing.assert_allclose(stats.mean, samples.mean(axis=0))
+    np.testing.assert_allclose(stats.std(), samples.std(axis=0))
+
+
+def test_merged_equals_one_pass(samples):
+    merged = RunningStats.from_array(samples[:300]).merged(RunningStats.from_array(samples[300:]))
+    whole = RunningStats.from_array(samples)
+    assert merged.count == whole.count
+    np.testing.assert_allclose(merged.mean, whole.mean)
+    np.testing.assert_allclose(merged.m2, whole.m2)
+
+
+def test_merged_with_empty_is_a_copy(samples):
+    stats = RunningStats.from_array(samples)
+    for merged in (stats.merged(RunningStats()), RunningStats().merged(stats)):
+        assert merged is not stats
+        assert (merged.count, merged.mean, merged.m2) == (stats.count, stats.mean, stats.m2)
+
+
+def test_constant_feature_is_not_scaled():
+    snapshot = ScalerSnapshot([0.0, 1.0, 2.0, 3.0], [2.0, 0.0, 1.0, 1.0])
+    np.testing.assert_allclose(snapshot.scale([[2.0, 5.0, 2.0, 3.0]]), [[1.0, 4.0, 0.0, 0.0]])
+
+
+def test_prepare_fits_training_data_and_commit_publishes(samples):
+    scaler = StreamingScaler(np.zeros(4), np.ones(4), scope='device', min_device_samples=10)
+    for row in samples[:20]:
+        scaler.update('d1', row)
+    scaler.update('d2', samples[0])
+    candidate = scaler.prepare(samples)
+    # Nothing changes for inference until the model swap commits it
+    assert scaler.published is scaler.default
+    scaler.commit(candidate, 'v1')
+    np.testing.assert_allclose(scaler.published.mean, samples.mean(axis=0), rtol=1e-5)
+    assert scaler.snapshot_for('d1') is scaler.published_devices['d1']
+    # Too few samples for its own snapshot
+    assert scaler.snapshot_for('d2') is scaler.published
+
+
+def test_save_load_round_trip(tmp_path, samples):
+    scaler = StreamingScaler(np.zeros(4), np.ones(4), scope='device', min_device_samples=1)
+    for row in samples[:50]:
+        scaler.update('d1', row)
+    scaler.commit(scaler.prepare(samples), 'v1')
+    path = str(tmp_path / 'model.scaler.json')
+    scaler.save(path)
+
+    restored = StreamingScaler(np.zeros(4), np.ones(4), scope='device')
+    assert restored.load(path)
+    assert restored.model_version == 'v1'
+    np.testing.assert_array_equal(restored.published.mean, scaler.published.mean)
+    np.testing.assert_array_equal(restored.published_devices['d1'].std, scaler.published_devices['d1'].std)
+    assert restored.running_devices['d1'].count == 50
+    assert restored.running_global.mean == scaler.running_global.mean
+
+
+def test_load_without_running_keeps_local_stats(tmp_path, samples):
+    saved = StreamingScaler(np.zeros(4), np.ones(4))
+    saved.update('d1', samples[0])
+    saved.commit(saved.prepare(samples), 'v1')
+    path = str(tmp_path / 'model.scaler.json')
+    saved.save(path)
+
+    scaler = StreamingScaler(np.zeros(4), np.ones(4))
+    for row in samples[:5]:
+        scaler.update('d2', row)
+    assert scaler.load(path, running=False)
+    assert scaler.model_version == 'v1'
+    assert set(scaler.running_devices) == {'d2'}
+    assert scaler.running_global.count == 5
+
+
+def test_load_missing_file(tmp_path):
+    assert not StreamingScaler(np.zeros(4), np.ones(4)).load(str(tmp_path / 'missing.json'))
+
+
+def test_state_path_for():
+    assert state_path_for('models/stress_model.h5') == 'models/stress_model.scaler.json'
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from tracing import SEQ_RESET_THRESHOLD, Tracer
+
+
+def _send(tracer, device_id, *seqs, **fields):
+    now = time.perf_counter()
+    for seq in seqs:
+        tracer.begin(device_id, dict(fields, seq=seq), now, now)
+    return tracer.get_stats()['devices'][device_id]
+
+
+def test_consecutive_sequence_has_no_loss():
+    stats = _send(Tracer(), 'd1', *range(10))
+    assert (stats['received'], stats['lost'], stats['gaps'], stats['loss_rate']) == (10, 0, 0, 0.0)
+
+
+def test_gap_counts_missing_readings():
+    tracer = Tracer()
+    stats = _send(tracer, 'd1', 1, 2, 5, 6, 10)
+    assert stats['lost'] == 5
+    assert stats['gaps'] == 2
+    assert stats['loss_rate'] == pytest.approx(5 / 10)
+    assert [(g['after_seq'], g['missing']) for g in tracer.get_stats()['recent_gaps']] == [(2, 2), (6, 3)]
+
+
+def test_duplicates_and_reordering_keep_the_highest_seq():
+    stats = _send(Tracer(), 'd1', 1, 2, 3, 2, 4)
+    assert stats['duplicates'] == 1
+    assert stats['lost'] == 0
+    assert stats['last_seq'] == 4
+
+
+@pytest.mark.parametrize('restart', [0, 5])
+def test_restart_is_not_loss(restart):
+    start = SEQ_RESET_THRESHOLD + 10 if restart else 50
+    stats = _send(Tracer(), 'd1', start, start + 1, restart, restart + 1)
+    assert stats['resets'] == 1
+    assert stats['lost'] == 0
+    assert stats['duplicates'] == 0
+    assert stats['last_seq'] == restart + 1
+
+
+def test_small_step_back_is_a_duplicate_not_a_restart():
+    last = SEQ_RESET_THRESHOLD + 100
+    stats = _send(Tracer(), 'd1', last - 1, last, last - (SEQ_RESET_THRESHOLD - 1))
+    assert stats['resets'] == 0
+    assert stats['duplicates'] == 1
+
+
+def test_devices_are_tracked_separately():
+    tracer = Tracer()
+    _send(tracer, 'a', 1, 3)
+    stats = _send(tracer, 'b', 1, 2)
+    assert stats['lost'] == 0
+    assert tracer.get_stats()['devices']['a']['lost'] == 1
+
+
+@pytest.mark.parametrize('value', ['abc', True, [1], {'n': 1}, float('nan')])
+def test_malformed_seq_is_counted_and_ignored(value):
+    tracer = Tracer()
+    now = time.perf_counter()
+    trace = tracer.begin('d1', {'seq': value, 'device_ts': 'soon'}, now, now)
+    assert trace.seq is None and trace.device_ts is None
+    stats = tracer.get_stats()['devices']['d1']
+    assert stats['received'] == 0
+    assert stats['malformed'] == 2
+
+
+def test_numeric_strings_are_accepted():
+    stats = _send(Tracer(), 'd1', '1', '2', '4')
+    assert stats['lost'] == 1
+
+
+def test_least_recently_seen_device_is_dropped_beyond_max_devices():
+    tracer = Tracer(max_devices=2)
+    for device_id in ('a', 'b', 'c'):
+        _send(tracer, device_id, 1)
+    assert set(tracer.get_stats()['devices']) == {'b', 'c'}
+
+
+def test_transit_is_relative_to_the_smallest_clock_offset():
+    tracer = Tracer()
+    now = time.perf_counter()
+    wall = time.time()
+    first = tracer.begin('d1', {'device_ts': 0, 'rx_ts': wall}, now, now)
+    later = tracer.begin('d1', {'device_ts': 1000, 'rx_ts': wall + 1.25}, now, now)
+    assert first.transit == 0.0
+    assert later.transit == pytest.approx(0.25)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from tree_model import TreeEnsemble, is_tree_file
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 4)).astype(np.float32)
+    y = ((X[:, 0] + 0.5 * X[:, 1] ** 2 - X[:, 3]) > 0.3).astype(int)
+    return X, y
+
+
+def _boundary_rows(model, X):
+    """Rows whose features sit exactly on the trees' split thresholds"""
+    rows = X[:200].copy()
+    splits = model.threshold[~model.is_leaf]
+    features = model.feature[~model.is_leaf]
+    for i in range(len(rows)):
+        k = i % len(splits)
+        rows[i, features[k]] = splits[k]
+    return rows
+
+
+def test_single_tree_with_missing_values():
+    # Root splits feature 0 at 0.5 (missing goes right); its left child splits feature 1 at -1 (missing goes left)
+    model = TreeEnsemble._from_trees([(
+        [1, 3, -1, -1, -1], [2, 4, -1, -1, -1], [0, 1, 0, 0, 0], [0.5, -1.0, 0, 0, 0],
+        [0, 0, 0.9, 0.1, 0.4], [False, True, False, False, False],
+    )])
+    X = np.array([[0.5, -1.0], [0.5, 0.0], [0.6, 0.0], [np.nan, 0.0], [0.0, np.nan]], dtype=np.float32)
+    np.testing.assert_allclose(model.predict(X)[:, 0], [0.1, 0.4, 0.9, 0.9, 0.1])
+    assert model.depth == 2
+
+
+@pytest.mark.parametrize('name', ['RandomForestClassifier', 'ExtraTreesClassifier', 'DecisionTreeClassifier'])
+def test_matches_sklearn(data, name):
+    ensemble = pytest.importorskip('sklearn.ensemble')
+    tree = pytest.importorskip('sklearn.tree')
+    cls = getattr(ensemble, name, None) or getattr(tree, name)
+    kwargs = {} if name == 'DecisionTreeClassifier' else {'n_estimators': 25}
+    X, y = data
+    reference = cls(max_depth=8, random_state=0, **kwargs).fit(X, y)
+    model = TreeEnsemble.convert(reference)
+    for rows in (X, _boundary_rows(model, X), X[:1]):
+        np.testing.assert_allclose(model.predict(rows)[:, 0], reference.predict_proba(rows)[:, 1], atol=1e-6)
+
+
+def test_matches_xgboost_with_missing_values(data):
+    xgboost = pytest.importorskip('xgboost')
+    X, y = data
+    X = X.copy()
+    X[::7, 2] = np.nan
+    reference = xgboost.XGBClassifier(n_estimators=40, max_depth=5, random_state=0).fit(X, y)
+    model = TreeEnsemble.convert(reference)
+    assert model.aggregation == 'logistic'
+    for rows in (X, _boundary_rows(model, X)):
+        np.testing.assert_allclose(model.predict(rows)[:, 0], reference.predict_proba(rows)[:, 1], atol=1e-5)
+
+
+def test_save_load_round_trip(tmp_path, data):
+    ensemble = pytest.importorskip('sklearn.ensemble')
+    X, y = data
+    model = TreeEnsemble.convert(ensemble.RandomForestClassifier(n_estimators=5, max_depth=4, random_state=0).fit(X, y))
+    path = str(tmp_path / 'trees.npz')
+    model.save(path)
+    assert is_tree_file(path)
+    loaded = TreeEnsemble.load(path)
+    assert loaded.source == 'RandomForestClassifier'
+    np.testing.assert_array_equal(loaded.predict(X), model.predict(X))
+
+
+def test_other_npz_files_are_not_tree_files(tmp_path):
+    path = str(tmp_path / 'weights.npz')
+    np.savez(path, kernel=np.zeros(3))
+    assert not is_tree_file(path)
+    assert not is_tree_file(str(tmp_path / 'missing.npz'))
+
+
+def test_rejects_non_binary_classifiers(data):
+    tree = pytest.importorskip('sklearn.tree')
+    X, _ = data
+    with pytest.raises(ValueError):
+        TreeEnsemble.from_sklearn(tree.DecisionTreeClassifier(max_depth=2).fit(X, np.arange(len(X)) % 3))
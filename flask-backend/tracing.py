@@ -0,0 +1,263 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Server-side stages, in pipeline order
+STAGES = ('transit', 'bridge', 'queue', 'parse', 'predict', 'emit', 'server_total')
+# A sequence number this far below the last one means the device restarted
+SEQ_RESET_THRESHOLD = 1000
+# Transit times are relative to the smallest clock offset seen in the last
+# one to two windows, so slow drift between the clocks is forgotten
+OFFSET_WINDOW = 60.0
+
+
+def _parse(value, kind):
+    """``value`` as ``kind`` (int or float); None if it is missing or malformed"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        value = kind(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if kind is float and not math.isfinite(value):
+        return None
+    return value
+
+
+class _StageStats:
+    """Count, mean and max of one stage, plus a ring of recent values for percentiles"""
+
+    __slots__ = ('count', 'total', 'max', 'ring', 'index')
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.ring = np.zeros(window, dtype=np.float64)
+        self.index = 0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.ring[self.index] = value
+        self.index = (self.index + 1) % len(self.ring)
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        recent = self.ring[:min(self.count, len(self.ring))]
+        p50, p95, p99 = np.percentile(recent, (50, 95, 99))
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 3),
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(self.max, 3),
+        }
+
+
+class _DeviceSequence:
+    """Sequence and clock tracking of one device"""
+
+    __slots__ = ('last_seq', 'received', 'lost', 'gaps', 'duplicates', 'resets', 'malformed', 'last_seen',
+                 'window_start', 'window_min', 'previous_min')
+
+    def __init__(self, now):
+        self.last_seq = None
+        self.received = 0
+        self.lost = 0
+        self.gaps = 0
+        self.duplicates = 0
+        self.resets = 0
+        self.malformed = 0
+        self.last_seen = now
+        self.window_start = 0.0
+        self.window_min = None
+        self.previous_min = None
+
+    def transit(self, offset, now):
+        """Seconds above the baseline clock offset (device clock -> receive time)"""
+        if now - self.window_start >= OFFSET_WINDOW:
+            self.previous_min, self.window_min, self.window_start = self.window_min, None, now
+        if self.window_min is None or offset < self.window_min:
+            self.window_min = offset
+        baseline = self.window_min if self.previous_min is None else min(self.window_min, self.previous_min)
+        return offset - baseline
+
+    def forget_clock(self):
+        self.window_min = self.previous_min = None
+
+    def to_dict(self):
+        expected = self.received + self.lost
+        return {
+            'last_seq': self.last_seq,
+            'received': self.received,
+            'lost': self.lost,
+            'gaps': self.gaps,
+            'duplicates': self.duplicates,
+            'resets': self.resets,
+            'malformed': self.malformed,
+            'loss_rate': round(self.lost / expected, 6) if expected else 0.0,
+        }
+
+
+class ReadingTrace:
+    """Trace of one reading through the pipeline (perf_counter timestamps)"""
+
+    __slots__ = ('device_id', 'seq', 'device_ts', 'transit', 'bridge', 'received', 'started', 'parsed',
+                 'predicted')
+
+    def __init__(self, device_id, seq, device_ts, transit, bridge, received, started, parsed):
+        self.device_id = device_id
+        self.seq = seq
+        self.device_ts = device_ts
+        self.transit = transit
+        self.bridge = bridge
+        self.received = received
+        self.started = started
+        self.parsed = parsed
+        self.predicted = None
+
+    def mark_predicted(self):
+        self.predicted = time.perf_counter()
+
+    def to_payload(self):
+        """Trace fields sent with the reading; clients compare ``sent_at`` with their own clock"""
+        predicted = self.predicted or self.parsed
+        return {
+            'seq': self.seq,
+            'device_ts': self.device_ts,
+            'transit_ms': None if self.transit is None else round(self.transit * 1000, 3),
+            'bridge_ms': None if self.bridge is None else round(self.bridge * 1000, 3),
+            'server_ms': round((predicted - self.received) * 1000, 3),
+            'predict_ms': round((predicted - self.parsed) * 1000, 3),
+            'sent_at': round(time.time() * 1000, 3),
+        }
+
+
+class Tracer:
+    """Per-reading latency tracing and per-device loss detection.
+
+    Devices may send ``seq`` (an incrementing counter) and ``device_ts``
+    (their clock in milliseconds, e.g. millis()). A serial bridge adds
+    ``rx_ts``, the wall time it read the line. The server records
+    perf_counter timestamps when a reading is received, when processing
+    starts, when it is parsed, predicted and emitted.
+
+    Stages: 'transit' is the device clock offset above its recent minimum
+    (device buffering and link jitter, since the clocks are not
+    synchronized), 'bridge' the serial bridge -> server delay, 'queue'
+    waiting before processing (e.g. behind earlier readings of a batch),
+    then 'parse', 'predict' (scaling included) and 'emit' (storage,
+    rollups and the Socket.IO fan-out). Each keeps totals plus a ring of
+    the last ``window`` values for percentiles.
+
+    Trace fields that are not numbers are ignored (and counted as
+    'malformed'); the reading itself is still processed. Devices silent for
+    ``idle_timeout`` seconds are forgotten, and beyond ``max_devices`` the
+    least recently seen one is.
+    """
+
+    def __init__(self, window=2048, gap_history=100, max_devices=1024, idle_timeout=3600):
+        self.stages = {stage: _StageStats(window) for stage in STAGES}
+        self.devices = {}
+        self.max_devices = max_devices
+        self.idle_timeout = idle_timeout
+        self.recent_gaps = deque(maxlen=gap_history)
+        self._lock = threading.Lock()
+
+    def _check_sequence(self, device_id, state, seq, now):
+        state.received += 1
+        last = state.last_seq
+        state.last_seq = seq
+        if last is None or seq == last + 1:
+            return
+        if seq > last + 1:
+            missing = seq - last - 1
+            state.lost += missing
+            state.gaps += 1
+            self.recent_gaps.append({'device_id': device_id, 'after_seq': last, 'missing': missing, 'time': now})
+            logger.warning(f"Device {device_id}: {missing} reading(s) lost after seq {last}")
+        elif last - seq >= SEQ_RESET_THRESHOLD or seq == 0:
+            state.resets += 1
+            state.forget_clock()
+            logger.info(f"Device {device_id}: sequence restarted at {seq} (was {last})")
+        else:
+            # Retransmitted or reordered; keep counting from the highest seen
+            state.duplicates += 1
+            state.last_seq = last
+
+    def _device(self, device_id, now):
+        state = self.devices.get(device_id)
+        if state is None:
+            self._evict_idle(now)
+            if len(self.devices) >= self.max_devices:
+                oldest = min(self.devices, key=lambda k: self.devices[k].last_seen)
+                del self.devices[oldest]
+            state = self.devices[device_id] = _DeviceSequence(now)
+        state.last_seen = now
+        return state
+
+    def _evict_idle(self, now):
+        for device_id in [k for k, s in self.devices.items() if now - s.last_seen > self.idle_timeout]:
+            del self.devices[device_id]
+
+    def begin(self, device_id, data, received, started):
+        """Start a reading's trace once it has been parsed"""
+        parsed = time.perf_counter()
+        seq = device_ts = transit = bridge = None
+        if isinstance(data, dict):
+            fields = ('seq', 'device_ts', 'rx_ts')
+            seq = _parse(data.get('seq'), int)
+            device_ts = _parse(data.get('device_ts'), float)
+            rx_ts = _parse(data.get('rx_ts'), float)
+            malformed = sum(1 for field, value in zip(fields, (seq, device_ts, rx_ts))
+                            if value is None and data.get(field) is not None)
+            now = time.time()
+            # Wall time at which the reading reached the server
+            server_rx = now - (parsed - received)
+            if rx_ts is not None:
+                bridge = max(0.0, server_rx - rx_ts)
+            with self._lock:
+                state = self._device(device_id, now)
+                state.malformed += malformed
+                if seq is not None:
+                    self._check_sequence(device_id, state, seq, now)
+                if device_ts is not None:
+                    first_rx = rx_ts if rx_ts is not None else server_rx
+                    transit = state.transit(first_rx - device_ts / 1000.0, now)
+        return ReadingTrace(device_id, seq, device_ts, transit, bridge, received, started, parsed)
+
+    def finish(self, trace):
+        """Record stage latencies once the reading has been emitted"""
+        emitted = time.perf_counter()
+        predicted = trace.predicted or trace.parsed
+        with self._lock:
+            stages = self.stages
+            if trace.transit is not None:
+                stages['transit'].add(trace.transit * 1000)
+            if trace.bridge is not None:
+                stages['bridge'].add(trace.bridge * 1000)
+            stages['queue'].add((trace.started - trace.received) * 1000)
+            stages['parse'].add((trace.parsed - trace.started) * 1000)
+            stages['predict'].add((predicted - trace.parsed) * 1000)
+            stages['emit'].add((emitted - predicted) * 1000)
+            stages['server_total'].add((emitted - trace.received) * 1000)
+
+    def get_stats(self):
+        with self._lock:
+            self._evict_idle(time.time())
+            return {
+                'stages': {stage: stats.summary() for stage, stats in self.stages.items()},
+                'devices': {device_id: state.to_dict() for device_id, state in self.devices.items()},
+                'recent_gaps': list(self.recent_gaps),
+            }
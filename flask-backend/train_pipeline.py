@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import dataset_cache
+from streaming_scaler import RunningStats, ScalerSnapshot, publish_for_model
+
+logger = logging.getLogger(__name__)
+
+# 'keras' is the network served by app.py; the tree ensembles are converted
+# with tree_model.py and served from .npz
+MODEL_KINDS = {'keras': '.h5', 'forest': '.npz', 'xgboost': '.npz'}
+DEFAULT_PARAMS = {
+    'epochs': 5,
+    'batch_size': 32,
+    'trees': 100,
+    'seed': 42,
+    'threads': 1,
+}
+
+
+def build_model(input_dim):
+    """Build the feed-forward stress classifier (also used by app.py for full retraining)"""
+    import tensorflow as tf
+    model = tf.keras.models.Sequential([
+        tf.keras.layers.Input(shape=(input_dim,)),
+        tf.keras.layers.Dense(64, activation='relu'),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Dense(32, activation='relu'),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Dropout(0.3),
+        tf.keras.layers.Dense(1, activation='sigmoid')
+    ])
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def _fit(kind, X, y, params):
+    """Train one model on scaled features"""
+    if kind == 'keras':
+        import tensorflow as tf
+        try:
+            # Several folds share the machine; only possible before TF starts its runtime
+            tf.config.threading.set_intra_op_parallelism_threads(params['threads'])
+            tf.config.threading.set_inter_op_parallelism_threads(params['threads'])
+        except RuntimeError:
+            pass
+        tf.keras.utils.set_random_seed(params['seed'])
+        model = build_model(X.shape[1])
+        model.fit(X, y.astype(np.float32), epochs=params['epochs'], batch_size=params['batch_size'], verbose=0)
+        return model
+    if kind == 'forest':
+        from sklearn.ensemble import RandomForestClassifier
+        model = RandomForestClassifier(n_estimators=params['trees'], n_jobs=params['threads'],
+                                       random_state=params['seed'])
+    else:
+        from xgboost import XGBClassifier
+        model = XGBClassifier(n_estimators=params['trees'], eval_metric='logloss', n_jobs=params['threads'],
+                              random_state=params['seed'])
+    return model.fit(X, y)
+
+
+def _stress_probability(kind, model, X):
+    if kind == 'keras':
+        return model.predict(X, batch_size=4096, verbose=0)[:, 0]
+    return model.predict_proba(X)[:, list(model.classes_).index(1)]
+
+
+def _stack(per_subject, subjects):
+    X = np.concatenate([per_subject[s][0] for s in subjects])
+    y = np.concatenate([per_subject[s][1] for s in subjects])
+    return X, y
+
+
+def evaluate(y_true, scores, threshold=0.5):
+    """Accuracy plus precision/recall/F1 of the stressed class"""
+    y_true = np.asarray(y_true).astype(bool)
+    y_pred = np.asarray(scores) > threshold
+    tp = int(np.count_nonzero(y_pred & y_true))
+    fp = int(np.count_nonzero(y_pred & ~y_true))
+    fn = int(np.count_nonzero(~y_pred & y_true))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        'samples': int(y_true.size),
+        'accuracy': float(np.mean(y_pred == y_true)) if y_true.size else 0.0,
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    }
+
+
+def run_fold(cache_dir, train_subjects, test_subject, kind, params):
+    """Train without ``test_subject`` and score it; returns (test_subject, metrics)"""
+    started = time.perf_counter()
+    per_subject = dataset_cache.load_cache(cache_dir, train_subjects + [test_subject])
+    X_train, y_train = _stack(per_subject, train_subjects)
+    # The scaler is fit on the training subjects only, like the served one
+    snapshot = ScalerSnapshot.from_stats(RunningStats.from_array(X_train))
+    model = _fit(kind, snapshot.scale(X_train), y_train, params)
+
+    X_test, y_test = per_subject[test_subject]
+    metrics = evaluate(y_test, _stress_probability(kind, model, snapshot.scale(X_test)))
+    metrics['seconds'] = round(time.perf_counter() - started, 1)
+    return test_subject, metrics
+
+
+def fit_final(cache_dir, subjects, kind, params, output_path):
+    """Train on every subject and write the model plus its scaler state for app.py"""
+    started = time.perf_counter()
+    X, y = _stack(dataset_cache.load_cache(cache_dir, subjects), subjects)
+    snapshot = ScalerSnapshot.from_stats(RunningStats.from_array(X))
+    model = _fit(kind, snapshot.scale(X), y, params)
+
+    if kind == 'keras':
+        model.save(output_path)
+    else:
+        from tree_model import TreeEnsemble
+        TreeEnsemble.convert(model).save(output_path)
+    # Written last: app.py treats the scaler file's mtime as the model version
+    scaler_path = publish_for_model(output_path, snapshot)
+    return {
+        'model': output_path,
+        'scaler': scaler_path,
+        'samples': int(X.shape[0]),
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+def _summarize(folds):
+    summary = {}
+    for key in ('accuracy', 'precision', 'recall', 'f1'):
+        values = np.array([metrics[key] for metrics in folds.values()])
+        summary[key] = {'mean': float(values.mean()), 'std': float(values.std())}
+    return summary
+
+
+def run_pipeline(cache_dir, output_path, kind='keras', subjects=None, workers=1, cross_validate=True, **params):
+    """Leave-one-subject-out cross-validation plus the final model, in parallel.
+
+    Every fold and the final fit are independent jobs that load the cached
+    subjects memory-mapped, so up to ``workers`` of them run at once, each
+    with an equal share of the CPU threads. Returns the report, which is
+    also written next to the model as ``<model>.cv.json``.
+    """
+    if kind not in MODEL_KINDS:
+        raise ValueError(f"Unknown model kind '{kind}' (expected one of {', '.join(MODEL_KINDS)})")
+    if not output_path.endswith(MODEL_KINDS[kind]):
+        raise ValueError(f"A {kind} model is saved as {MODEL_KINDS[kind]}")
+    manifest = dataset_cache.read_manifest(cache_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No dataset cache manifest in {cache_dir}")
+    subjects = sorted(s for s in manifest['subjects'] if not subjects or s in subjects)
+    if len(subjects) < 2 and cross_validate:
+        raise ValueError("Leave-one-subject-out needs at least two subjects")
+
+    workers = max(1, workers)
+    params = dict(DEFAULT_PARAMS, **params)
+    params['threads'] = max(1, (os.cpu_count() or 1) // workers)
+
+    jobs = {('final', None): (fit_final, cache_dir, subjects, kind, params, output_path)}
+    if cross_validate:
+        for test_subject in subjects:
+            train_subjects = [s for s in subjects if s != test_subject]
+            jobs[('fold', test_subject)] = (run_fold, cache_dir, train_subjects, test_subject, kind, params)
+
+    started = time.perf_counter()
+    report = {'model_kind': kind, 'subjects': subjects, 'params': params, 'folds': {}}
+
+    def record(job, result):
+        if job[0] == 'final':
+            report['final'] = result
+            logger.info(f"Final model trained on {result['samples']} samples in {result['seconds']}s")
+        else:
+            subject, metrics = result
+            report['folds'][subject] = metrics
+            logger.info(f"Fold {subject}: accuracy {metrics['accuracy']:.3f}, F1 {metrics['f1']:.3f} "
+                        f"({metrics['seconds']}s)")
+
+    if workers == 1:
+        for job, (fn, *args) in jobs.items():
+            record(job, fn(*args))
+    else:
+        # spawn: TensorFlow and forked processes don't mix
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {executor.submit(fn, *args): job for job, (fn, *args) in jobs.items()}
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+
+    report['folds'] = dict(sorted(report['folds'].items()))
+    if report['folds']:
+        report['summary'] = _summarize(report['folds'])
+    report['seconds'] = round(time.perf_counter() - started, 1)
+    with open(os.path.splitext(output_path)[0] + '.cv.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a stress model with leave-one-subject-out cross-validation")
+    parser.add_argument('cache_dir', help="Dataset cache directory (see dataset_cache.py)")
+    parser.add_argument('-o', '--output', required=True, help="Model file: .h5 for keras, .npz for forest/xgboost")
+    parser.add_argument('--model', choices=list(MODEL_KINDS), default='keras')
+    parser.add_argument('--wesad-root', help="Refresh the cache from the raw WESAD dataset first")
+    parser.add_argument('--subjects', nargs='*', help="Subjects to use (default: all cached)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Parallel preprocessing and training processes (default: one per CPU)")
+    parser.add_argument('--no-cv', action='store_true', help="Only train the final model")
+    parser.add_argument('--epochs', type=int, default=DEFAULT_PARAMS['epochs'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_PARAMS['batch_size'])
+    parser.add_argument('--trees', type=int, default=DEFAULT_PARAMS['trees'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_PARAMS['seed'])
+    args = parser.parse_args()
+
+    if args.wesad_root:
+        dataset_cache.build_cache(args.wesad_root, args.cache_dir, args.subjects, workers=args.workers)
+
+    report = run_pipeline(
+        args.cache_dir, args.output, args.model, args.subjects, args.workers, not args.no_cv,
+        epochs=args.epochs, batch_size=args.batch_size, trees=args.trees, seed=args.seed
+    )
+    for key, value in report.get('summary', {}).items():
+        print(f"{key:>9}: {value['mean']:.3f} ± {value['std']:.3f}")
+    print(f"Saved {report['final']['model']} and {report['final']['scaler']} in {report['seconds']}s")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
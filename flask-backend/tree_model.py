@@ -0,0 +1,292 @@
+import os
+import json
+import pickle
+import argparse
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# How leaf values of all trees combine into P(stressed)
+AGGREGATIONS = ('mean', 'logistic')
+
+
+def _floor_float32(thresholds):
+    """Largest float32 <= each threshold, so ``x <= t`` keeps its result for float32 x"""
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    rounded = thresholds.astype(np.float32)
+    too_high = rounded.astype(np.float64) > thresholds
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def _sibling_order(left, right):
+    """Renumber one tree breadth-first so that every right child follows its left sibling.
+
+    Returns (order, first_child): old node ids in new order, and each new
+    node's left child in new numbering (-1 for leaves).
+    """
+    order, first_child = [0], []
+    for node in order:
+        if left[node] == -1:
+            first_child.append(-1)
+        else:
+            first_child.append(len(order))
+            order.extend((left[node], right[node]))
+    return np.asarray(order), np.asarray(first_child)
+
+
+class TreeEnsemble:
+    """Random forest / gradient-boosted trees evaluated with NumPy.
+
+    Every tree is stored in a few flat arrays shared by the whole ensemble:
+    split feature, threshold, first child, leaf value and the side taken by
+    missing values. Siblings are adjacent, so the next node is
+    ``child[node] + (x > threshold)``, and leaves are their own child with
+    an infinite threshold. A batch is scored by advancing the node indices
+    of every (row, tree) pair one level at a time until all of them sit on
+    a leaf, dropping finished pairs once enough have accumulated; there is
+    no per-row or per-tree Python loop.
+
+    'mean' ensembles (random forests) average the per-tree probability of
+    the positive class; 'logistic' ensembles (XGBoost) add the leaf margins
+    to ``base_margin`` and apply a sigmoid. ``predict`` returns P(stressed)
+    as an (n, 1) array, like the Keras model.
+    """
+
+    def __init__(self, feature, threshold, child, value, default_left, roots, aggregation='mean',
+                 base_margin=0.0, source=None):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation: {aggregation}")
+        self.feature = self._frozen(feature, np.int32)
+        self.threshold = self._frozen(threshold, np.float32)
+        self.child = self._frozen(child, np.int32)
+        self.value = self._frozen(value, np.float32)
+        self.default_left = self._frozen(default_left, bool)
+        self.roots = self._frozen(roots, np.int32)
+        self.is_leaf = self._frozen(self.child == np.arange(len(self.child)), bool)
+        self.aggregation = aggregation
+        self.base_margin = float(base_margin)
+        self.source = source
+
+    @staticmethod
+    def _frozen(array, dtype):
+        array = np.array(array, dtype=dtype)
+        array.setflags(write=False)
+        return array
+
+    @classmethod
+    def _from_trees(cls, trees, **kwargs):
+        """Build from per-tree (left, right, feature, threshold, value, default_left) arrays.
+
+        Nodes are numbered from 0 within each tree, -1 marks a leaf, and
+        ``threshold`` must already mean "go left if x <= threshold".
+        """
+        columns = [[] for _ in range(5)]
+        roots, offset = [], 0
+        for left, right, feature, threshold, value, default_left in trees:
+            order, child = _sibling_order(np.asarray(left), np.asarray(right))
+            leaf = child == -1
+            roots.append(offset)
+            nodes = np.arange(len(order)) + offset
+            columns[0].append(np.where(leaf, 0, np.asarray(feature)[order]))
+            columns[1].append(np.where(leaf, np.inf, np.asarray(threshold)[order]).astype(np.float32))
+            columns[2].append(np.where(leaf, nodes, child + offset))
+            columns[3].append(np.where(leaf, np.asarray(value)[order], 0.0))
+            columns[4].append(np.asarray(default_left, dtype=bool)[order] | leaf)
+            offset += len(order)
+        if not roots:
+            raise ValueError("Ensemble has no trees")
+        feature, threshold, child, value, default_left = (np.concatenate(c) for c in columns)
+        return cls(feature, threshold, child, value, default_left, roots, **kwargs)
+
+    @classmethod
+    def from_sklearn(cls, model, positive_class=1):
+        """Convert a fitted RandomForest/ExtraTrees/DecisionTree classifier"""
+        classes = list(model.classes_)
+        if len(classes) != 2:
+            raise ValueError(f"Expected a binary classifier, got classes {classes}")
+        positive = classes.index(positive_class) if positive_class in classes else 1
+        trees = []
+        for estimator in getattr(model, 'estimators_', [model]):
+            tree = estimator.tree_
+            counts = tree.value[:, 0, :]
+            # Leaf probabilities, whether sklearn stored counts or fractions
+            value = counts[:, positive] / np.maximum(counts.sum(axis=1), 1e-12)
+            missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool))
+            trees.append((tree.children_left, tree.children_right, tree.feature,
+                          _floor_float32(tree.threshold), value, missing_left))
+        return cls._from_trees(trees, aggregation='mean', source=type(model).__name__)
+
+    @classmethod
+    def from_xgboost_json(cls, doc):
+        """Convert a parsed XGBoost JSON model (Booster.save_model('model.json'))"""
+        learner = doc['learner']
+        objective = learner['objective']['name']
+        if objective not in ('binary:logistic', 'reg:logistic'):
+            raise ValueError(f"Unsupported XGBoost objective: {objective}")
+        booster = learner['gradient_booster']
+        if booster['name'] != 'gbtree':
+            raise ValueError(f"Unsupported XGBoost booster: {booster['name']}")
+        # Stored as a probability; newer versions write it as a one-element vector
+        base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+        base_score = min(max(base_score, 1e-7), 1 - 1e-7)
+
+        trees = []
+        for tree in booster['model']['trees']:
+            if any(tree.get('split_type', [])):
+                raise ValueError("Categorical XGBoost splits are not supported")
+            left = np.asarray(tree['left_children'])
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            # XGBoost goes left if x < condition, i.e. x <= the next float32 below it
+            threshold = np.nextafter(conditions, np.float32(-np.inf))
+            trees.append((left, tree['right_children'], tree['split_indices'], threshold,
+                          conditions, tree['default_left']))
+        return cls._from_trees(trees, aggregation='logistic', base_margin=np.log(base_score / (1 - base_score)),
+                               source='XGBoost')
+
+    @classmethod
+    def from_xgboost(cls, model):
+        """Convert an XGBClassifier or Booster (needs xgboost, only at conversion time)"""
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        return cls.from_xgboost_json(json.loads(bytes(booster.save_raw(raw_format='json'))))
+
+    @classmethod
+    def convert(cls, model):
+        """Convert any supported fitted model"""
+        if hasattr(model, 'get_booster') or type(model).__name__ == 'Booster':
+            return cls.from_xgboost(model)
+        if hasattr(model, 'estimators_') or hasattr(model, 'tree_'):
+            return cls.from_sklearn(model)
+        raise ValueError(f"Unsupported model type: {type(model).__name__}")
+
+    @property
+    def depth(self):
+        depth, level = 0, self.roots[~self.is_leaf[self.roots]]
+        while level.size:
+            depth += 1
+            level = np.concatenate([self.child[level], self.child[level] + 1])
+            level = level[~self.is_leaf[level]]
+        return depth
+
+    def save(self, path):
+        """Save as .npz (a JSON spec plus the flat node arrays)"""
+        spec = {'aggregation': self.aggregation, 'base_margin': self.base_margin, 'source': self.source}
+        np.savez(
+            path, tree_spec=np.array(json.dumps(spec)), feature=self.feature, threshold=self.threshold,
+            child=self.child, value=self.value, default_left=self.default_left, roots=self.roots
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            spec = json.loads(str(data['tree_spec']))
+            return cls(
+                data['feature'], data['threshold'], data['child'], data['value'], data['default_left'],
+                data['roots'], spec['aggregation'], spec['base_margin'], spec.get('source')
+            )
+
+    def predict(self, X, verbose=0):
+        """Keras-compatible predict: (n, features) -> (n, 1) P(stressed)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_trees = X.shape[0], len(self.roots)
+        flat_X = X.ravel()
+        has_missing = bool(np.isnan(flat_X).any())
+        leaf_of = np.empty(n_rows * n_trees, dtype=np.int32)
+        # Pairs still walking: position in leaf_of, current node, offset of the row in flat_X
+        pair = np.arange(n_rows * n_trees)
+        node = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows) * X.shape[1], n_trees)
+        take = np.take
+        while True:
+            done = take(self.is_leaf, node)
+            finished = np.count_nonzero(done)
+            if finished * 4 >= len(node):
+                # Leaves loop onto themselves, so finished pairs only need
+                # to be dropped once they make up a good part of the work
+                leaf_of[pair[done]] = node[done]
+                walking = ~done
+                pair, node, row_offset = pair[walking], node[walking], row_offset[walking]
+                if not pair.size:
+                    break
+            x = take(flat_X, row_offset + take(self.feature, node))
+            go_right = x > take(self.threshold, node)
+            if has_missing:
+                go_right |= np.isnan(x) & ~take(self.default_left, node)
+            node = take(self.child, node) + go_right
+
+        leaves = np.take(self.value, leaf_of).reshape(n_rows, n_trees)
+        if self.aggregation == 'mean':
+            score = leaves.mean(axis=1)
+        else:
+            margin = leaves.sum(axis=1, dtype=np.float64) + self.base_margin
+            score = 0.5 * np.tanh(0.5 * margin) + 0.5
+        return score.astype(np.float32)[:, None]
+
+    def summary(self, print_fn=print):
+        print_fn(f"{self.source or 'tree ensemble'}: {len(self.roots)} trees, {len(self.child)} nodes, "
+                 f"depth {self.depth} ({self.aggregation})")
+
+
+def is_tree_file(path):
+    """True if ``path`` is an ensemble saved by TreeEnsemble.save"""
+    if not path.endswith('.npz') or not os.path.exists(path):
+        return False
+    with np.load(path) as data:
+        return 'tree_spec' in data.files
+
+
+def _load_source(path):
+    """Fitted model from a pickle/joblib file or an XGBoost JSON model file"""
+    if path.endswith('.json'):
+        with open(path) as f:
+            return json.load(f)
+    try:
+        import joblib
+        return joblib.load(path)
+    except ImportError:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def _write_scaler(scaler_path, output_path):
+    """Publish a fitted StandardScaler's statistics next to the converted model"""
+    from streaming_scaler import ScalerSnapshot, publish_for_model
+
+    fitted = _load_source(scaler_path)
+    count = int(np.max(getattr(fitted, 'n_samples_seen_', 0)))
+    return publish_for_model(output_path, ScalerSnapshot(fitted.mean_.tolist(), fitted.scale_.tolist(), count=count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a trained tree ensemble into a TreeEnsemble .npz")
+    parser.add_argument('model', help="Pickled/joblib RandomForest or XGBClassifier, or an XGBoost .json model")
+    parser.add_argument('-o', '--output', required=True, help="Output .npz (e.g. stress_trees.npz)")
+    parser.add_argument('--scaler', help="Pickled StandardScaler the model was trained with")
+    parser.add_argument('--verify-rows', type=int, default=10000,
+                        help="Random rows to compare against the original model's predict_proba")
+    args = parser.parse_args()
+
+    source = _load_source(args.model)
+    ensemble = TreeEnsemble.from_xgboost_json(source) if isinstance(source, dict) else TreeEnsemble.convert(source)
+    if not args.output.endswith('.npz'):
+        parser.error("output must be a .npz file")
+    ensemble.save(args.output)
+    ensemble.summary(print_fn=logger.info)
+    logger.info(f"Saved {args.output} ({os.path.getsize(args.output)} bytes)")
+
+    if hasattr(source, 'predict_proba') and args.verify_rows:
+        classes = list(source.classes_)
+        X = np.random.default_rng(0).standard_normal((args.verify_rows, source.n_features_in_), dtype=np.float32)
+        expected = source.predict_proba(X)[:, classes.index(1) if 1 in classes else 1]
+        error = np.abs(ensemble.predict(X)[:, 0] - expected).max()
+        logger.info(f"Max |P| difference from the original on {args.verify_rows} rows: {error:.2e}")
+
+    if args.scaler:
+        logger.info(f"Wrote scaler statistics to {_write_scaler(args.scaler, args.output)}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()